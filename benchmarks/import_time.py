@@ -0,0 +1,115 @@
+"""
+Import-time benchmark of the Command-Line Interface.
+
+Measures the cold-start time of the CLI entry point in fresh interpreters and guards it against regressions:
+exits with a non-zero status if the median time exceeds the budget or if any GUI module (Kivy, tkinter, psutil)
+gets imported on the CLI path.
+
+Run from the root of the repository:
+
+    python -m benchmarks.import_time [--runs 5] [--budget 1.0] [--breakdown]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GUI_MODULES = ('kivy', 'tkinter', 'psutil')
+
+# imports everything the CLI needs up to parsing the arguments, then reports the time taken and the GUI modules loaded
+PROBE = "\n".join([
+    "import sys, time",
+    "start = time.perf_counter()",
+    "from src.__main__ import cli_main",
+    "elapsed = time.perf_counter() - start",
+    f"gui = sorted({{m.split('.')[0] for m in sys.modules}} & set({GUI_MODULES!r}))",
+    "print(elapsed, ','.join(gui))",
+])
+
+
+def measure(runs: int):
+    """
+    Imports the CLI entry point in the given number of fresh interpreters.
+
+    :param runs: number of interpreters to start
+    :return: list of import times in seconds and the set of GUI modules imported
+    """
+    times = []
+    gui = set()
+
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', PROBE],
+                             cwd=ROOT,
+                             capture_output=True,
+                             text=True,
+                             check=True).stdout.split()
+
+        times.append(float(out[0]))
+
+        if len(out) > 1:
+            gui.update(out[1].split(','))
+
+    return times, gui
+
+
+def breakdown(top: int = 15):
+    """
+    Prints the modules, which take the most time to import on the CLI path (python -X importtime).
+
+    :param top: number of modules to print
+    """
+    err = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'from src.__main__ import cli_main'],
+                         cwd=ROOT,
+                         capture_output=True,
+                         text=True,
+                         check=True).stderr
+
+    rows = []
+
+    for line in err.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = (x.strip() for x in line[len('import time:'):].split('|'))
+        rows.append((int(cumulative), name))
+
+    for cumulative, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:10.1f} ms  {name}")
+
+
+def main():
+    p = argparse.ArgumentParser(description='Import-time benchmark of the CLI entry point.')
+    p.add_argument('--runs', type=int, default=5, help='Number of fresh interpreters to measure. Defaults to 5.')
+    p.add_argument('--budget', type=float, default=1.0,
+                   help='Maximum median import time in seconds. Defaults to 1.0.')
+    p.add_argument('--breakdown', action='store_true', help='Print the slowest imports as well.')
+    args = p.parse_args()
+
+    times, gui = measure(args.runs)
+    median = statistics.median(times)
+
+    print(f"CLI import time: median {median * 1000:.1f} ms, min {min(times) * 1000:.1f} ms, "
+          f"max {max(times) * 1000:.1f} ms over {args.runs} runs (budget {args.budget * 1000:.0f} ms)")
+
+    if args.breakdown:
+        breakdown()
+
+    failed = False
+
+    if gui:
+        print(f"FAIL: GUI modules imported on the CLI path: {', '.join(sorted(gui))}")
+        failed = True
+
+    if median > args.budget:
+        print("FAIL: CLI import time is over the budget")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+Throughput benchmark of the program on synthetic Roboworm plates.
+
+Generates a plate (see benchmarks.synthetic) and times the stages of every output separately:
+
+    - grid: reading the files, compositing the grids (ImageGrouper.grid), encoding them (export_image)
+    - MP4 and GIF: reading the frames, encoding the animations (ImageGrouper.animation)
+
+followed by a complete run of setup.fetch_files / setup.fetch_dirs with the given options. Throughput is reported in
+images per second, together with the peak resident memory of the benchmark and of its worker processes.
+
+Run from the root of the repository:
+
+    python -m benchmarks.run [--wells 24] [--sites 4] [--timepoints 10] [--size 1024 1024] [--bit-depth 16] [--jobs 4]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from functools import partial
+
+import src.model.image_grouper as model
+import src.model.setup as setup
+from benchmarks.synthetic import make_plate
+from src.model.catalog import PlateCatalog
+from src.model.frames import SCALES, read_image
+from src.model.profiling import peak_rss
+
+
+class Timer:
+    """
+    Accumulates the time spent in a stage over many calls.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.seconds += time.perf_counter() - self.start
+
+
+def bench_grid(plate: str,
+               outdir: str,
+               dim: tuple,
+               read) -> list:
+    """
+    Times reading, compositing and encoding of the grids of a plate, one group at a time.
+
+    :param plate: grid plate folder
+    :param outdir: directory to write the grids into
+    :param dim: (columns, rows) of the grid
+    :param read: function that reads a single file
+    :return: rows of the results table
+    """
+    groups = setup.group_files(PlateCatalog(plate).files)
+    timers = {stage: Timer() for stage in ('read', 'composite', 'encode')}
+    images = 0
+
+    for name, group in groups:
+        with timers['read']:
+            temp = [read(os.path.join(plate, file)) for file in group]
+
+        images += len(temp)
+        ig = model.ImageGrouper(temp[:dim[0] * dim[1]])
+
+        with timers['composite']:
+            exported = ig.grid(size_x=dim[0], size_y=dim[1])
+
+        if exported:
+            with timers['encode']:
+                ig.export_image(filename=os.path.join(outdir, name))
+
+    return [('grid', stage, timer.seconds, images) for stage, timer in timers.items()]
+
+
+def bench_animation(plate: str,
+                    outdir: str,
+                    gif: bool,
+                    framerate: int,
+                    read) -> list:
+    """
+    Times reading and encoding of the animations of a plate, one file at a time.
+
+    :param plate: stack plate folder
+    :param outdir: directory to write the animations into
+    :param gif: if True, encodes GIFs, MP4s otherwise
+    :param framerate: framerate of the animations
+    :param read: function that reads a single frame
+    :return: rows of the results table
+    """
+    catalog = PlateCatalog(plate)
+    timers = {stage: Timer() for stage in ('read', 'encode')}
+    images = 0
+
+    for f in catalog.filenames:
+        with timers['read']:
+            temp = [read(frame) for frame in catalog.frames(f)]
+
+        images += len(temp)
+
+        with timers['encode']:
+            model.ImageGrouper(temp).animation(framerate=framerate,
+                                               gif=gif,
+                                               filename=os.path.join(outdir, f"{f[:-4]}_stack"))
+
+    output = 'gif' if gif else 'mp4'
+
+    return [(output, stage, timer.seconds, images) for stage, timer in timers.items()]
+
+
+def bench_end_to_end(output: str,
+                     run,
+                     total: int) -> tuple:
+    """
+    Times a complete run of one of the setup generators.
+
+    :param output: name of the output
+    :param run: the generator to exhaust
+    :param total: number of images processed by the run
+    :return: row of the results table
+    """
+    start = time.perf_counter()
+
+    for _ in run:
+        pass
+
+    return output, 'end-to-end', time.perf_counter() - start, total
+
+
+def main():
+    p = argparse.ArgumentParser(description='Throughput benchmark on synthetic Roboworm plates.')
+    p.add_argument('--wells', type=int, default=24, help='Number of wells. Defaults to 24.')
+    p.add_argument('--sites', type=int, default=4, help='Number of sites per well of the grid plate. Defaults to 4.')
+    p.add_argument('--timepoints', type=int, default=10,
+                   help='Number of timepoints of the stack plate. Defaults to 10.')
+    p.add_argument('--size', type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'), default=(512, 512),
+                   help='Resolution of the images. Defaults to 512 512.')
+    p.add_argument('--bit-depth', type=int, choices=(8, 16), default=16,
+                   help='Bit depth of the images. Defaults to 16.')
+    p.add_argument('--jobs', type=int, default=1, help='Number of worker processes of the end-to-end runs.')
+    p.add_argument('--scale', choices=SCALES, default='1', help='Fraction of the resolution to read the images at.')
+    p.add_argument('--native', action='store_true', help='Keep the native channels and bit depth of the images.')
+    p.add_argument('--framerate', type=int, default=7, help='Framerate of the animations. Defaults to 7.')
+    p.add_argument('--workdir', help='Directory for the plates and outputs, a temporary one by default.')
+    p.add_argument('--json', metavar='FILE', help='Also write the results into a JSON file.')
+    args = p.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='roboworm-bench-')
+    os.makedirs(workdir, exist_ok=True)
+
+    try:
+        plates = {}
+
+        for mode in ('grid', 'stack'):
+            start = time.perf_counter()
+            plates[mode] = make_plate(os.path.join(workdir, 'plates'),
+                                      mode=mode,
+                                      wells=args.wells,
+                                      sites=args.sites if mode == 'grid' else 1,
+                                      timepoints=args.timepoints,
+                                      size=tuple(args.size),
+                                      bit_depth=args.bit_depth)
+            print(f"Generated {mode} plate in {time.perf_counter() - start:.1f} s: {plates[mode]}")
+
+        outdir = os.path.join(workdir, 'out')
+        os.makedirs(outdir, exist_ok=True)
+
+        scale = SCALES[args.scale]
+        read = partial(read_image, scale=scale, native=args.native)
+        columns = max(1, int(args.sites ** 0.5))
+        dim = (columns, args.sites // columns)
+        frames = args.wells * args.timepoints
+
+        rows = bench_grid(plates['grid'], outdir, dim, read)
+        rows += bench_animation(plates['stack'], outdir, False, args.framerate, read)
+        rows += bench_animation(plates['stack'], outdir, True, args.framerate, read)
+
+        rows.append(bench_end_to_end('grid',
+                                     setup.fetch_files(plates['grid'], outdir, dim[0], dim[1],
+                                                       jobs=args.jobs, scale=scale, native=args.native),
+                                     args.wells * args.sites))
+
+        for gif in (False, True):
+            rows.append(bench_end_to_end('gif' if gif else 'mp4',
+                                         setup.fetch_dirs(plates['stack'], outdir, gif=gif, framerate=args.framerate,
+                                                          jobs=args.jobs, scale=scale, native=args.native),
+                                         frames))
+
+        rss, children = peak_rss()
+
+        print()
+        print(f"{'output':<8}{'stage':<12}{'seconds':>10}{'images':>10}{'images/s':>12}")
+
+        for output, stage, seconds, images in rows:
+            print(f"{output:<8}{stage:<12}{seconds:>10.3f}{images:>10}{images / seconds if seconds else 0:>12.1f}")
+
+        print()
+        print(f"Peak RSS: {rss:.1f} MiB (benchmark), {children:.1f} MiB (largest worker process)")
+
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'args': vars(args),
+                           'results': [dict(zip(('output', 'stage', 'seconds', 'images'), row)) for row in rows],
+                           'peak_rss_mib': rss,
+                           'peak_rss_children_mib': children}, f, indent=2)
+
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Generator of synthetic Roboworm plates.
+
+Writes plates in the exact layout the program expects from the Roboworm platform, so that the throughput of the
+program can be measured on data of a real size:
+
+    - grid plates: <Prefix>-XXXX_A01_s1.TIF ... files and a <Prefix>-XXXX.HTD plate descriptor in a single folder
+    - stack plates: Timepoint_1 ... Timepoint_N folders of <Prefix>-XXXX_A01.TIF files (or _A01_s1.TIF with several
+      sites) next to the .HTD descriptor
+
+Images are 8 or 16-bit grayscale: a noisy background with a few bright worms, which move between the timepoints.
+
+Run from the root of the repository:
+
+    python -m benchmarks.synthetic <outdir> [--mode grid] [--wells 96] [--sites 4] [--timepoints 10] [--size 1024 1024]
+"""
+
+import argparse
+import os
+
+import cv2
+import numpy as np
+
+ROWS = 'ABCDEFGHIJKLMNOP'  # rows of a 384-well plate
+COLUMNS = 24
+
+
+def well_names(wells: int) -> list:
+    """
+    Names of the first wells of a 384-well plate, in row-major order (A01, A02, ... A24, B01, ...).
+
+    :param wells: number of wells
+    """
+    return [f"{ROWS[i // COLUMNS]}{i % COLUMNS + 1:02d}" for i in range(wells)]
+
+
+def htd(wells: int,
+        sites: int,
+        timepoints: int,
+        description: str = 'Synthetic plate') -> str:
+    """
+    Contents of the .HTD plate descriptor of a plate.
+
+    :param wells: number of wells selected, in row-major order
+    :param sites: number of sites per well
+    :param timepoints: number of timepoints
+    :param description: description of the plate
+    """
+    x_sites = int(np.ceil(np.sqrt(sites)))
+    y_sites = int(np.ceil(sites / x_sites))
+    selected = set(well_names(wells))
+
+    lines = ['"HTSInfoFile", Version 1.0',
+             f'"Description", "{description}"',
+             f'"TimePoints", {timepoints}',
+             '"ZSeries", FALSE',
+             '"Sites", FALSE' if sites == 1 else '"Sites", TRUE',
+             f'"XWells", {COLUMNS}',
+             f'"YWells", {len(ROWS)}']
+
+    for r, row in enumerate(ROWS):
+        flags = ', '.join('TRUE' if f"{row}{c + 1:02d}" in selected else 'FALSE' for c in range(COLUMNS))
+        lines.append(f'"WellsSelection{r + 1}", {flags}')
+
+    lines += [f'"XSites", {x_sites}', f'"YSites", {y_sites}']
+
+    for r in range(y_sites):
+        flags = ', '.join('TRUE' if r * x_sites + c < sites else 'FALSE' for c in range(x_sites))
+        lines.append(f'"SiteSelection{r + 1}", {flags}')
+
+    lines += ['"Waves", FALSE', '"NWavelengths", 1', '"WaveName1", "Transmitted Light"', '"EndFile"']
+
+    return '\n'.join(lines) + '\n'
+
+
+def image(rng: np.random.Generator,
+          size: tuple,
+          bit_depth: int,
+          worms: np.ndarray,
+          t: int) -> np.ndarray:
+    """
+    Draws a single synthetic image.
+
+    :param rng: random generator
+    :param size: (width, height) of the image
+    :param bit_depth: 8 or 16
+    :param worms: (n, 4) array of the position and velocity of the worms in the image
+    :param t: timepoint to draw the worms at
+    """
+    width, height = size
+    top = (1 << bit_depth) - 1
+
+    img = rng.normal(0.2 * top, 0.02 * top, (height, width))
+
+    for x, y, dx, dy in worms:
+        cx, cy = int(x + dx * t) % width, int(y + dy * t) % height
+        cv2.ellipse(img, (cx, cy), (max(2, width // 40), max(1, height // 160)), (dx * 30 + t * 5) % 180, 0, 360,
+                    0.9 * top, -1)
+
+    return np.clip(img, 0, top).astype(np.uint8 if bit_depth == 8 else np.uint16)
+
+
+def make_plate(outdir: str,
+               mode: str = 'grid',
+               wells: int = 24,
+               sites: int = 4,
+               timepoints: int = 5,
+               size: tuple = (512, 512),
+               bit_depth: int = 16,
+               prefix: str = 'Phenotype',
+               seed: int = 0) -> str:
+    """
+    Writes a synthetic plate.
+
+    :param outdir: directory to write the plate folder into
+    :param mode: 'grid' or 'stack'
+    :param wells: number of wells
+    :param sites: number of sites per well (at most 9, the naming convention only supports a single digit)
+    :param timepoints: number of timepoints of a stack plate
+    :param size: (width, height) of the images
+    :param bit_depth: 8 or 16
+    :param prefix: prefix of the names of the files
+    :param seed: seed of the random generator
+    :return: path to the plate folder
+    """
+    rng = np.random.default_rng(seed)
+    name = f"{prefix}-{seed:04d}"
+    plate = os.path.join(outdir, f"{name}_{mode}")
+    os.makedirs(plate, exist_ok=True)
+
+    with open(os.path.join(plate, f"{name}.HTD"), 'w') as f:
+        f.write(htd(wells, sites, timepoints if mode == 'stack' else 1))
+
+    folders = [plate] if mode == 'grid' else [os.path.join(plate, f"Timepoint_{t + 1}") for t in range(timepoints)]
+
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+
+    for well in well_names(wells):
+        for s in range(1, sites + 1):
+            worms = rng.uniform(0, 1, (3, 4)) * (size[0], size[1], size[0] / 50, size[1] / 50)
+            filename = f"{name}_{well}_s{s}.TIF" if sites > 1 or mode == 'grid' else f"{name}_{well}.TIF"
+
+            for t, folder in enumerate(folders):
+                cv2.imwrite(os.path.join(folder, filename), image(rng, size, bit_depth, worms, t))
+
+    return plate
+
+
+def main():
+    p = argparse.ArgumentParser(description='Generator of synthetic Roboworm plates.')
+    p.add_argument('outdir', help='Directory to write the plate folder into.')
+    p.add_argument('--mode', choices=('grid', 'stack'), default='grid', help='Layout of the plate. Defaults to grid.')
+    p.add_argument('--wells', type=int, choices=range(1, 385), metavar="[1-384]", default=24,
+                   help='Number of wells. Defaults to 24.')
+    p.add_argument('--sites', type=int, choices=range(1, 10), metavar="[1-9]", default=4,
+                   help='Number of sites per well. Defaults to 4.')
+    p.add_argument('--timepoints', type=int, default=5, help='Number of timepoints of a stack. Defaults to 5.')
+    p.add_argument('--size', type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'), default=(512, 512),
+                   help='Resolution of the images. Defaults to 512 512.')
+    p.add_argument('--bit-depth', type=int, choices=(8, 16), default=16,
+                   help='Bit depth of the images. Defaults to 16.')
+    p.add_argument('--seed', type=int, default=0, help='Seed of the random generator. Defaults to 0.')
+    args = p.parse_args()
+
+    print(make_plate(args.outdir,
+                     mode=args.mode,
+                     wells=args.wells,
+                     sites=args.sites,
+                     timepoints=args.timepoints,
+                     size=tuple(args.size),
+                     bit_depth=args.bit_depth,
+                     seed=args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -14,7 +14,10 @@ The main outputs can be categorized into multiple groups:
 __author__ = 'Nika Karsanova'
 __email__ = 'vek2@aber.ac.uk'
 
+from multiprocessing import freeze_support
+
 from src.__main__ import cli_main
 
 if __name__ == '__main__':
+    freeze_support()  # required by the worker processes in a frozen (PyInstaller) executable
     cli_main()
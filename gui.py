@@ -11,7 +11,10 @@ The main outputs can be categorized into multiple groups:
 
 """
 
+from multiprocessing import freeze_support
+
 from src.__main__ import gui_main
 
 if __name__ == '__main__':
+    freeze_support()  # required by the worker processes in a frozen (PyInstaller) executable
     gui_main()
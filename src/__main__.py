@@ -15,13 +15,16 @@ __email__ = 'vek2@aber.ac.uk'
 import os
 import sys
 
-from kivy.resources import resource_add_path, resource_find
-
 import src.ui.cli.arg as arg
-from src.ui.gui import app
 
 
 def gui_main():
+    # GUI modules (Kivy, tkinter, psutil) are only imported once the GUI is started, so that the CLI starts quickly
+    # and runs on machines without a display
+    from kivy.resources import resource_add_path
+
+    from src.ui.gui import app
+
     if hasattr(sys, '_MEIPASS'):
         resource_add_path(os.path.join(sys._MEIPASS))
     app.run()
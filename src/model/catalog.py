@@ -0,0 +1,167 @@
+"""
+    This is the catalog module of the IBERS Image Merger program.
+    It scans an input path once with os.scandir and keeps everything the rest of the program needs to know about it:
+    whether it holds a grid or a stack, the image files or frame folders in it, and the exact number of files to process.
+    """
+
+import os
+import re
+
+import src.model.profiling as profiling
+from src.model.htd import PlateLayout
+
+EXTENSIONS = ('tif', 'png', 'jpg', 'htd')  # files accepted in the input paths
+
+
+def timepoint(d: str) -> int:
+    """
+    Number of a frame folder (e.g., 10 for Samples/Timepoint_10), which orders the folders as they were acquired.
+
+    :param d: frame folder
+    """
+    return int(re.search(r'\d+$', d).group())
+
+
+def is_image(name: str) -> bool:
+    """
+    Checks whether a file is one of the images to process, as opposed to thumbnails and plate descriptors.
+
+    :param name: name of the file
+    """
+    return 'thumb' not in name.lower() and 'htd' not in name.lower()
+
+
+class PlateCatalog:
+    """
+    Contents of an input path, scanned once.
+
+    :param path: input path
+    :param mode: True if the path is suitable for creation of grid images, False if it is suitable for creation of
+    stack images, None if it does not have valid contents
+    :param files: sorted names of the images of a grid path
+    :param dirs: frame folders of a stack path (e.g., Samples/Timepoint_1), in the order of their numbers (see
+    timepoint()), so that Timepoint_10 comes after Timepoint_9
+    :param index: index of the frames of a stack path, file name -> {frame folder: path to the frame}
+    :param htd: path to the .HTD plate descriptor, None if there is none
+    """
+
+    def __init__(self,
+                 path: str):
+        """
+        Function that scans the input path and initialises the PlateCatalog.
+
+        :param path: input path
+        """
+        self.path = path
+        self.mode: bool = None
+        self.files: list = []
+        self.dirs: list = []
+        self.index: dict = {}
+        self.htd: str = None
+        self._layout = False  # not read yet
+
+        with profiling.stage('scan', path):
+            self.scan(path)
+
+    def scan(self,
+             path: str):
+        """
+        Lists the input path and its frame folders, and sets the mode of the path.
+
+        :param path: input path
+        """
+        with os.scandir(path) as it:
+            entries = list(it)
+
+        dirs = [e for e in entries if e.is_dir()]
+        files = [e for e in entries if not e.is_dir()]
+
+        self.htd = next((e.path for e in files if e.name.lower().endswith('htd')), None)
+
+        # grid
+        if len(dirs) == 0 and all(e.name.lower().endswith(EXTENSIONS) for e in files):
+            self.mode = True
+            self.files = sorted(e.name for e in files if is_image(e.name))
+
+        # stack root, if dir names are of correct format
+        elif len(dirs) > 0 and len(files) == 1 and self.htd is not None and all(re.search(r'\d+$', e.name) for e in dirs):
+            self.dirs = sorted((e.path for e in dirs), key=lambda d: (timepoint(d), d))
+
+            if all(self.scan_frames(d) for d in self.dirs):
+                self.mode = False
+
+            else:
+                self.dirs, self.index = [], {}
+
+    def scan_frames(self,
+                    d: str) -> bool:
+        """
+        Adds the frames of a frame folder to the index.
+
+        :param d: frame folder
+        :return: False if the folder does not have valid contents
+        """
+        with os.scandir(d) as it:
+            entries = list(it)
+
+        if any(e.is_dir() for e in entries) or not all(e.name.lower().endswith(EXTENSIONS) for e in entries):
+            return False
+
+        for e in entries:
+            if is_image(e.name):
+                self.index.setdefault(e.name, {})[d] = e.path
+
+        return True
+
+    @property
+    def layout(self) -> PlateLayout:
+        """
+        Layout of the plate, read from its .HTD file on the first access. None if the path has no .HTD file or it does
+        not describe the wells of the plate.
+        """
+        if self._layout is False:
+            try:
+                self._layout = PlateLayout.from_file(self.htd) if self.htd is not None else None
+
+            except (OSError, ValueError, TypeError):  # unreadable or malformed descriptor
+                self._layout = None
+
+        return self._layout
+
+    @property
+    def filenames(self) -> list:
+        """
+        Names of the files of a stack path to make animations of, i.e. the files in the first frame folder.
+        """
+        return [f for f in sorted(self.index) if self.dirs[0] in self.index[f]] if self.dirs else []
+
+    def frames(self,
+               f: str) -> list:
+        """
+        Paths to the frames of a file of a stack path, in order.
+
+        :param f: name of the file
+        """
+        return [self.index[f][d] for d in self.dirs if d in self.index[f]]
+
+    def missing(self) -> dict:
+        """
+        Finds the files that are not present in every frame folder, i.e. the animations that would come out short.
+
+        :return: file name -> names of the frame folders the file is missing from
+        """
+        return {f: [os.path.basename(d) for d in self.dirs if d not in frames]
+                for f, frames in sorted(self.index.items()) if len(frames) != len(self.dirs)}
+
+    @property
+    def total_files(self) -> int:
+        """
+        Exact number of files to be processed, as counted by the setup generators.
+        """
+        if self.mode:
+            return len(self.files)
+
+        if self.mode is False:
+            return sum(len(self.index[f]) for f in self.filenames)
+
+        return 0
@@ -0,0 +1,150 @@
+"""
+    This is the encode module of the IBERS Image Merger program.
+    It is the library interface of the program: it merges images or animations out of NumPy arrays (or paths to the
+    files) and returns them encoded in memory, as bytes, or writes them into a given binary file object, so that they
+    can be sent on (e.g., to an object storage) without being written into a file and read back.
+
+    Arrays are expected in the order of channels of OpenCV (BGR or BGRA) or grayscale, of any bit depth the format
+    supports. The signatures of the functions of this module are stable: new parameters are only ever added at the end,
+    with defaults keeping the current behaviour.
+    """
+
+import io
+from functools import partial
+
+import numpy as np
+
+import src.model.image_grouper as model
+from src.model.encoder import DEFAULT_PRESET, Encoder
+from src.model.frames import read_image
+
+ANIMATION_FORMATS = ('gif', 'mp4')
+
+
+def load(files: list,
+         scale: int = 1,
+         native: bool = False):
+    """
+    Reads the files given as paths, one at a time, while arrays are passed through.
+
+    :param files: NumPy arrays or paths to the files
+    :param scale: factor (1, 2, 4 or 8) to reduce the resolution of the files given as paths by while reading them
+    :param native: if True, keeps the native channels and bit depth of the files given as paths
+    :return: yields the files as NumPy arrays
+    """
+    read = partial(read_image, scale=scale, native=native)
+
+    for f in files:
+        img = f if isinstance(f, np.ndarray) else read(str(f))
+
+        if img is None:
+            raise ValueError(f"Could not read the file {f}.")
+
+        yield img
+
+
+def deliver(data: bytes,
+            out=None):
+    """
+    Returns the encoded data, or writes it into a file object.
+
+    :param data: encoded data
+    :param out: binary file object to write the data into, if any
+    :return: the data if out is None, the number of bytes written otherwise
+    """
+    if out is None:
+        return data
+
+    out.write(data)
+
+    return len(data)
+
+
+def encode_image(img: np.ndarray,
+                 fmt: str = 'png',
+                 quality: int = None,
+                 out=None,
+                 preset: str = DEFAULT_PRESET):
+    """
+    Encodes a single image.
+
+    :param img: the image, a NumPy array
+    :param fmt: format of the image: png, jpeg (jpg) or webp
+    :param quality: quality (1-100) of the lossy formats (jpeg and webp), the default of OpenCV (or of the preset) if
+    None
+    :param out: binary file object to write the image into, instead of returning it
+    :param preset: preset of the encoder: fast, balanced or small (see encoder.PRESETS), fast by default as in the
+    command line, the defaults of OpenCV if None
+    :return: the encoded image as bytes, or the number of bytes written into out
+    """
+    return deliver(Encoder(fmt, preset, quality).encode(img), out)
+
+
+def encode_grid(files: list,
+                dim_x: int,
+                dim_y: int,
+                fmt: str = 'png',
+                background: tuple = (255, 255, 255),
+                gutter: int = 0,
+                quality: int = None,
+                scale: int = 1,
+                native: bool = False,
+                out=None,
+                preset: str = DEFAULT_PRESET):
+    """
+    Merges images into a grid and encodes it, as setup.process_grid() does into a file.
+
+    :param files: NumPy arrays or paths to the files to merge together, by rows
+    :param dim_x: columns
+    :param dim_y: rows
+    :param fmt: format of the image: png, jpeg (jpg) or webp
+    :param background: colour (BGR) of the gutters and padding of the grid
+    :param gutter: width of the gap between the files in the grid, in pixels
+    :param quality: quality (1-100) of the lossy formats, see encode_image()
+    :param scale: factor (1, 2, 4 or 8) to reduce the resolution of the files given as paths by while reading them
+    :param native: if True, keeps the native channels and bit depth of the files given as paths
+    :param out: binary file object to write the image into, instead of returning it
+    :param preset: preset of the encoder, see encode_image()
+    :return: the encoded grid as bytes, or the number of bytes written into out
+    """
+    ig = model.ImageGrouper(list(load(files[:dim_x * dim_y], scale, native)))
+
+    if not ig.grid(size_x=dim_x, size_y=dim_y, background=background, gutter=gutter):
+        raise ValueError(f"{len(files)} file(s) do not fill a grid of {dim_x} x {dim_y}.")
+
+    return encode_image(ig.merged_image, fmt=fmt, quality=quality, out=out, preset=preset)
+
+
+def encode_animation(frames: list,
+                     framerate: int = 7,
+                     fmt: str = 'gif',
+                     scale: int = 1,
+                     native: bool = False,
+                     out=None):
+    """
+    Encodes frames into an animation, one frame at a time (see image_grouper.AnimationWriter), so frames given as paths
+    are never all held in memory at once. Frames of a different size are padded (or cropped) to the size of the first.
+
+    :param frames: NumPy arrays or paths to the frames, in order
+    :param framerate: framerate of the animation
+    :param fmt: format of the animation: gif or mp4
+    :param scale: factor (1, 2, 4 or 8) to reduce the resolution of the frames given as paths by while reading them
+    :param native: if True, keeps the native channels and bit depth of the frames given as paths until they are encoded
+    :param out: binary file object to write the animation into, instead of returning it
+    :return: the encoded animation as bytes, or the number of bytes written into out
+    """
+    if fmt.lower() not in ANIMATION_FORMATS:
+        raise ValueError(f"Unknown animation format {fmt}, expected one of {', '.join(ANIMATION_FORMATS)}.")
+
+    buffer = io.BytesIO()
+    count = 0
+
+    with model.AnimationWriter(buffer, framerate=framerate, gif=fmt.lower() == 'gif') as writer:
+        for frame in load(frames, scale, native):
+            writer.write(frame)
+            count += 1
+
+    if not count:
+        raise ValueError("No frames to encode.")
+
+    return deliver(buffer.getvalue(), out)
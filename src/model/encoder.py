@@ -0,0 +1,139 @@
+"""
+    This is the encoder module of the IBERS Image Merger program.
+    It encodes the still outputs (the grids and the montage) in the format chosen by the user, with the parameters of
+    the codec taken from a named preset, which trades the time spent encoding against the size of the files.
+    """
+
+import cv2
+import numpy as np
+
+from src.model.frames import to_uint8
+
+# format -> (extension of the files, quality flag or None)
+FORMATS = {'png': ('png', None),
+           'jpeg': ('jpg', cv2.IMWRITE_JPEG_QUALITY),
+           'jpg': ('jpg', cv2.IMWRITE_JPEG_QUALITY),
+           'webp': ('webp', cv2.IMWRITE_WEBP_QUALITY)}
+
+# extension -> preset -> parameters passed to OpenCV
+PRESETS = {
+    'png': {
+        # the defaults of OpenCV, its fastest setting, which the outputs were always written with
+        'fast': [cv2.IMWRITE_PNG_STRATEGY, cv2.IMWRITE_PNG_STRATEGY_RLE],
+        # about a third smaller than fast, for about three times the time
+        'balanced': [cv2.IMWRITE_PNG_COMPRESSION, 3],
+        # the smallest files, but by far the slowest, for outputs kept for long
+        'small': [cv2.IMWRITE_PNG_COMPRESSION, 9],
+    },
+    'jpg': {
+        'fast': [cv2.IMWRITE_JPEG_QUALITY, 90],
+        # same quality, Huffman tables optimised for the image: smaller files, slower
+        'balanced': [cv2.IMWRITE_JPEG_QUALITY, 90, cv2.IMWRITE_JPEG_OPTIMIZE, 1],
+        'small': [cv2.IMWRITE_JPEG_QUALITY, 75, cv2.IMWRITE_JPEG_OPTIMIZE, 1],
+    },
+    'webp': {
+        # OpenCV only exposes the quality of WebP, which changes the time spent encoding little: the presets only
+        # trade the quality for the size of the files, from the largest (fast) to the smallest (small)
+        'fast': [cv2.IMWRITE_WEBP_QUALITY, 90],
+        'balanced': [cv2.IMWRITE_WEBP_QUALITY, 80],
+        'small': [cv2.IMWRITE_WEBP_QUALITY, 60],
+    },
+}
+
+DEFAULT_FORMAT = 'png'
+DEFAULT_PRESET = 'fast'
+
+
+class Encoder:
+    """
+    Format and preset of the still outputs. Instances are passed to the worker processes, so they only hold the
+    names of the format and the preset.
+
+    Only PNG stores more than 8 bits, so images of a higher bit depth are converted to 8 bits for JPEG and WebP
+    (see frames.to_uint8()).
+    """
+
+    def __init__(self,
+                 fmt: str = DEFAULT_FORMAT,
+                 preset: str = DEFAULT_PRESET,
+                 quality: int = None):
+        """
+        Function that initialises the Encoder.
+
+        :param fmt: format of the images: png, jpeg (jpg) or webp
+        :param preset: preset of the codec: fast, balanced or small; the defaults of OpenCV if None
+        :param quality: quality (1-100) of the lossy formats (jpeg and webp), overrides the quality of the preset
+        """
+        if fmt.lower() not in FORMATS:
+            raise ValueError(f"Unknown image format {fmt}, expected one of {', '.join(FORMATS)}.")
+
+        self.fmt = fmt.lower()
+        self.extension, self.flag = FORMATS[self.fmt]
+
+        if preset is not None and preset not in PRESETS[self.extension]:
+            raise ValueError(f"Unknown preset {preset}, expected one of {', '.join(PRESETS[self.extension])}.")
+
+        self.preset = preset
+        self.quality = quality
+
+    @property
+    def params(self) -> list:
+        """
+        Parameters passed to OpenCV.
+        """
+        params = list(PRESETS[self.extension][self.preset]) if self.preset is not None else []
+
+        if self.flag is not None and self.quality is not None:
+            if self.flag in params[::2]:
+                params[params.index(self.flag) + 1] = int(self.quality)
+
+            else:
+                params += [self.flag, int(self.quality)]
+
+        return params
+
+    @property
+    def signature(self) -> dict:
+        """
+        Parameters of the encoder to record into the manifest (see manifest.Manifest). Empty for the default format
+        and preset, so that the outputs recorded before the encoder could be chosen are still current.
+        """
+        if (self.fmt, self.preset, self.quality) == (DEFAULT_FORMAT, DEFAULT_PRESET, None):
+            return {}
+
+        return {'format': self.extension, 'preset': self.preset, 'quality': self.quality}
+
+    def encode(self,
+               img: np.ndarray) -> bytes:
+        """
+        Encodes an image.
+
+        :param img: the image, a NumPy array
+        :return: the encoded image
+        """
+        if self.extension != 'png':
+            img = to_uint8(img)
+
+        ok, buffer = cv2.imencode(f".{self.extension}", img, self.params)
+
+        if not ok:
+            raise ValueError(f"Could not encode an image of shape {img.shape} and type {img.dtype} as {self.fmt}.")
+
+        return buffer.tobytes()
+
+    def write(self,
+              img: np.ndarray,
+              filename: str) -> int:
+        """
+        Encodes an image into <filename>.<extension>.
+
+        :param img: the image, a NumPy array
+        :param filename: output filename, without the extension
+        :return: number of bytes written
+        """
+        data = self.encode(img)
+
+        with open(f"{filename}.{self.extension}", 'wb') as f:
+            f.write(data)
+
+        return len(data)
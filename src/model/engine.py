@@ -0,0 +1,246 @@
+"""
+    This is the engine module of the IBERS Image Merger program.
+    It runs the merging of whole directories in a pool of worker processes, one task per group of files (or per
+    animation), so that even a single large directory is spread across all the cores, and the work does not compete
+    with the user interface for the GIL. Progress is reported back over a queue, and the outstanding work can be
+    cancelled at any time.
+    """
+
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from functools import partial
+
+from src.model.catalog import PlateCatalog
+from src.model.frames import read_image
+from src.model.setup import grid_worker, plan_groups, stack_worker
+
+MAX_WORKERS_WINDOWS = 61  # limit of ProcessPoolExecutor on Windows
+
+
+class Engine:
+    """
+    Pool of worker processes, which directories are submitted to under a key of the caller's choice.
+
+    Every finished task is reported on the events queue as a (key, number of files, error) tuple, where the error is
+    the exception the task failed with, None if it succeeded. Once all the tasks of a directory are finished (or
+    cancelled), (key, None, None) is reported. Files of a directory, which do not belong to any task (e.g., files that
+    do not fit any group), are reported as soon as the directory is submitted.
+
+    The worker processes are spawned rather than forked, so that they do not inherit the state (e.g., threads, the
+    window) of the user interface.
+    """
+
+    def __init__(self,
+                 jobs: int = None):
+        """
+        Function that initialises the Engine. The worker processes are started with the first task submitted.
+
+        :param jobs: number of worker processes, the number of CPUs if None
+        """
+        jobs = jobs or os.cpu_count() or 1
+        self.jobs = min(jobs, MAX_WORKERS_WINDOWS) if sys.platform == 'win32' else jobs
+
+        self.pool = None
+        self.events = queue.Queue()
+        self.lock = threading.RLock()  # tasks finished straight away report from within submit
+
+        self.futures = []
+        self.pending = {}  # key -> number of tasks of the directory not finished yet
+        self.cancelled = False
+
+    def submit_grids(self,
+                     key,
+                     path: str,
+                     outpath: str,
+                     dim_x: int,
+                     dim_y: int,
+                     background: tuple = (255, 255, 255),
+                     gutter: int = 0,
+                     scale: int = 1,
+                     native: bool = False,
+                     catalog: PlateCatalog = None):
+        """
+        Submits the groups of files of a grid directory, a task per group (see setup.fetch_files()).
+
+        :param key: key of the directory, which its events are reported under
+        :param path: input path
+        :param outpath: output path
+        :param dim_x: columns
+        :param dim_y: rows
+        :param background: colour (BGR) of the gutters and padding of the grid, white by default
+        :param gutter: width of the gap between the files in the grid, in pixels
+        :param scale: factor (1, 2, 4 or 8) to reduce the resolution of the files by while reading them
+        :param native: if True, keeps the native channels and bit depth of the files instead of converting to 8-bit BGR
+        :param catalog: catalog of the input path, if it was scanned already
+        """
+        catalog = catalog or PlateCatalog(path)
+        groups = plan_groups(catalog)
+
+        dir_ref = f"{path.split('/')[-1]}_out"
+        os.makedirs(os.path.join(outpath, dir_ref), exist_ok=True)
+
+        read = partial(read_image, scale=scale, native=native)
+
+        self._submit(key,
+                     len(catalog.files),
+                     [(len(group), grid_worker, (path,
+                                                 group,
+                                                 os.path.join(outpath, dir_ref, provisional_filename),
+                                                 dim_x,
+                                                 dim_y,
+                                                 background,
+                                                 gutter,
+                                                 read))
+                      for provisional_filename, group in groups])
+
+    def submit_stacks(self,
+                      key,
+                      path: str,
+                      outpath: str,
+                      framerate: int = 1,
+                      gif: bool = False,
+                      scale: int = 1,
+                      native: bool = False,
+                      catalog: PlateCatalog = None):
+        """
+        Submits the files of a stack directory, a task per animation (see setup.fetch_dirs()). The frames are streamed
+        into the encoder, so that every worker process only holds a few frames in memory at once.
+
+        :param key: key of the directory, which its events are reported under
+        :param path: input path
+        :param outpath: output path
+        :param framerate: framerate of the animations
+        :param gif: if True, animations are in GIF format, MP4 otherwise
+        :param scale: factor (1, 2, 4 or 8) to reduce the resolution of the frames by while reading them
+        :param native: if True, keeps the native channels and bit depth of the frames until they are encoded
+        :param catalog: catalog of the input path, if it was scanned already
+        """
+        catalog = catalog or PlateCatalog(path)
+
+        dir_ref = f"{path.split('/')[-1]}_out"
+        os.makedirs(os.path.join(outpath, dir_ref), exist_ok=True)
+
+        read = partial(read_image, scale=scale, native=native)
+        tasks = []
+
+        for f in catalog.filenames:
+            frames = catalog.frames(f)
+            tasks.append((len(frames), stack_worker, (frames,
+                                                      os.path.join(outpath, dir_ref, f"{f[:-4]}_stack"),
+                                                      framerate,
+                                                      gif,
+                                                      True,
+                                                      read)))
+
+        self._submit(key, catalog.total_files, tasks)
+
+    def _submit(self,
+                key,
+                total: int,
+                tasks: list):
+        """
+        Submits the tasks of a directory to the pool.
+
+        :param key: key of the directory
+        :param total: number of files in the directory
+        :param tasks: list of (number of files, function, arguments) tuples
+        """
+        skipped = total - sum(files for files, _, _ in tasks)
+
+        if skipped:
+            self.events.put((key, skipped, None))
+
+        with self.lock:
+            if self.cancelled:
+                tasks = []
+
+            self.pending[key] = len(tasks)
+
+            if tasks and self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.jobs, mp_context=multiprocessing.get_context('spawn'))
+
+            for files, func, args in tasks:
+                future = self.pool.submit(func, *args)
+                future.add_done_callback(partial(self._done, key, files))
+                self.futures.append(future)
+
+        if not tasks:
+            self.events.put((key, None, None))
+
+    def _done(self,
+              key,
+              files: int,
+              future):
+        """
+        Reports a finished task. Called from the thread that finished (or cancelled) it.
+
+        :param key: key of the directory of the task
+        :param files: number of files of the task
+        :param future: the finished task
+        """
+        try:
+            error = future.exception()
+
+        except CancelledError:  # nothing was processed
+            pass
+
+        else:
+            self.events.put((key, files, error))
+
+        with self.lock:
+            self.pending[key] -= 1
+            finished = not self.pending[key]
+
+        if finished:
+            self.events.put((key, None, None))
+
+    def poll(self) -> list:
+        """
+        Takes the events reported since the last call, without waiting.
+
+        :return: list of (key, number of files, error) tuples
+        """
+        events = []
+
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+
+            except queue.Empty:
+                return events
+
+    def cancel(self):
+        """
+        Cancels the tasks, which have not started yet, as well as those submitted later. The tasks already running are
+        left to finish, so that no output is left half-written.
+        """
+        with self.lock:
+            self.cancelled = True
+            futures = list(self.futures)
+
+        for future in futures:
+            future.cancel()
+
+    @property
+    def finished(self) -> bool:
+        """
+        True once all the tasks submitted were finished or cancelled.
+        """
+        with self.lock:
+            return not any(self.pending.values())
+
+    def shutdown(self,
+                 wait: bool = False):
+        """
+        Cancels the outstanding tasks and stops the worker processes once they are idle.
+
+        :param wait: if True, blocks until the worker processes stop
+        """
+        self.cancel()
+
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,233 @@
+"""
+    This is the frames module of the IBERS Image Merger program.
+    It contains helpers to read the files at a reduced resolution, to read the frames of animations in a background
+    thread and to fit them to a common size.
+    """
+
+import threading
+from queue import Empty, Full, Queue
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import src.model.profiling as profiling
+
+# scale factors accepted by the user interfaces, mapped to the factor the resolution is reduced by
+SCALES = {'1': 1, '1/2': 2, '1/4': 4, '1/8': 8}
+
+# flags of OpenCV, which reduce the resolution of the image while it is decoded
+REDUCED_FLAGS = {1: cv2.IMREAD_COLOR,
+                 2: cv2.IMREAD_REDUCED_COLOR_2,
+                 4: cv2.IMREAD_REDUCED_COLOR_4,
+                 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def read_image(path: str,
+               scale: int = 1,
+               native: bool = False) -> np.ndarray:
+    """
+    Reads an image at the given fraction of its resolution.
+
+    JPEG files are reduced by the decoder itself (IMREAD_REDUCED_* flags of OpenCV), which saves most of the cost of
+    the decoding. Other formats are decoded in full and downscaled with area interpolation.
+
+    By default, images are converted to 8-bit BGR by OpenCV. In native mode, they keep the number of channels and the
+    bit depth they are stored with, which for the single-channel 16-bit TIFFs of the Roboworm platform saves two thirds
+    of the memory and of the merging work, and keeps the full depth of the data.
+
+    :param path: path to the image
+    :param scale: factor (1, 2, 4 or 8) to reduce the resolution by
+    :param native: if True, reads the image with its native channels and bit depth (IMREAD_UNCHANGED)
+    :return: the image as a NumPy array, None if it could not be read
+    """
+    with profiling.stage('read', path) as record:
+        img = decode_image(path, scale, native)
+        record['bytes'] = img.nbytes if img is not None else 0
+
+    return img
+
+
+def decode_image(path: str,
+                 scale: int = 1,
+                 native: bool = False) -> np.ndarray:
+    """
+    Decodes an image, see read_image().
+
+    :param path: path to the image
+    :param scale: factor (1, 2, 4 or 8) to reduce the resolution by
+    :param native: if True, reads the image with its native channels and bit depth (IMREAD_UNCHANGED)
+    :return: the image as a NumPy array, None if it could not be read
+    """
+    flags = cv2.IMREAD_UNCHANGED if native else cv2.IMREAD_COLOR
+
+    if scale == 1:
+        return cv2.imread(path, flags)
+
+    if not native and path.lower().endswith(('.jpg', '.jpeg')):
+        return cv2.imread(path, REDUCED_FLAGS[scale])
+
+    img = cv2.imread(path, flags)
+
+    if img is None:
+        return None
+
+    return cv2.resize(img,
+                      (max(1, img.shape[1] // scale), max(1, img.shape[0] // scale)),
+                      interpolation=cv2.INTER_AREA)
+
+
+def read_size(path: str,
+              scale: int = 1,
+              native: bool = False) -> tuple:
+    """
+    Size of an image as read by read_image(), from the header of the file, without decoding it. Files Pillow can not
+    open are decoded instead.
+
+    :param path: path to the image
+    :param scale: factor (1, 2, 4 or 8) to reduce the resolution by
+    :param native: if True, the image is read with its native channels and bit depth (see read_image())
+    :return: (width, height), None if the image could not be read
+    """
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+
+            # OpenCV applies the EXIF orientation unless the image is read unchanged
+            if not native and img.getexif().get(0x0112) in (5, 6, 7, 8):
+                width, height = height, width
+
+    except OSError:
+        img = decode_image(path, scale, native)
+
+        return (img.shape[1], img.shape[0]) if img is not None else None
+
+    if scale == 1:
+        return width, height
+
+    if not native and path.lower().endswith(('.jpg', '.jpeg')):  # reduced by the decoder, which rounds up
+        return -(-width // scale), -(-height // scale)
+
+    return max(1, width // scale), max(1, height // scale)
+
+
+def depth_lut(frame: np.ndarray) -> np.ndarray:
+    """
+    Builds the lookup table, which converts frames of an unsigned integer type of more than 8 bits to 8 bits.
+    The number of bits actually used by the given frame (e.g., 12 bits of a 16-bit TIFF) is stretched over the 8-bit
+    range, so that the converted frames are not left dark. Values above that range are clipped.
+
+    :param frame: frame to build the lookup table for
+    :return: array of 8-bit values, indexed by the values of the frame
+    """
+    bits = max(8, int(frame.max()).bit_length())
+    lut = np.arange(np.iinfo(frame.dtype).max + 1, dtype=np.uint64) * 255 // ((1 << bits) - 1)
+
+    return np.minimum(lut, 255).astype(np.uint8)
+
+
+def to_uint8(frame: np.ndarray,
+             lut: np.ndarray = None) -> np.ndarray:
+    """
+    Converts a frame to 8 bits, for the encoders that can not store a higher bit depth (MP4, GIF, JPEG, WebP).
+
+    :param frame: frame to convert
+    :param lut: lookup table as returned by depth_lut(), built from the frame itself if not given
+    :return: the frame itself if it is 8-bit already, a converted copy otherwise
+    """
+    if frame.dtype == np.uint8:
+        return frame
+
+    if frame.dtype.kind != 'u':  # signed and floating point frames are stretched over their own range
+        return cv2.normalize(frame, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+
+    return (lut if lut is not None else depth_lut(frame))[frame]
+
+
+def pad_frame(frame: np.ndarray,
+              size: tuple,
+              value: int = 0) -> np.ndarray:
+    """
+    Fits a frame into the given size, padding it at the bottom and on the right (or cropping it, if it is larger).
+
+    :param frame: frame to fit
+    :param size: (width, height) to fit the frame into
+    :param value: value of the padding, black by default
+    :return: the frame itself if it already has the required size, a padded copy otherwise
+    """
+    width, height = size
+
+    if frame.shape[:2] == (height, width):
+        return frame
+
+    canvas = np.full((height, width) + frame.shape[2:], value, dtype=frame.dtype)
+
+    h, w = min(height, frame.shape[0]), min(width, frame.shape[1])
+    canvas[:h, :w] = frame[:h, :w]
+
+    return canvas
+
+
+def prefetch(paths: list,
+             read=cv2.imread,
+             depth: int = 4):
+    """
+    Decodes the given files in a background thread, staying at most depth frames ahead of the consumer.
+    cv2.imread releases the GIL, so decoding of the next frames overlaps with the encoding of the current one.
+
+    :param paths: paths to the files to decode, in order
+    :param read: function that decodes a single file
+    :param depth: number of decoded frames that can wait in the queue
+    :return: yields the decoded frames in order
+    """
+    q = Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()  # marks the end of the frames
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+
+            except Full:
+                continue
+
+    def worker():
+        try:
+            for path in paths:
+                if stop.is_set():
+                    return
+
+                put(read(path))
+
+        except Exception as e:  # re-raised in the consumer
+            put(e)
+
+        finally:
+            put(done)
+
+    t = threading.Thread(target=worker, daemon=True)
+    t.start()
+
+    try:
+        while True:
+            item = q.get()
+
+            if item is done:
+                break
+
+            if isinstance(item, Exception):
+                raise item
+
+            yield item
+
+    finally:  # the consumer stopped early, release the worker
+        stop.set()
+
+        while t.is_alive():
+            try:
+                q.get(timeout=0.1)
+
+            except Empty:
+                continue
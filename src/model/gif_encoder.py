@@ -0,0 +1,253 @@
+"""
+    This is the GIF encoder module of the IBERS Image Merger program.
+    It contains the classes that write animations in GIF format straight from the NumPy frames.
+    Every animation shares a single global palette, built with vectorised quantisation over all of its frames,
+    and only the bounding box of the pixels that changed since the previous frame is stored for each frame.
+    Pillow is only used for the LZW compression of the pixel data.
+    """
+
+import os
+import struct
+
+import numpy as np
+from PIL import Image
+
+from src.model.frames import pad_frame
+
+
+class Palette:
+    """
+    Global palette of an animation, together with the lookup table that maps the colours of the frames to it.
+
+    Grayscale frames (the usual output of the Roboworm platform) are mapped on an exact 256 levels palette.
+    Colour frames are reduced to 15-bit colours, out of which the 256 most frequent ones form the palette.
+    """
+
+    def __init__(self,
+                 colours: np.ndarray,
+                 lut: np.ndarray = None):
+        """
+        Function that initialises the Palette object.
+
+        :param colours: (256, 3) array of the colours of the palette, in RGB order
+        :param lut: lookup table from 15-bit BGR colours to the indices of the palette, None for grayscale palettes
+        """
+        self.colours = colours
+        self.lut = lut
+
+    @staticmethod
+    def is_gray(frame: np.ndarray) -> bool:
+        """
+        Checks whether a frame is grayscale, even if it was loaded in with three channels.
+
+        :param frame: frame to check
+        """
+        return frame.ndim == 2 or ((frame[..., 0] == frame[..., 1]).all() and (frame[..., 1] == frame[..., 2]).all())
+
+    @staticmethod
+    def codes(frame: np.ndarray) -> np.ndarray:
+        """
+        Reduces the BGR colours of a frame to 15-bit codes (5 bits per channel).
+
+        :param frame: frame to reduce
+        """
+        b, g, r = (frame[..., i].astype(np.uint16) >> 3 for i in range(3))
+
+        return (b << 10) | (g << 5) | r
+
+    @classmethod
+    def from_frames(cls,
+                    frames: list,
+                    step: int = 4):
+        """
+        Builds the global palette of an animation from its frames.
+
+        :param frames: frames of the animation (BGR, BGRA or grayscale), the alpha channel is ignored
+        :param step: only every n-th row and column of the frames is sampled for the histogram of colours
+        """
+        if all(cls.is_gray(f) for f in frames):
+            return cls(np.repeat(np.arange(256, dtype=np.uint8)[:, None], 3, axis=1))
+
+        counts = np.zeros(1 << 15, dtype=np.int64)
+        sums = np.zeros((1 << 15, 3), dtype=np.float64)
+
+        for f in frames:
+            sample = f[::step, ::step]
+            sample = (np.repeat(sample[..., None], 3, axis=2) if sample.ndim == 2 else sample[..., :3]).reshape(-1, 3)
+            codes = cls.codes(sample)
+
+            counts += np.bincount(codes, minlength=1 << 15)
+
+            for c in range(3):  # sum of the exact colours in each bin, to use their mean as the palette entry
+                sums[:, c] += np.bincount(codes, weights=sample[:, c], minlength=1 << 15)
+
+        used = np.flatnonzero(counts)
+        used = used[np.argsort(counts[used])[::-1][:256]]  # most frequent bins
+
+        entries = (sums[used] / counts[used, None]).round()  # BGR
+
+        # map every 15-bit colour to the nearest entry of the palette, in chunks to bound the memory used
+        bins = np.arange(1 << 15)
+        centres = np.stack([(bins >> 10) & 31, (bins >> 5) & 31, bins & 31], axis=1) * 8 + 4
+
+        lut = np.empty(1 << 15, dtype=np.uint8)
+
+        for start in range(0, 1 << 15, 4096):
+            chunk = centres[start:start + 4096, None, :] - entries[None, :, :]
+            lut[start:start + 4096] = np.einsum('ijk,ijk->ij', chunk, chunk).argmin(axis=1)
+
+        colours = np.zeros((256, 3), dtype=np.uint8)
+        colours[:len(entries)] = entries[:, ::-1]  # RGB order in the GIF colour table
+
+        return cls(colours, lut)
+
+    def quantise(self,
+                 frame: np.ndarray) -> np.ndarray:
+        """
+        Maps a frame on the palette.
+
+        :param frame: frame to map (BGR or grayscale)
+        :return: 2D array of the indices of the palette
+        """
+        if self.lut is None:
+            return frame if frame.ndim == 2 else np.ascontiguousarray(frame[..., 0])
+
+        return self.lut[self.codes(frame)]
+
+
+class GifWriter:
+    """
+    Writes an animation in GIF format frame by frame.
+
+    Frames are quantised on a single global palette. Only the bounding box of the pixels that changed since the previous
+    frame is written, and frames identical to the previous one extend its duration instead of being written again.
+    """
+
+    def __init__(self,
+                 filename: str,
+                 size: tuple,
+                 palette: Palette,
+                 framerate: int = 7):
+        """
+        Function that initialises the GifWriter and writes the header of the GIF file.
+
+        :param filename: name of the GIF file to write, or a binary file object (e.g., io.BytesIO) to write into, which
+        is left open once the animation is written
+        :param size: (width, height) of the animation
+        :param palette: global palette of the animation
+        :param framerate: frames per second
+        """
+        self.owned = isinstance(filename, (str, os.PathLike))  # the writer only closes the files it opened
+        self.fp = open(filename, 'wb') if self.owned else filename
+        self.size = size
+        self.palette = palette
+        self.framerate = framerate
+
+        self.frames = 0  # number of frames received so far
+        self.previous: np.ndarray = None  # indices of the previous frame
+        self.pending = None  # (left, top, indices, delay) of the frame waiting to be written
+        self.written = None  # (offset of the delay in the file, delay) of the last frame written
+
+        self.fp.write(b'GIF89a')
+        self.fp.write(struct.pack('<HHBBB', size[0], size[1], 0xF7, 0, 0))  # global colour table of 256 colours
+        self.fp.write(palette.colours.tobytes())
+        self.fp.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')  # loop forever
+
+    def delay(self,
+              frame: int) -> int:
+        """
+        Duration of the given frame in hundredths of a second (the unit of GIF).
+        Computed from the cumulative time of the frames, so that rounding errors do not add up.
+        Viewers ignore the delays shorter than 2 hundredths of a second, hence the lower limit.
+
+        :param frame: number of the frame
+        """
+        return max(2, round((frame + 1) * 100 / self.framerate) - round(frame * 100 / self.framerate))
+
+    def write(self,
+              frame: np.ndarray):
+        """
+        Adds a frame to the animation.
+
+        :param frame: frame to add (BGR or grayscale)
+        """
+        indices = pad_frame(self.palette.quantise(frame), self.size)  # frames of a different size go top left
+
+        delay = self.delay(self.frames)
+        self.frames += 1
+
+        if self.previous is None:
+            self.pending = (0, 0, indices, delay)
+            self.previous = indices
+            return
+
+        changed = indices != self.previous
+        rows = np.flatnonzero(changed.any(axis=1))
+
+        if len(rows) == 0 and self.pending is None:  # previous frame was written at a checkpoint, its delay is patched
+            offset, previous_delay = self.written
+            end = self.fp.tell()
+
+            self.fp.seek(offset)
+            self.fp.write(struct.pack('<H', min(previous_delay + delay, 0xFFFF)))
+            self.fp.seek(end)
+
+            self.written = (offset, previous_delay + delay)
+            return
+
+        if len(rows) == 0:  # identical frame, show the previous one for longer
+            left, top, crop, previous_delay = self.pending
+            self.pending = (left, top, crop, previous_delay + delay)
+            return
+
+        cols = np.flatnonzero(changed.any(axis=0))
+        top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+        self.flush()
+        self.pending = (left, top, indices[top:bottom, left:right], delay)
+        self.previous = indices
+
+    def flush(self):
+        """
+        Writes the pending frame into the file.
+        """
+        if self.pending is None:
+            return
+
+        left, top, crop, delay = self.pending
+        height, width = crop.shape
+        self.written = (self.fp.tell() + 4, delay)
+
+        # graphic control extension: leave the frame in place, so the next one is drawn over it
+        self.fp.write(b'\x21\xf9\x04\x04' + struct.pack('<H', min(delay, 0xFFFF)) + b'\x00\x00')
+        self.fp.write(b',' + struct.pack('<HHHHB', left, top, width, height, 0))
+        self.fp.write(b'\x08' + Image.fromarray(np.ascontiguousarray(crop)).tobytes('gif', 'L') + b'\x00')
+
+        self.pending = None
+
+    def checkpoint(self):
+        """
+        Writes the frames received so far and the trailer, so that the file holds a complete animation (e.g., to be
+        viewed while further frames are still to come). The next frame is written over the trailer, so the file has to
+        be seekable.
+        """
+        self.flush()
+        self.fp.write(b';')
+        self.fp.flush()
+        self.fp.seek(-1, os.SEEK_CUR)
+
+    def close(self):
+        """
+        Writes the last frame and the trailer of the GIF file and closes it (unless it was given as a file object).
+        """
+        self.flush()
+        self.fp.write(b';')
+
+        if self.owned:
+            self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,197 @@
+"""
+    This is the HTD module of the IBERS Image Merger program.
+    It reads the .HTD plate descriptors written by the Roboworm platform (MetaXpress) next to the images of a plate,
+    which list the wells and sites imaged, the number of timepoints and the dimensions of the plate.
+    """
+
+import re
+
+ROWS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'  # row letters of the wells, plates of up to 1536 wells use two letters
+
+# name of an image of a well: <prefix>_<well>[_s<site>][_w<wavelength>][_Thumb].<extension>
+FILENAME = re.compile(r'^(?P<prefix>.+)_(?P<well>[A-Z]{1,2}\d{2})(?:_s(?P<site>\d+))?(?:_w\d+)?\.(?:tif|png|jpg)$',
+                      re.IGNORECASE)
+
+
+def well_name(row: int,
+              column: int) -> str:
+    """
+    Name of a well (e.g., A01) from its position on the plate.
+
+    :param row: row of the well, from 0
+    :param column: column of the well, from 0
+    """
+    letters = ROWS[row] if row < len(ROWS) else ROWS[row // len(ROWS) - 1] + ROWS[row % len(ROWS)]
+
+    return f"{letters}{column + 1:02d}"
+
+
+def read_htd(path: str) -> dict:
+    """
+    Reads the entries of an .HTD file, which are lines of "Key", value, value ... format.
+
+    :param path: path to the .HTD file
+    :return: key -> list of values, which are converted to bool or int where possible
+    """
+    entries = {}
+
+    with open(path, errors='replace') as f:
+        for line in f:
+            fields = [x.strip().strip('"') for x in line.strip().split(',')]
+
+            if not fields[0]:
+                continue
+
+            values = []
+
+            for x in fields[1:]:
+                if x.upper() in ('TRUE', 'FALSE'):
+                    values.append(x.upper() == 'TRUE')
+
+                else:
+                    try:
+                        values.append(int(x))
+
+                    except ValueError:
+                        values.append(x)
+
+            entries[fields[0]] = values
+
+    return entries
+
+
+class PlateLayout:
+    """
+    Layout of a plate as described by its .HTD file.
+
+    :param rows: number of rows of wells of the plate
+    :param columns: number of columns of wells of the plate
+    :param wells: names of the wells imaged, in the order of the plate (A01, A02, ... B01, ...)
+    :param x_sites: number of columns of sites imaged in every well
+    :param y_sites: number of rows of sites imaged in every well
+    :param sites: numbers (from 1) of the sites imaged in every well, in the order of the site grid
+    :param timepoints: number of timepoints imaged
+    """
+
+    def __init__(self,
+                 rows: int,
+                 columns: int,
+                 wells: list,
+                 x_sites: int = 1,
+                 y_sites: int = 1,
+                 sites: list = None,
+                 timepoints: int = 1):
+        """
+        Function that initialises the PlateLayout.
+        """
+        self.rows = rows
+        self.columns = columns
+        self.wells = wells
+        self.x_sites = x_sites
+        self.y_sites = y_sites
+        self.sites = sites if sites is not None else list(range(1, x_sites * y_sites + 1))
+        self.timepoints = timepoints
+
+    @classmethod
+    def from_file(cls,
+                  path: str):
+        """
+        Reads the layout of a plate from its .HTD file.
+
+        :param path: path to the .HTD file
+        :return: the PlateLayout, None if the file does not describe the wells of the plate
+        """
+        entries = read_htd(path)
+
+        try:
+            columns, rows = entries['XWells'][0], entries['YWells'][0]
+
+        except (KeyError, IndexError):
+            return None
+
+        wells = [well_name(r, c)
+                 for r in range(rows)
+                 for c, selected in enumerate(entries.get(f"WellsSelection{r + 1}", [True] * columns)[:columns])
+                 if selected is True]
+
+        x_sites, y_sites, sites = 1, 1, [1]
+
+        if entries.get('Sites', [False])[0] is True:
+            x_sites, y_sites = entries.get('XSites', [1])[0], entries.get('YSites', [1])[0]
+            sites = [r * x_sites + c + 1
+                     for r in range(y_sites)
+                     for c, selected in enumerate(entries.get(f"SiteSelection{r + 1}", [True] * x_sites)[:x_sites])
+                     if selected is True]
+
+        return cls(rows=rows,
+                   columns=columns,
+                   wells=wells,
+                   x_sites=x_sites,
+                   y_sites=y_sites,
+                   sites=sites,
+                   timepoints=entries.get('TimePoints', [1])[0])
+
+    def position(self,
+                 well: str) -> tuple:
+        """
+        Position of a well on the plate.
+
+        :param well: name of the well (e.g., B03)
+        :return: (row, column), from 0
+        """
+        letters, column = well[:-2], int(well[-2:]) - 1
+        row = ROWS.index(letters) if len(letters) == 1 else (ROWS.index(letters[0]) + 1) * len(ROWS) + \
+            ROWS.index(letters[1])
+
+        return row, column
+
+    def site_position(self,
+                      site: int) -> tuple:
+        """
+        Position of a site in the site grid of a well.
+
+        :param site: number of the site, from 1
+        :return: (row, column), from 0
+        """
+        return (site - 1) // self.x_sites, (site - 1) % self.x_sites
+
+    def plan(self,
+             files: list) -> dict:
+        """
+        Sorts the files of a plate by the well and site they were imaged at, following the layout of the plate.
+        Files of the wells and sites not selected in the .HTD file, and files not named after a well, are left out.
+
+        :param files: names of the image files
+        :return: well -> list of (site, file name) tuples ordered by the site, for the wells in the order of the plate
+        """
+        wells = {well: [] for well in self.wells}
+        sites = set(self.sites)
+
+        for file in files:
+            match = FILENAME.match(file)
+
+            if match is None or match['well'].upper() not in wells:
+                continue
+
+            site = int(match['site'] or 1)
+
+            if site in sites:
+                wells[match['well'].upper()].append((site, file))
+
+        return {well: sorted(found) for well, found in wells.items() if found}
+
+    def group(self,
+              files: list) -> list:
+        """
+        Splits the files of a grid directory into the groups that should be merged together, one group per well.
+
+        :param files: names of the image files
+        :return: list of (output filename, list of file names) tuples, in the order of the plate
+        """
+        groups = []
+
+        for well, found in self.plan(files).items():
+            prefix = FILENAME.match(found[0][1])['prefix']
+            groups.append((f"{prefix}_{well}_grid", [file for _, file in found]))
+
+        return groups
@@ -5,10 +5,26 @@
     Allows to export image as a binary for display in GUI or as a image or video file (e.g., png).
     """
 
+import os
+import shutil
+import tempfile
+import time
+
 import cv2
 import numpy as np
 from PIL import Image
 
+import src.model.profiling as profiling
+from src.model.encoder import Encoder
+from src.model.frames import depth_lut, pad_frame, to_uint8
+from src.model.gif_encoder import GifWriter, Palette
+from src.model.pyramid import write_pyramid
+
+# MP4 animations written into file objects go through a temporary file, in memory where the system allows it
+SCRATCH = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+PROJECTIONS = ('max', 'mean', 'std')  # kinds of the temporal projections, see ProjectionWriter
+
 
 class ImageGrouper:
     """
@@ -28,67 +44,144 @@ class ImageGrouper:
         """
 
         self.files = files
-        self.imgs = [Image.fromarray(img) for img in self.files]
+        self._imgs: list = []  # Pillow copies of the files, only built when requested through imgs
         self.merged_image: np.ndarray = np.ndarray([])
-        # self.data = io.BytesIO()
 
-    def unite(self,
-              images: list[np.ndarray]):  # makes strips of given PIL images
+    @staticmethod
+    def to_pil(img: np.ndarray) -> Image.Image:
+        """
+        Converts a single file loaded in through OpenCV (BGR order of channels) to a Pillow Image.
+
+        :param img: NumPy array to convert
+        """
+        if img.ndim == 3 and img.shape[2] == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+        return Image.fromarray(img)
+
+    @property
+    def imgs(self) -> list:
         """
-        Function that merges given numpy arrays horizontally, creating required image.
-        Works off NumPy.
+        Pillow representation of the files. Built lazily on the first access, as only a few outputs need it.
+        """
+        if len(self._imgs) != len(self.files):
+            self._imgs = [self.to_pil(img) for img in self.files]
+
+        return self._imgs
 
-        :param images: numpy arrays to create an image from
+    @staticmethod
+    def fill_value(background: tuple,
+                   img: np.ndarray):
         """
+        Converts an 8-bit BGR colour to the number of channels and the bit depth of the given image, so that it can be
+        used to paint the images loaded in with their native channels and bit depth (e.g., 16-bit grayscale).
 
-        heights, widths = zip(*(i.shape[:2] for i in images))
+        :param background: colour in BGR order, 0 - 255 per channel
+        :param img: image to convert the colour for
+        """
+        integer = np.issubdtype(img.dtype, np.integer)
+        top = np.iinfo(img.dtype).max if integer else 1  # floating point images are expected in the range of 0 - 1
 
-        self.merged_image = np.zeros((max(heights), sum(widths), 3), dtype=np.uint8)
-        self.merged_image[:, :] = (255, 255, 255)
+        value = np.array(background, dtype=np.float64) * top / 255
+        channels = img.shape[2] if img.ndim == 3 else 1
 
-        offset = images[0].shape[1]
+        if channels == 1:
+            value = value.mean()
 
-        self.merged_image[:images[0].shape[0], :offset, :3] = images[0]
+        elif channels == 4:  # opaque
+            value = np.append(value, top)
 
-        for i in range(1, len(images)):
-            self.merged_image[:images[i].shape[0], offset:offset + images[i].shape[1], :3] = images[i]
-            offset += images[i].shape[1]
+        return value.round() if integer else value
 
+    @profiling.timed('compose', lambda ig: ig.merged_image.nbytes)
     def grid(self,
              size_x: int = 2,
-             size_y: int = 2) -> bool:
+             size_y: int = 2,
+             background: tuple = (255, 255, 255),
+             gutter: int = 0) -> bool:
 
         """
         Function to generate a tiles (grid) image palette from the loaded in files.
         Dimension of the image is required for successful generation, defaults to a 2x2 grid.
-        Works of NumPy.
+        Works of NumPy, keeping the number of channels and the bit depth of the files.
+
+        The layout of the whole grid (width of every column, height of every row) is computed from the shapes of the
+        files first, so that the resulting image is allocated once and every file is copied straight to its offset.
 
         :param size_x: number of columns
         :param size_y: number of rows
+        :param background: colour (in BGR order) of the gutters and of the padding around smaller files
+        :param gutter: width of the gap between the rows and columns of the grid, in pixels
         """
 
         if len(self.files) != (size_x * size_y):  # Number of images selected does not match number of images required
             return False
 
-        wip: list = []  # stores work in progress images
+        heights, widths = (np.array(dim).reshape(size_y, size_x) for dim in zip(*(i.shape[:2] for i in self.files)))
 
-        offset = 0
-        for _ in range(size_y):  # generate top image, bottom image etc.
-            self.unite(self.files[offset:offset + size_x])  # makes image row
-            wip.append(self.merged_image)
-            offset += size_x  # shift offset
+        row_heights = heights.max(axis=1)
+        col_widths = widths.max(axis=0)
 
-        merged_heights, merged_widths = zip(*(i.shape[:2] for i in wip))
+        # offsets of the top left corners of every row and column
+        row_offsets = np.concatenate(([0], np.cumsum(row_heights + gutter)[:-1]))
+        col_offsets = np.concatenate(([0], np.cumsum(col_widths + gutter)[:-1]))
 
-        self.merged_image = np.zeros((sum(merged_heights), max(merged_widths), 3), dtype=np.uint8)
+        shape = (row_heights.sum() + gutter * (size_y - 1), col_widths.sum() + gutter * (size_x - 1))
 
-        f_offset = wip[0].shape[0]
+        self.merged_image = np.empty(shape + self.files[0].shape[2:], dtype=self.files[0].dtype)
 
-        self.merged_image[:f_offset, :wip[0].shape[1], :3] = wip[0]
+        # only paint the background if the files do not cover the whole image
+        if gutter or (heights != row_heights[:, None]).any() or (widths != col_widths[None, :]).any():
+            self.merged_image[:, :] = self.fill_value(background, self.files[0])
 
-        for i in range(1, len(wip)):
-            self.merged_image[f_offset:f_offset + wip[i].shape[0], :wip[i].shape[1], :3] = wip[i]
-            f_offset += wip[i].shape[0]
+        for i, img in enumerate(self.files):
+            y = row_offsets[i // size_x]
+            x = col_offsets[i % size_x]
+            self.merged_image[y:y + img.shape[0], x:x + img.shape[1]] = img
+
+        return True
+
+    @profiling.timed('compose', lambda ig: ig.merged_image.nbytes)
+    def montage(self,
+                positions: list,
+                background: tuple = (255, 255, 255),
+                gutter: int = 0) -> bool:
+        """
+        Function to generate an overview image of a whole plate, which places the sites of every well at the position
+        of the well on the plate. Works of NumPy, keeping the number of channels and the bit depth of the files.
+
+        Every well gets a cell of the same size (the site grid of the largest files plus the gutter), so the image is
+        allocated once and viewed as a (plate rows, plate columns, cell height, cell width) array, into which every
+        file is copied at its site offset. Files smaller than the largest one are padded with the background.
+
+        :param positions: (well row, well column, site row, site column) of every file, from 0
+        :param background: colour (in BGR order) of the gutters and of the padding around smaller files
+        :param gutter: width of the gap between the wells of the plate, in pixels
+        :return: False if there are no files to place
+        """
+
+        if len(self.files) == 0 or len(positions) != len(self.files):
+            return False
+
+        rows, columns, site_rows, site_columns = (max(p[i] for p in positions) + 1 for i in range(4))
+        height = max(img.shape[0] for img in self.files)
+        width = max(img.shape[1] for img in self.files)
+
+        cell_height, cell_width = site_rows * height + gutter, site_columns * width + gutter
+        channels = self.files[0].shape[2:]
+
+        canvas = np.empty((rows * cell_height, columns * cell_width) + channels, dtype=self.files[0].dtype)
+        canvas[:, :] = self.fill_value(background, self.files[0])
+
+        # view of the image by the wells: cells[row, column] is the cell of a well
+        cells = canvas.reshape((rows, cell_height, columns, cell_width) + channels).swapaxes(1, 2)
+
+        for img, (row, column, site_row, site_column) in zip(self.files, positions):
+            y, x = site_row * height, site_column * width
+            cells[row, column, y:y + img.shape[0], x:x + img.shape[1]] = img
+
+        # no gutter after the last row and column of wells
+        self.merged_image = canvas[:canvas.shape[0] - gutter, :canvas.shape[1] - gutter]
 
         return True
 
@@ -98,41 +191,361 @@ class ImageGrouper:
                   filename: str = 'video'):
         """
         Creates a so-called stack of images (animation) in GIF or MP4 formats.
+        Frames smaller than the largest one are padded to its size.
 
         :param framerate: specified framerate to generate video or gif with, defaults to 7.
         :param gif: whether or not the user selected option of generating a gif.
         :param filename: custom filename.
         """
-        if gif:
-            self.imgs[0].save(f"{filename}.gif",
-                              save_all=True,
-                              append_images=self.imgs[1:],
-                              duration=framerate,
-                              loop=0,
-                              )
-
-        else:
-            widths, heights = zip(*(i.shape[:2] for i in self.files))  # can't use PIL Image objects to make an mp4
+        heights, widths = zip(*(i.shape[:2] for i in self.files))
+
+        # NumPy frames go straight to the encoder, on a palette shared by the whole animation
+        # (frames of a higher bit depth get theirs from the first frame, once converted to 8 bits)
+        palette = Palette.from_frames(self.files) if gif and self.files[0].dtype == np.uint8 else None
+
+        with AnimationWriter(filename,
+                             framerate=framerate,
+                             gif=gif,
+                             size=(max(widths), max(heights)),
+                             palette=palette,
+                             ) as writer:
+            for f in self.files:  # create animation
+                writer.write(f)
 
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # codec of mp4 format
+    def projection(self,
+                   kinds: tuple = PROJECTIONS,
+                   filename: str = 'video',
+                   encoder: Encoder = None) -> list:
+        """
+        Projects the files, taken as the frames of a time course, into summary images (see ProjectionWriter).
+        Frames of a different size are padded (or cropped) to the size of the largest one.
 
-            writer = cv2.VideoWriter(f"{filename}.mp4",
-                                     fourcc,
-                                     framerate,
-                                     (max(widths), max(heights)),
-                                     )
+        :param kinds: kinds of projections to make: max, mean and/or std
+        :param filename: custom filename, the projections are exported as <filename>_<kind>
+        :param encoder: format and preset of the projections (see encoder.Encoder), the default PNG if None
+        :return: filenames of the projections exported
+        """
+        heights, widths = zip(*(i.shape[:2] for i in self.files))
 
-            for f in self.files:  # create animation
+        with ProjectionWriter(filename, kinds=kinds, size=(max(widths), max(heights)), encoder=encoder) as writer:
+            for f in self.files:
                 writer.write(f)
 
-            cv2.destroyAllWindows()
-            writer.release()
+        return writer.filenames
 
     def export_image(self,
-                     filename: str = 'image'):
+                     filename: str = 'image',
+                     encoder: Encoder = None):
+        """
+        Exports the resulting image, in PNG format unless another encoder is given.
+
+        :param filename: custom filename, without the extension
+        :param encoder: format and preset to encode the image with (see encoder.Encoder), the default PNG if None
+        """
+        with profiling.stage('encode') as record:
+            record['bytes'] = (encoder or Encoder()).write(self.merged_image, filename)
+
+    def export_pyramid(self,
+                       filename: str = 'image',
+                       tile_size: int = 256):
         """
-        Exports the resulting image in PNG format.
+        Exports the resulting image as a DeepZoom tile pyramid (<filename>.dzi and <filename>_files), which viewers
+        can open without loading the whole image.
 
         :param filename: custom filename
+        :param tile_size: width and height of the tiles, in pixels
+        """
+        with profiling.stage('encode') as record:
+            record['bytes'] = write_pyramid(self.merged_image, filename, tile_size=tile_size)
+
+
+class AnimationWriter:
+    """
+    Writes an animation in GIF or MP4 format frame by frame, so that the frames never have to be held in memory all
+    at once. The writer is opened on the first frame, which sets the size of the animation (unless given) and the
+    palette of a GIF (unless given). Frames of a different size are padded (or cropped) to the size of the animation.
+
+    Both formats are 8-bit, so frames of a higher bit depth are converted through a lookup table built on the first
+    frame (see frames.depth_lut()), and MP4 frames are converted to three channels.
+
+    The animation can be written into a binary file object (e.g., io.BytesIO) instead of a file. GIFs are written into
+    it directly, while MP4s, which OpenCV only writes into named files, are written into a temporary file first and
+    copied into the file object once the writer is closed.
+    """
+
+    def __init__(self,
+                 filename: str,
+                 framerate: int = 7,
+                 gif: bool = False,
+                 size: tuple = None,
+                 palette: Palette = None):
+        """
+        Function that initialises the AnimationWriter.
+
+        :param filename: custom filename, without the extension, or a binary file object to write the animation into,
+        which is left open
+        :param framerate: framerate of the animation
+        :param gif: if True, animation is written in GIF format, MP4 otherwise
+        :param size: (width, height) of the animation, size of the first frame by default
+        :param palette: palette of a GIF animation, built from the first frame by default
+        """
+        self.filename = filename
+        self.framerate = framerate
+        self.gif = gif
+        self.size = size
+        self.palette = palette
+        self.writer = None
+        self.lut: np.ndarray = None  # converts frames of a higher bit depth to 8 bits
+        self.seconds = 0.0  # time spent converting and encoding the frames
+        self.scratch: str = None  # temporary directory of an MP4 written into a file object
+
+    @property
+    def output(self):
+        """
+        Path to the file the underlying writer writes into, or the file object of a GIF written into one.
+        """
+        if isinstance(self.filename, str):
+            return f"{self.filename}.{'gif' if self.gif else 'mp4'}"
+
+        if self.scratch is not None:
+            return os.path.join(self.scratch, 'animation.mp4')
+
+        return self.filename
+
+    def open(self,
+             frame: np.ndarray):
+        """
+        Opens the underlying GIF or MP4 writer.
+
+        :param frame: first frame of the animation
+        """
+        if self.size is None:
+            self.size = (frame.shape[1], frame.shape[0])
+
+        if frame.dtype != np.uint8 and frame.dtype.kind == 'u':
+            self.lut = depth_lut(frame)
+
+        if self.gif:
+            self.writer = GifWriter(self.output,
+                                    self.size,
+                                    self.palette or Palette.from_frames([to_uint8(frame, self.lut)]),
+                                    framerate=self.framerate,
+                                    )
+
+        else:
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # codec of mp4 format
+
+            if not isinstance(self.filename, str):
+                self.scratch = tempfile.mkdtemp(dir=SCRATCH)
+
+            self.writer = cv2.VideoWriter(self.output,
+                                          fourcc,
+                                          self.framerate,
+                                          self.size,
+                                          )
+
+    def write(self,
+              frame: np.ndarray):
+        """
+        Adds a frame to the animation.
+
+        :param frame: frame to add
         """
-        cv2.imwrite(f"{filename}.png", self.merged_image)
+        start = time.perf_counter()
+
+        if self.writer is None:
+            self.open(frame)
+
+        frame = to_uint8(frame, self.lut)
+
+        if frame.ndim == 3 and frame.shape[2] == 4:  # neither format stores the alpha channel
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+
+        elif not self.gif and frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+
+        self.writer.write(pad_frame(frame, self.size))
+        self.seconds += time.perf_counter() - start
+
+    def checkpoint(self):
+        """
+        Makes the file written so far a complete animation, which can be viewed while further frames are still to
+        come. Only GIFs allow it, an MP4 is only complete once the writer is closed.
+        """
+        if self.gif and self.writer is not None:
+            self.writer.checkpoint()
+
+    def close(self):
+        """
+        Finalises the animation file.
+        """
+        if self.writer is None:
+            return
+
+        start = time.perf_counter()
+
+        if self.gif:
+            self.writer.close()
+
+        else:
+            self.writer.release()
+
+        self.writer = None
+        nbytes = os.path.getsize(self.output) if isinstance(self.output, str) else 0
+
+        if self.scratch is not None:
+            try:
+                with open(self.output, 'rb') as f:
+                    shutil.copyfileobj(f, self.filename)
+
+            finally:
+                shutil.rmtree(self.scratch, ignore_errors=True)
+                self.scratch = None
+
+        # the whole encoding of the animation is a single stage
+        profiling.add('encode', self.seconds + time.perf_counter() - start, nbytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ProjectionWriter:
+    """
+    Projects the frames of a time course into summary images, one frame at a time: the maximum intensity, the mean and
+    the standard deviation of every pixel across the frames, the latter showing where the sample moved. Only the
+    running maximum, and the running mean and sum of squared differences of Welford's algorithm are held in memory, so
+    the memory used stays about a few frames, whatever the number of timepoints.
+
+    The first frame sets the size of the projections (unless given), frames of a different size are padded (or
+    cropped) to it. Projections keep the channels and bit depth of the frames, the mean and the standard deviation
+    (of the sample, i.e. over n - 1) are rounded to it.
+    """
+
+    def __init__(self,
+                 filename: str,
+                 kinds: tuple = PROJECTIONS,
+                 size: tuple = None,
+                 encoder: Encoder = None):
+        """
+        Function that initialises the ProjectionWriter.
+
+        :param filename: custom filename, without the extension, the projections are exported as <filename>_<kind>
+        :param kinds: kinds of projections to make: max, mean and/or std
+        :param size: (width, height) of the projections, size of the first frame by default
+        :param encoder: format and preset of the projections (see encoder.Encoder), the default PNG if None
+        """
+        unknown = set(kinds) - set(PROJECTIONS)
+
+        if unknown:
+            raise ValueError(f"Unknown projection(s) {', '.join(sorted(unknown))}, expected {', '.join(PROJECTIONS)}.")
+
+        self.filename = filename
+        self.kinds = tuple(kind for kind in PROJECTIONS if kind in kinds)
+        self.size = size
+        self.encoder = encoder or Encoder()
+
+        self.count = 0  # frames written
+        self.dtype = None
+        self.max: np.ndarray = None
+        self.mean: np.ndarray = None  # running mean, as float32
+        self.m2: np.ndarray = None  # running sum of the squared differences from the mean, as float32
+
+    @property
+    def filenames(self) -> list:
+        """
+        Filenames of the projections, with their extension.
+        """
+        return [f"{self.filename}_{kind}.{self.encoder.extension}" for kind in self.kinds]
+
+    def write(self,
+              frame: np.ndarray):
+        """
+        Adds a frame to the projections.
+
+        :param frame: frame to add
+        """
+        if not self.kinds:
+            return
+
+        if self.size is None:
+            self.size = (frame.shape[1], frame.shape[0])
+
+        frame = pad_frame(frame, self.size)
+        self.dtype = self.dtype or frame.dtype
+        self.count += 1
+
+        if 'max' in self.kinds:
+            if self.max is None:
+                self.max = frame.copy()
+
+            else:
+                np.maximum(self.max, frame, out=self.max)
+
+        if 'mean' in self.kinds or 'std' in self.kinds:
+            x = frame.astype(np.float32)
+
+            if self.mean is None:
+                self.mean = x
+                self.m2 = np.zeros_like(x) if 'std' in self.kinds else None
+                return
+
+            delta = x - self.mean
+            self.mean += delta / self.count
+
+            if self.m2 is not None:
+                x -= self.mean
+                self.m2 += delta * x
+
+    def cast(self,
+             img: np.ndarray) -> np.ndarray:
+        """
+        Rounds a floating point projection to the type of the frames.
+
+        :param img: the projection
+        """
+        if self.dtype.kind not in 'ui':
+            return img.astype(self.dtype)
+
+        info = np.iinfo(self.dtype)
+
+        return np.clip(np.rint(img), info.min, info.max).astype(self.dtype)
+
+    @property
+    def projections(self) -> dict:
+        """
+        Projections of the frames written so far, by kind, empty if no frame was written.
+        """
+        if not self.count:
+            return {}
+
+        projections = {'max': self.max}
+
+        if self.mean is not None:
+            projections['mean'] = self.cast(self.mean)
+
+        if self.m2 is not None:
+            projections['std'] = self.cast(np.sqrt(self.m2 / max(self.count - 1, 1)))
+
+        return {kind: projections[kind] for kind in self.kinds}
+
+    def export(self) -> list:
+        """
+        Exports the projections of the frames written so far. Can be called again after more frames were written.
+
+        :return: filenames of the projections exported, empty if no frame was written
+        """
+        with profiling.stage('encode') as record:
+            for kind, img in self.projections.items():
+                record['bytes'] += self.encoder.write(img, f"{self.filename}_{kind}")
+
+        return self.filenames if self.count else []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:  # projections of some of the frames only would be misleading
+            self.export()
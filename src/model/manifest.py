@@ -0,0 +1,110 @@
+"""
+    This is the manifest module of the IBERS Image Merger program.
+    It keeps a record of the outputs made in an output directory, together with the inputs (paths, sizes and times of
+    modification) and the parameters they were made with, so that a repeated run can skip the outputs that are current.
+    """
+
+import json
+import os
+import threading
+import time
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class Manifest:
+    """
+    Record of the outputs of a directory, stored as a JSON file in the output directory.
+
+    Records are saved at most once per save_interval seconds while the run goes on, so that a run that dies partway
+    through only has to redo the outputs made in its last moments.
+    """
+
+    def __init__(self,
+                 outdir: str,
+                 save_interval: float = 1.0):
+        """
+        Function that initialises the Manifest, loading the records of the previous runs if there are any.
+
+        :param outdir: output directory the manifest belongs to
+        :param save_interval: minimum number of seconds between two saves of the manifest while recording
+        """
+        self.outdir = outdir
+        self.path = os.path.join(outdir, MANIFEST_NAME)
+        self.save_interval = save_interval
+
+        self.lock = threading.RLock()  # records can come from the writer threads of the pipelines
+        self.last_save = time.monotonic()
+
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+        except (OSError, ValueError):  # first run or unreadable manifest, everything gets rebuilt
+            self.entries = {}
+
+    @staticmethod
+    def signature(inputs: list,
+                  params: dict) -> dict:
+        """
+        Describes the inputs and parameters an output is made from.
+
+        :param inputs: paths to the input files
+        :param params: parameters of the output (e.g., dimensions of the grid)
+        :return: signature to compare with the records of the manifest
+        """
+        stats = []
+
+        for path in inputs:
+            st = os.stat(path)
+            stats.append([path, st.st_size, st.st_mtime_ns])
+
+        return {'inputs': stats, 'params': json.loads(json.dumps(params))}  # as it would be loaded from the file
+
+    def is_current(self,
+                   output: str,
+                   signature: dict) -> bool:
+        """
+        Checks whether an output was already made from the same inputs and parameters.
+
+        :param output: filename of the output, relative to the output directory
+        :param signature: signature as returned by signature()
+        """
+        entry = self.entries.get(output)
+
+        if entry is None or entry['inputs'] != signature['inputs'] or entry['params'] != signature['params']:
+            return False
+
+        # outputs that were deleted since have to be made again, groups that made no output do not
+        return not entry['exported'] or os.path.isfile(os.path.join(self.outdir, output))
+
+    def record(self,
+               output: str,
+               signature: dict,
+               exported: bool = True):
+        """
+        Records that an output was made.
+
+        :param output: filename of the output, relative to the output directory
+        :param signature: signature of the inputs and parameters the output was made from
+        :param exported: False if the inputs did not make an output (e.g., not enough images for the grid)
+        """
+        with self.lock:
+            self.entries[output] = dict(signature, exported=exported)
+
+            if time.monotonic() - self.last_save >= self.save_interval:
+                self.save()
+
+    def save(self):
+        """
+        Writes the manifest into the output directory. The file is replaced at once, so it is never left half written.
+        """
+        with self.lock:
+            tmp = f"{self.path}.tmp"
+
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f)
+
+            os.replace(tmp, self.path)
+            self.last_save = time.monotonic()
+
@@ -0,0 +1,178 @@
+"""
+    This is the pipeline module of the IBERS Image Merger program.
+    It contains the building blocks of the threaded pipelines, which overlap the reading of the files with the merging
+    and the writing of the outputs. OpenCV releases the GIL while decoding and encoding, so the stages run in parallel.
+    """
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+
+
+class Stage:
+    """
+    A worker thread that applies a function to every item put into its bounded queue, passing the results on to the
+    next stage, if any. Putting an item blocks while the queue is full, which bounds the memory held by the pipeline.
+
+    If the function raises, the remaining items are discarded and the error is raised by the next put() or close().
+    """
+
+    def __init__(self,
+                 func,
+                 depth: int = 2,
+                 downstream=None):
+        """
+        Function that initialises the Stage and starts its thread.
+
+        :param func: function to apply to every item
+        :param depth: number of items that can wait in the queue
+        :param downstream: stage to pass the results of the function to, results are discarded if None
+        """
+        self.func = func
+        self.downstream = downstream
+        self.q = Queue(maxsize=depth)
+        self.error: Exception = None
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """
+        Body of the thread of the stage.
+        """
+        while True:
+            item = self.q.get()
+
+            if item is self:  # the stage is closed
+                return
+
+            if self.error is not None:  # keep draining the queue so that producers do not block
+                continue
+
+            try:
+                result = self.func(item)
+
+                if self.downstream is not None:
+                    self.downstream.put(result)
+
+            except Exception as e:
+                self.error = e
+
+    def put(self,
+            item):
+        """
+        Queues an item to be processed by the stage.
+
+        :param item: item to process
+        """
+        if self.error is not None:
+            raise self.error
+
+        self.q.put(item)
+
+    def close(self):
+        """
+        Waits for all the queued items to be processed and stops the thread.
+        """
+        self.q.put(self)
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+
+class WriterPool:
+    """
+    A pool of threads that applies a function to every item put into it, like a Stage without a downstream, but with
+    several items processed at once and out of order. Used to encode and write the outputs behind the thread merging
+    them, so that merging the next group of files never waits for the encoder or the disk. Putting an item blocks while
+    depth items are waiting or being processed, which bounds the memory held by the merged images not written yet.
+
+    If the function raises, the remaining items are discarded and the error is raised by the next put() or close().
+    """
+
+    def __init__(self,
+                 func,
+                 workers: int = 2,
+                 depth: int = None):
+        """
+        Function that initialises the WriterPool.
+
+        :param func: function to apply to every item
+        :param workers: number of threads
+        :param depth: number of items that can be waiting or processed at once, twice the number of threads if None
+        """
+        self.func = func
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='writer')
+        self.slots = threading.Semaphore(depth or 2 * workers)
+        self.error: Exception = None
+
+    def run(self,
+            item):
+        """
+        Body of the task of a single item.
+        """
+        try:
+            if self.error is None:  # items queued behind a failed one are discarded
+                self.func(item)
+
+        except Exception as e:
+            self.error = self.error or e
+
+        finally:
+            self.slots.release()
+
+    def put(self,
+            item):
+        """
+        Queues an item to be processed by the pool.
+
+        :param item: item to process
+        """
+        if self.error is not None:
+            raise self.error
+
+        self.slots.acquire()
+        self.pool.submit(self.run, item)
+
+    def close(self):
+        """
+        Waits for all the queued items to be processed and stops the threads.
+        """
+        self.pool.shutdown(wait=True)
+
+        if self.error is not None:
+            raise self.error
+
+
+def read_ahead(pool,
+               paths: list,
+               read,
+               depth: int = 8):
+    """
+    Reads the given files on a pool of threads, keeping at most depth files in flight ahead of the consumer.
+
+    :param pool: thread pool to read the files with
+    :param paths: paths to the files, in order
+    :param read: function that reads a single file
+    :param depth: number of files read ahead
+    :return: yields the contents of the files in order
+    """
+    paths = iter(paths)
+    futures = deque()
+
+    for path in paths:
+        futures.append(pool.submit(read, path))
+
+        if len(futures) >= depth:
+            break
+
+    while futures:
+        result = futures.popleft().result()
+
+        for path in paths:  # top the read-ahead window up again
+            futures.append(pool.submit(read, path))
+            break
+
+        yield result
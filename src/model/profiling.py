@@ -0,0 +1,273 @@
+"""
+    This is the profiling module of the IBERS Image Merger program.
+    It records the wall time and the bytes of every stage of a run (scanning the input path, reading the files,
+    merging them, encoding the outputs), together with the peak memory, so that slow runs can be explained.
+    Recording is off unless enabled, in which case every process of the run keeps its own records, and the worker
+    processes send theirs back with their results (see remote()).
+    """
+
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_enabled = False
+_records = []
+_lock = threading.Lock()
+_local = threading.local()  # output the current thread works on
+
+
+def enable(trace_memory: bool = False):
+    """
+    Turns the recording on in the current process.
+
+    :param trace_memory: if True, also traces the peak memory allocated by Python and NumPy (through tracemalloc),
+    which slows the run down
+    """
+    global _enabled
+    _enabled = True
+
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def enabled() -> bool:
+    """
+    Checks whether the recording is on in the current process.
+    """
+    return _enabled
+
+
+@contextmanager
+def for_output(name: str):
+    """
+    Attributes the stages recorded by the current thread to the given output, until the block ends.
+
+    :param name: filename of the output
+    """
+    previous = getattr(_local, 'output', None)
+    _local.output = name
+
+    try:
+        yield
+
+    finally:
+        _local.output = previous
+
+
+@contextmanager
+def stage(name: str,
+          source: str = None):
+    """
+    Records the wall time of a block of work. The block can set the number of bytes it produced in the record.
+
+    :param name: name of the stage (e.g., scan, read, compose, encode)
+    :param source: path to the file the stage works on, if any
+    :return: the record of the stage, a dictionary
+    """
+    record = {'stage': name, 'output': getattr(_local, 'output', None), 'source': source, 'bytes': 0}
+
+    if not _enabled:
+        yield record
+        return
+
+    start = time.perf_counter()
+
+    try:
+        yield record
+
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        record['pid'] = os.getpid()
+
+        with _lock:
+            _records.append(record)
+
+
+def timed(name: str,
+          nbytes=None):
+    """
+    Decorator, which records every call of a method as a stage.
+
+    :param name: name of the stage
+    :param nbytes: function, which returns the number of bytes produced from the object the method was called on
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(obj, *args, **kwargs):
+            with stage(name) as record:
+                result = method(obj, *args, **kwargs)
+
+                if _enabled and nbytes is not None:
+                    record['bytes'] = nbytes(obj)
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def add(name: str,
+        seconds: float,
+        nbytes: int = 0):
+    """
+    Records a stage timed by the caller, e.g. work spread over many calls.
+
+    :param name: name of the stage
+    :param seconds: wall time of the stage
+    :param nbytes: number of bytes produced by the stage
+    """
+    if _enabled:
+        with _lock:
+            _records.append({'stage': name,
+                             'output': getattr(_local, 'output', None),
+                             'source': None,
+                             'bytes': nbytes,
+                             'seconds': seconds,
+                             'pid': os.getpid()})
+
+
+def drain() -> list:
+    """
+    Takes the records out of the current process.
+
+    :return: the records made since the last call
+    """
+    global _records
+
+    with _lock:
+        records, _records = _records, []
+
+    return records
+
+
+def extend(records: list):
+    """
+    Adds the records of another process (e.g., of a worker process) to the records of the current process.
+
+    :param records: records as returned by drain()
+    """
+    with _lock:
+        _records.extend(records)
+
+
+def remote(profile: bool,
+           func,
+           *args):
+    """
+    Runs a function inside a worker process, recording its stages if the run is profiled.
+
+    :param profile: True if the run is profiled, i.e. the result of enabled() in the main process
+    :param func: function to run
+    :param args: arguments of the function
+    :return: (result of the function, records of the stages it went through)
+    """
+    if profile:
+        enable()
+
+    drain()  # records copied from the main process, when the worker was forked from it
+
+    return func(*args), drain()
+
+
+def peak_rss() -> tuple:
+    """
+    Peak resident memory of the current process and of its (finished) child processes, in MiB.
+    """
+    if resource is None:
+        import psutil
+
+        return psutil.Process().memory_info().peak_wset / 2 ** 20, 0.0
+
+    # kilobytes on Linux, bytes on macOS
+    unit = 2 ** 20 if sys.platform == 'darwin' else 2 ** 10
+
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit)
+
+
+def memory() -> dict:
+    """
+    Peak memory of the run so far, in MiB.
+    """
+    rss, children = peak_rss()
+
+    return {'peak_rss_mib': rss,
+            'peak_rss_children_mib': children,
+            'peak_traced_mib': tracemalloc.get_traced_memory()[1] / 2 ** 20 if tracemalloc.is_tracing() else None}
+
+
+def write(path: str,
+          records: list,
+          seconds: float):
+    """
+    Writes the records of a run into a JSON Lines file, one record per line, followed by a line on the whole run.
+
+    :param path: path to the file
+    :param records: records of the run
+    :param seconds: wall time of the whole run
+    """
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+        f.write(json.dumps(dict({'stage': 'run', 'seconds': seconds}, **memory())) + '\n')
+
+
+def summary(records: list,
+            seconds: float) -> str:
+    """
+    Summarises the records of a run by the stage, and names the slowest outputs.
+
+    Times of the stages are summed over all the threads and processes of the run, so they can add up to more than
+    the wall time of the run.
+
+    :param records: records of the run
+    :param seconds: wall time of the whole run
+    :return: table of the stages, as text
+    """
+    stages = {}
+    outputs = {}
+
+    for r in records:
+        calls, total, nbytes = stages.get(r['stage'], (0, 0.0, 0))
+        stages[r['stage']] = calls + 1, total + r['seconds'], nbytes + r['bytes']
+
+        if r['output'] is not None:
+            outputs[r['output']] = outputs.get(r['output'], 0.0) + r['seconds']
+
+    lines = [f"{'stage':<10}{'calls':>8}{'seconds':>12}{'MiB':>12}{'MiB/s':>12}"]
+
+    for name, (calls, total, nbytes) in stages.items():
+        mib = nbytes / 2 ** 20
+        lines.append(f"{name:<10}{calls:>8}{total:>12.3f}{mib:>12.1f}{mib / total if total else 0:>12.1f}")
+
+    lines.append(f"{'run':<10}{'':>8}{seconds:>12.3f}")
+
+    if outputs:
+        lines.append('')
+        lines.append('Slowest outputs:')
+
+        for name, total in sorted(outputs.items(), key=lambda x: -x[1])[:5]:
+            lines.append(f"    {total:>8.3f} s  {name}")
+
+    mem = memory()
+    lines.append('')
+    lines.append(f"Peak RSS: {mem['peak_rss_mib']:.1f} MiB (main process), "
+                 f"{mem['peak_rss_children_mib']:.1f} MiB (largest worker process)")
+
+    if mem['peak_traced_mib'] is not None:
+        lines.append(f"Peak traced memory: {mem['peak_traced_mib']:.1f} MiB (main process)")
+
+    return '\n'.join(lines)
@@ -0,0 +1,107 @@
+"""
+    This is the progress module of the IBERS Image Merger program.
+    It contains a thread-safe aggregator of the progress of a run over several directories, which the workers update
+    cheaply from any thread and the user interface reads at its own, fixed rate.
+    """
+
+import threading
+import time
+from collections import deque
+
+
+class Progress:
+    """
+    Counts of the files processed in every directory of a run, together with the throughput and the estimated time
+    left, computed over the last few seconds of the run.
+    """
+
+    def __init__(self,
+                 window: float = 5.0):
+        """
+        Function that initialises the Progress object.
+
+        :param window: number of seconds the throughput is measured over
+        """
+        self.window = window
+        self.lock = threading.Lock()
+
+        self.dirs = {}  # key -> [files processed, total files]
+        self.started = time.monotonic()
+        self.samples = deque()  # (time, files processed) of the recent snapshots
+
+    def add_dir(self,
+                key,
+                total: int):
+        """
+        Registers a directory to be processed.
+
+        :param key: key of the directory
+        :param total: number of files in the directory
+        """
+        with self.lock:
+            self.dirs[key] = [0, total]
+
+    def advance(self,
+                key,
+                n: int = 1):
+        """
+        Counts files processed in a directory. Safe to call from any thread.
+
+        :param key: key of the directory
+        :param n: number of files processed
+        """
+        with self.lock:
+            self.dirs[key][0] += n
+
+    def finish(self,
+               key):
+        """
+        Marks a directory as processed, e.g. after it was cancelled or some of its files were skipped.
+
+        :param key: key of the directory
+        """
+        with self.lock:
+            self.dirs[key][0] = self.dirs[key][1]
+
+    def snapshot(self) -> dict:
+        """
+        Reads the progress of the run. Meant to be called at a fixed rate, which the throughput is sampled at.
+
+        :return: dictionary of:
+            dirs - key -> (files processed, total files) of every directory
+            done, total - files processed and total files of the whole run
+            dirs_done - number of directories processed
+            rate - files processed per second, over the last few seconds
+            eta - estimated number of seconds left, None until the rate is known
+            elapsed - number of seconds since the start of the run
+        """
+        with self.lock:
+            dirs = {key: tuple(counts) for key, counts in self.dirs.items()}
+
+        done = sum(d for d, _ in dirs.values())
+        total = sum(t for _, t in dirs.values())
+
+        now = time.monotonic()
+        self.samples.append((now, done))
+
+        while len(self.samples) > 2 and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+
+        then, before = self.samples[0]
+        rate = (done - before) / (now - then) if now > then else 0.0
+
+        return {'dirs': dirs,
+                'done': done,
+                'total': total,
+                'dirs_done': sum(1 for d, t in dirs.values() if d >= t),
+                'rate': rate,
+                'eta': (total - done) / rate if rate > 0 else None,
+                'elapsed': now - self.started}
+
+    @property
+    def finished(self) -> bool:
+        """
+        True once every directory was processed.
+        """
+        with self.lock:
+            return all(d >= t for d, t in self.dirs.values())
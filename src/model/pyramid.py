@@ -0,0 +1,82 @@
+"""
+    This is the pyramid module of the IBERS Image Merger program.
+    It writes images as DeepZoom tile pyramids (a .dzi descriptor and a folder of tiles for every level), which
+    viewers such as OpenSeadragon open at once and load tile by tile, only for the part of the image on the screen.
+    """
+
+import os
+import shutil
+
+import cv2
+import numpy as np
+
+DZI = '''<?xml version="1.0" encoding="UTF-8"?>
+<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{format}" Overlap="0" TileSize="{tile_size}">
+    <Size Width="{width}" Height="{height}"/>
+</Image>
+'''
+
+
+def halve(img: np.ndarray) -> np.ndarray:
+    """
+    Halves the resolution of an image by averaging every 2x2 block of its pixels, in a single vectorised pass.
+    Images of an odd width or height have their last column or row repeated, so the result is rounded up.
+
+    :param img: image to reduce
+    :return: the reduced image, of the same number of channels and data type
+    """
+    h, w = img.shape[:2]
+
+    if h % 2 or w % 2:
+        img = np.pad(img, ((0, h % 2), (0, w % 2)) + ((0, 0),) * (img.ndim - 2), mode='edge')
+
+    blocks = img.reshape((img.shape[0] // 2, 2, img.shape[1] // 2, 2) + img.shape[2:])
+
+    if np.issubdtype(img.dtype, np.integer):  # rounded to the nearest value
+        acc = np.uint32 if img.dtype.kind == 'u' and img.dtype.itemsize <= 2 else np.int64
+
+        return ((blocks.sum(axis=(1, 3), dtype=acc) + 2) // 4).astype(img.dtype)
+
+    return blocks.mean(axis=(1, 3)).astype(img.dtype)
+
+
+def write_pyramid(img: np.ndarray,
+                  filename: str,
+                  tile_size: int = 256,
+                  extension: str = 'png'):
+    """
+    Writes an image as a DeepZoom pyramid: <filename>.dzi and <filename>_files/<level>/<column>_<row>.<extension>.
+
+    The last level holds the image at its full resolution, every level below it half the resolution of the one above
+    (see halve()), down to level 0 of a single pixel. Levels are reduced from each other, so the files the image was
+    made of are never read again.
+
+    :param img: image to write
+    :param filename: output filename, without the extension
+    :param tile_size: width and height of the tiles, in pixels
+    :param extension: format of the tiles
+    :return: number of bytes of the tiles written
+    """
+    height, width = img.shape[:2]
+    levels = (max(width, height) - 1).bit_length() + 1
+
+    tiles = f"{filename}_files"
+    nbytes = 0
+    shutil.rmtree(tiles, ignore_errors=True)  # tiles of a previous, possibly larger, image
+
+    for level in reversed(range(levels)):
+        os.makedirs(os.path.join(tiles, str(level)))
+
+        for y in range(0, img.shape[0], tile_size):
+            for x in range(0, img.shape[1], tile_size):
+                tile = os.path.join(tiles, str(level), f"{x // tile_size}_{y // tile_size}.{extension}")
+                cv2.imwrite(tile, img[y:y + tile_size, x:x + tile_size])
+                nbytes += os.path.getsize(tile)
+
+        if level:
+            img = halve(img)
+
+    with open(f"{filename}.dzi", 'w') as f:
+        f.write(DZI.format(format=extension, tile_size=tile_size, width=width, height=height))
+
+    return nbytes
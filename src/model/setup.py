@@ -3,11 +3,21 @@ This module sets up the logic of accessing and creating images using ImageGroupe
 """
 
 import os
-import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import partial
 
 import cv2
+import numpy as np
 
 import src.model.image_grouper as model
+import src.model.profiling as profiling
+from src.model.catalog import PlateCatalog
+from src.model.encoder import DEFAULT_FORMAT, DEFAULT_PRESET, Encoder
+from src.model.frames import pad_frame, prefetch, read_image, read_size
+from src.model.htd import FILENAME
+from src.model.manifest import Manifest
+from src.model.pipeline import Stage, WriterPool, read_ahead
+from src.model.tiff import TiffWriter
 
 
 def inpath_type(inpath: str):
@@ -18,28 +28,7 @@ def inpath_type(inpath: str):
 
     :param inpath: path to check
     """
-    frame_dirs = []
-
-    for root, dirs, files in os.walk(inpath):
-        # grid
-        if root == inpath and len(dirs) == 0 and all(x.lower().endswith(('tif', 'png', 'jpg', 'htd')) for x in files):
-            return True
-
-        # stack root
-        elif root == inpath and len(files) == 1 and all(x.lower().endswith('htd') for x in files) and all(
-                re.search(r'\d+$', x) for x in dirs):  # if dir name is of correct format
-            frame_dirs = dirs
-            continue
-
-        # stack folders
-        elif os.path.split(root)[-1] in frame_dirs and len(dirs) == 0 and all(
-                x.lower().endswith(('tif', 'png', 'jpg', 'htd')) for x in files):
-            continue
-
-        else:
-            return None
-
-    return False
+    return PlateCatalog(inpath).mode
 
 
 def get_total_files(path: str,
@@ -53,126 +42,832 @@ def get_total_files(path: str,
     :param dirs: True if path contains further directories in it
     :return: number of files in the input path
     """
-    s = 0
+    return PlateCatalog(path).total_files if files or dirs else 0
+
+
+def group_files(files: list):
+    """
+    Splits the files of a grid directory into the groups that should be merged together, following the naming
+    convention of the Roboworm platform (site number as the last character of the name, well row letter before it).
+
+    :param files: sorted names of the image files in the input path
+    :return: list of (output filename, list of file names) tuples, in the order of processing
+    """
+    groups = []
+    temp = []
+    lab: str = ''
+    provisional_filename: str = ''
+
+    for file in files:
+        try:
+            if file[:-4][-1] == '1' and len(temp) != 0:
+                groups.append((provisional_filename, temp))
+                temp = []
+
+            if len(temp) == 0 and file[:-4][-1] == '1':
+                lab = file[-10]  # A, B, C in the name
+
+            if file[-10] != lab:
+                continue
+
+            provisional_filename = f"{file[:-4][:-3]}_grid"
+            temp.append(file)
+
+        except IndexError:
+            continue
+
+    if len(temp) > 1:
+        groups.append((provisional_filename, temp))
+
+    return groups
+
+
+def plan_groups(catalog: PlateCatalog):
+    """
+    Splits the files of a grid directory into the groups that should be merged together: one group per well of the
+    plate layout, or by the naming convention if the plate has no usable .HTD file (see group_files()).
+
+    :param catalog: catalog of the input path
+    :return: list of (output filename, list of file names) tuples, in the order of processing
+    """
+    files = catalog.files  # files in dir without thumbnail variants of images
+
+    return (catalog.layout.group(files) if catalog.layout is not None else []) or group_files(files)
+
+
+def process_grid(temp: list,
+                 filename: str = "test",
+                 dim_x: int = 2,
+                 dim_y: int = 2,
+                 background: tuple = (255, 255, 255),
+                 gutter: int = 0,
+                 pyramid: bool = False,
+                 encoder: Encoder = None):
+    """
+    Create an ImageGrouper object and pass the files to be merged together.
+
+    :param temp: the images to merge together
+    :param filename: filename
+    :param dim_x: columns
+    :param dim_y: rows
+    :param background: colour (BGR) of the gutters and padding of the grid
+    :param gutter: width of the gap between the files in the grid, in pixels
+    :param pyramid: if True, exports the merged image as a DeepZoom tile pyramid instead of a PNG
+    :param encoder: format and preset of the merged image (see encoder.Encoder), the default PNG if None
+    :return: True if the merged image was exported, False if the files did not fit the grid
+    """
 
-    if files:
-        s = len([x for x in os.listdir(path) if 'Thumb' not in x and 'HTD' not in x])
+    ig = model.ImageGrouper(temp[:dim_x * dim_y])
 
-    elif dirs:
-        ds = [os.path.join(path, x) for x in os.listdir(path) if os.path.isdir(os.path.join(path, x))]
-        filenames = [x for x in os.listdir(ds[0]) if 'Thumb' not in x and 'HTD' not in x]
-        # not accurate number of files, but alligns with the count produced as a result of fetch_dirs() generator
-        s = len(ds) * len(filenames)
+    export = ig.grid(size_x=dim_x, size_y=dim_y, background=background, gutter=gutter)
+    if export and pyramid:
+        ig.export_pyramid(filename=filename)
 
-        # accurate number of files if needed
-        # for d in ds:
-        #     s += len([x for x in os.listdir(d) if 'Thumb' not in x and 'HTD' not in x])
+    elif export:
+        ig.export_image(filename=filename, encoder=encoder)
 
-    return s
+    return export
+
+
+def stream_grid(paths: list,
+                filename: str = "test",
+                dim_x: int = 2,
+                dim_y: int = 2,
+                background: tuple = (255, 255, 255),
+                gutter: int = 0,
+                read=cv2.imread,
+                size=read_size):
+    """
+    Merges a group of files into a grid written as a strip TIFF (BigTIFF if it grows over 4 GiB), one row of the grid
+    at a time: only the files of the current row are decoded and merged, then written at the bottom of the TIFF, so
+    the memory used stays about the size of a single row of the grid, whatever the number of rows.
+
+    The width of every column is the largest width of its files, as in ImageGrouper.grid(), which is read from the
+    headers of the files before the first row is written, and narrower files are padded to it.
+
+    :param paths: paths to the files to merge together
+    :param filename: output filename, without the extension
+    :param dim_x: columns
+    :param dim_y: rows
+    :param background: colour (BGR) of the gutters and padding of the grid
+    :param gutter: width of the gap between the files in the grid, in pixels
+    :param read: function that reads a single file (see frames.read_image())
+    :param size: function that gives the (width, height) of a file as read by read, without decoding it (see
+    frames.read_size())
+    :return: yields 1 whenever a file is read; returns True if the merged image was exported, False if the files did
+    not fit the grid
+    """
+    paths = paths[:dim_x * dim_y]
+
+    if len(paths) != dim_x * dim_y:  # Number of images selected does not match number of images required
+        return False
+
+    sizes = [size(path) for path in paths]
+
+    for path, found in zip(paths, sizes):
+        if found is None:
+            raise ValueError(f"Could not read the size of {path}.")
+
+    col_widths = np.array([width for width, _ in sizes]).reshape(dim_y, dim_x).max(axis=0)
+    writer = None
+
+    try:
+        for y in range(dim_y):
+            temp = []
+
+            for x, path in enumerate(paths[y * dim_x:(y + 1) * dim_x]):
+                yield 1
+                img = read(path)
+
+                if img.shape[1] > col_widths[x]:  # never crop a file to the layout
+                    raise ValueError(f"{path} is {img.shape[1]} pixels wide, while its header gave "
+                                     f"{sizes[y * dim_x + x][0]}.")
+
+                temp.append(pad_frame(img, (col_widths[x], img.shape[0]),
+                                      model.ImageGrouper.fill_value(background, img)))
+
+            ig = model.ImageGrouper(temp)
+            ig.grid(size_x=dim_x, size_y=1, background=background, gutter=gutter)
+            row = ig.merged_image
+            fill = ig.fill_value(background, row)
+
+            if writer is None:
+                writer = TiffWriter(f"{filename}.tif", row.shape[1], row.shape[2] if row.ndim == 3 else 1, row.dtype)
+
+            with profiling.stage('encode') as record:
+                if y and gutter:
+                    writer.write(np.full((gutter, writer.width) + row.shape[2:], fill, dtype=row.dtype))
+
+                writer.write(row)
+                record['bytes'] = row.nbytes
+
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return True
+
+
+def exhaust(generator):
+    """
+    Runs a generator to its end, discarding what it yields.
+
+    :param generator: generator to run
+    :return: the value returned by the generator
+    """
+    while True:
+        try:
+            next(generator)
+
+        except StopIteration as e:
+            return e.value
+
+
+def release(executor: ProcessPoolExecutor,
+            futures: dict,
+            owned: bool):
+    """
+    Stops the work sent to a pool of worker processes, e.g. once it is done or when the consumer stopped early.
+
+    :param executor: the pool
+    :param futures: futures of the work sent to the pool
+    :param owned: if True, the pool was started for this work only and is shut down, otherwise only the work not
+    started yet is cancelled and the pool is kept running
+    """
+    if owned:
+        executor.shutdown(wait=True, cancel_futures=True)
+        return
+
+    for future in futures:
+        future.cancel()
+
+
+def grid_worker(path: str,
+                group: list,
+                filename: str,
+                dim_x: int,
+                dim_y: int,
+                background: tuple = (255, 255, 255),
+                gutter: int = 0,
+                read=cv2.imread,
+                tiff: bool = False,
+                pyramid: bool = False,
+                encoder: Encoder = None,
+                size=read_size):
+    """
+    Reads, merges and exports a single group of files. Runs inside a worker process of the grid pool.
+
+    :param path: input path
+    :param group: names of the files to merge together
+    :param filename: output filename
+    :param dim_x: columns
+    :param dim_y: rows
+    :param background: colour (BGR) of the gutters and padding of the grid
+    :param gutter: width of the gap between the files in the grid, in pixels
+    :param read: function that reads a single file (see frames.read_image())
+    :param tiff: if True, writes the grid as a strip TIFF, one row at a time (see stream_grid())
+    :param pyramid: if True, exports the grid as a DeepZoom tile pyramid instead of a PNG
+    :param encoder: format and preset of the grid (see encoder.Encoder), the default PNG if None
+    :param size: function that gives the size of a file as read by read, for strip TIFFs (see frames.read_size())
+    :return: True if the merged image was exported
+    """
+    with profiling.for_output(os.path.basename(filename)):
+        if tiff:
+            return exhaust(stream_grid([os.path.join(path, file) for file in group],
+                                       filename=filename,
+                                       dim_x=dim_x,
+                                       dim_y=dim_y,
+                                       background=background,
+                                       gutter=gutter,
+                                       read=read,
+                                       size=size))
+
+        return process_grid([read(os.path.join(path, file)) for file in group],
+                            filename=filename,
+                            dim_x=dim_x,
+                            dim_y=dim_y,
+                            background=background,
+                            gutter=gutter,
+                            pyramid=pyramid,
+                            encoder=encoder)
+
+
+def write_grid(outdir: str,
+               pyramid: bool,
+               encoder: Encoder,
+               on_written,
+               item: tuple):
+    """
+    Exports a merged grid. Runs in a writer thread (see pipeline.WriterPool).
+
+    :param outdir: directory to export the merged image into
+    :param pyramid: if True, exports the merged image as a DeepZoom tile pyramid instead of an image
+    :param encoder: format and preset of the merged image (see encoder.Encoder), the default PNG if None
+    :param on_written: function called with the output filename of the group and whether the group was exported,
+    if not None
+    :param item: (ImageGrouper holding the merged grid, None if the files did not fit the grid; output filename) tuple
+    """
+    ig, provisional_filename = item
+
+    with profiling.for_output(provisional_filename):
+        if ig is not None and pyramid:
+            ig.export_pyramid(filename=os.path.join(outdir, provisional_filename))
+
+        elif ig is not None:
+            ig.export_image(filename=os.path.join(outdir, provisional_filename), encoder=encoder)
+
+    if on_written is not None:
+        on_written(provisional_filename, ig is not None)
+
+
+def pipeline_groups(path: str,
+                    groups: list,
+                    outdir: str,
+                    dim_x: int,
+                    dim_y: int,
+                    background: tuple = (255, 255, 255),
+                    gutter: int = 0,
+                    read=cv2.imread,
+                    readers: int = 4,
+                    depth: int = 8,
+                    on_written=None,
+                    pyramid: bool = False,
+                    encoder: Encoder = None,
+                    writers: int = 2):
+    """
+    Merges the groups of files through a threaded pipeline: a pool of reader threads prefetches the upcoming files,
+    a compose thread merges a group while the next one is being read, and a pool of writer threads encodes and exports
+    the merged images behind them. Every stage has a bounded queue, so only a few groups are held in memory at once.
+
+    :param path: input path
+    :param groups: groups of files as returned by group_files()
+    :param outdir: directory to export the merged images into
+    :param dim_x: columns
+    :param dim_y: rows
+    :param background: colour (BGR) of the gutters and padding of the grid
+    :param gutter: width of the gap between the files in the grid, in pixels
+    :param read: function that reads a single file (see frames.read_image())
+    :param readers: number of reader threads
+    :param depth: number of files read ahead of the one being consumed
+    :param on_written: function called from a writer thread with the output filename of every group and whether
+    the group was exported
+    :param pyramid: if True, exports the merged images as DeepZoom tile pyramids instead of PNGs
+    :param encoder: format and preset of the merged images (see encoder.Encoder), the default PNG if None
+    :param writers: number of writer threads
+    :return: yields 1 whenever a file is read
+    """
+
+    def compose(item):
+        temp, provisional_filename = item
+        ig = model.ImageGrouper(temp[:dim_x * dim_y])
+
+        with profiling.for_output(provisional_filename):
+            return ig if ig.grid(size_x=dim_x, size_y=dim_y, background=background, gutter=gutter) else None, \
+                provisional_filename
+
+    writer = WriterPool(partial(write_grid, outdir, pyramid, encoder, on_written), workers=writers)
+    composer = Stage(compose, depth=2, downstream=writer)
+
+    try:
+        with ThreadPoolExecutor(max_workers=readers) as pool:
+            images = read_ahead(pool,
+                                [os.path.join(path, file) for _, group in groups for file in group],
+                                read,
+                                depth=depth)
+
+            for provisional_filename, group in groups:
+                temp = []
+
+                for _ in group:
+                    yield 1
+                    temp.append(next(images))
+
+                composer.put((temp, provisional_filename))
+
+    finally:
+        try:
+            composer.close()
+
+        finally:
+            writer.close()
 
 
 def fetch_files(path: str,
                 outpath: str,
                 dim_x: int,
-                dim_y: int):
+                dim_y: int,
+                jobs: int = 1,
+                background: tuple = (255, 255, 255),
+                gutter: int = 0,
+                pipeline: bool = False,
+                scale: int = 1,
+                native: bool = False,
+                incremental: bool = False,
+                catalog: PlateCatalog = None,
+                tiff: bool = False,
+                pyramid: bool = False,
+                pool: ProcessPoolExecutor = None,
+                fmt: str = DEFAULT_FORMAT,
+                preset: str = DEFAULT_PRESET):
     """
     Identifies images that should be merged together via the naming convention.
 
+    With more than one job, the groups are found first and then sent as a whole to a pool of worker processes,
+    each of which reads, merges and exports its group. With a single job, the grids are encoded and written on a pool
+    of writer threads behind the merging of the next groups, and the groups can be processed through a threaded
+    pipeline, overlapping the reading as well (see pipeline_groups()).
+
     :param path: input path
     :param outpath: output path
     :param dim_x: columns
     :param dim_y: rows
-    :return: yields 1 whenever a file is processed
+    :param jobs: number of worker processes, 1 processes the groups in the current process
+    :param background: colour (BGR) of the gutters and padding of the grid, white by default
+    :param gutter: width of the gap between the files in the grid, in pixels
+    :param pipeline: if True and running a single job, processes the groups through a threaded pipeline
+    :param scale: factor (1, 2, 4 or 8) to reduce the resolution of the files by while reading them
+    :param native: if True, keeps the native channels and bit depth of the files instead of converting to 8-bit BGR
+    :param incremental: if True, skips the groups that were merged from the same files and parameters before,
+    according to the manifest in the output directory (see manifest.Manifest)
+    :param catalog: catalog of the input path, if it was scanned already
+    :param tiff: if True, writes the grids as strip TIFFs composed one row at a time instead of PNGs, which bounds the
+    memory used by very large grids (see stream_grid()); the threaded pipeline is not used then
+    :param pyramid: if True, exports the grids as DeepZoom tile pyramids (.dzi) instead of PNGs, unless writing TIFFs
+    :param pool: pool of worker processes to send the groups to, which is kept running afterwards (e.g., by a daemon);
+    a new pool of the given number of jobs is started if None
+    :param fmt: format of the grids: png, jpeg (jpg) or webp, unless writing TIFFs or pyramids
+    :param preset: preset of the encoder of the grids: fast, balanced or small (see encoder.PRESETS)
+    :return: yields the number of files processed whenever a file (or a group of files in parallel mode) is processed
     """
 
-    def process(temp: list,
-                filename: str = "test",
-                dim_x: int = 2,
-                dim_y: int = 2):
+    catalog = catalog or PlateCatalog(path)
+    groups = plan_groups(catalog)
+    skipped = len(catalog.files) - sum(len(group) for _, group in groups)  # files not belonging to any group
 
-        """
-        Create an ImageGrouper object and pass the files to be merged together.
+    dir_ref = f"{path.split('/')[-1]}_out"
+    os.makedirs(os.path.join(outpath, dir_ref), exist_ok=True)
 
-        :param temp: the images to merge together
-        :param filename: filename
-        :param dim_x: columns
-        :param dim_y: rows
-        :return:
-        """
+    read = partial(read_image, scale=scale, native=native)
+    size = partial(read_size, scale=scale, native=native)
+    encoder = Encoder(fmt, preset)
+    extension = 'tif' if tiff else 'dzi' if pyramid else encoder.extension
+
+    manifest = Manifest(os.path.join(outpath, dir_ref)) if incremental else None
+    signatures = {}
+
+    if manifest is not None:  # skip the groups, which outputs were made from the same files and parameters before
+        params = {'dims': [dim_x, dim_y], 'background': background, 'gutter': gutter, 'scale': scale, 'native': native}
+
+        if not (tiff or pyramid):
+            params.update(encoder.signature)
+
+        signatures = {name: Manifest.signature([os.path.join(path, file) for file in group], params)
+                      for name, group in groups}
+
+        current = {name for name, _ in groups if manifest.is_current(f"{name}.{extension}", signatures[name])}
+        skipped += sum(len(group) for name, group in groups if name in current)
+        groups = [(name, group) for name, group in groups if name not in current]
+
+    def done(provisional_filename: str,
+             exported: bool):
+        if manifest is not None:
+            manifest.record(f"{provisional_filename}.{extension}", signatures[provisional_filename], exported)
+
+    try:
+        if (jobs > 1 or pool is not None) and len(groups) > 1:
+            executor = pool or ProcessPoolExecutor(max_workers=min(jobs, len(groups)))
+            futures = {}
+
+            try:
+                futures = {executor.submit(profiling.remote,
+                                           profiling.enabled(),
+                                           grid_worker,
+                                           path,
+                                           group,
+                                           os.path.join(outpath, dir_ref, provisional_filename),
+                                           dim_x,
+                                           dim_y,
+                                           background,
+                                           gutter,
+                                           read,
+                                           tiff,
+                                           pyramid,
+                                           encoder,
+                                           size): (provisional_filename, group)
+                           for provisional_filename, group in groups}
+
+                for future in as_completed(futures):
+                    provisional_filename, group = futures[future]
+                    exported, records = future.result()
+                    profiling.extend(records)
+                    done(provisional_filename, exported)
+                    yield len(group)
+
+            finally:
+                release(executor, futures, pool is None)
+
+        elif tiff:
+            for provisional_filename, group in groups:
+                with profiling.for_output(provisional_filename):
+                    exported = yield from stream_grid([os.path.join(path, file) for file in group],
+                                                      filename=os.path.join(outpath, dir_ref, provisional_filename),
+                                                      dim_x=dim_x,
+                                                      dim_y=dim_y,
+                                                      background=background,
+                                                      gutter=gutter,
+                                                      read=read,
+                                                      size=size)
+
+                done(provisional_filename, exported)
+
+                used = dim_x * dim_y if len(group) >= dim_x * dim_y else 0  # files read by stream_grid()
+
+                if len(group) > used:  # ticks of the files left out of the grid
+                    yield len(group) - used
+
+        elif pipeline:
+            yield from pipeline_groups(path,
+                                       groups,
+                                       os.path.join(outpath, dir_ref),
+                                       dim_x,
+                                       dim_y,
+                                       background=background,
+                                       gutter=gutter,
+                                       read=read,
+                                       on_written=done,
+                                       pyramid=pyramid,
+                                       encoder=encoder)
 
-        ig = model.ImageGrouper(temp[:dim_x * dim_y])
+        else:
+            writer = WriterPool(partial(write_grid, os.path.join(outpath, dir_ref), pyramid, encoder, done))
 
-        export = ig.grid(size_x=dim_x, size_y=dim_y)
-        if export:
-            ig.export_image(filename=filename)
+            try:
+                for provisional_filename, group in groups:
+                    temp = []
 
-    # get files in dir while amending thumbnail variants of images
-    files = [x for x in os.listdir(path) if 'thumb' not in x.lower() and 'htd' not in x.lower()]
-    files = sorted(files)
+                    with profiling.for_output(provisional_filename):
+                        for file in group:
+                            yield 1
+                            temp.append(read(os.path.join(path, file)))
+
+                        ig = model.ImageGrouper(temp[:dim_x * dim_y])
+                        exported = ig.grid(size_x=dim_x, size_y=dim_y, background=background, gutter=gutter)
+
+                    writer.put((ig if exported else None, provisional_filename))
+
+            finally:
+                writer.close()
+
+    finally:
+        if manifest is not None:
+            manifest.save()
+
+    if skipped:
+        yield skipped
+
+
+def plan_montage(catalog: PlateCatalog):
+    """
+    Places the files of a plate on the montage of the plate, following the layout from its .HTD file. Montages of
+    stacks are made from the first timepoint.
+
+    :param catalog: catalog of the input path
+    :return: list of (path to the file, (well row, well column, site row, site column)) tuples, which places the
+    wells relative to the first row and column of the plate with a well imaged; empty if the plate has no layout
+    """
+    layout = catalog.layout
+
+    if layout is None:
+        return []
+
+    if catalog.mode:
+        paths = {f: os.path.join(catalog.path, f) for f in catalog.files}
+
+    else:
+        paths = {f: catalog.index[f][catalog.dirs[0]] for f in catalog.filenames}
+
+    plan = [(layout.position(well), layout.site_position(site), paths[f])
+            for well, found in layout.plan(list(paths)).items()
+            for site, f in found]
+
+    if not plan:
+        return []
+
+    top = min(well[0] for well, _, _ in plan)
+    left = min(well[1] for well, _, _ in plan)
+
+    return [(path, (well[0] - top, well[1] - left) + site) for well, site, path in plan]
+
+
+def fetch_montage(path: str,
+                  outpath: str,
+                  background: tuple = (255, 255, 255),
+                  gutter: int = 0,
+                  scale: int = 1,
+                  native: bool = False,
+                  incremental: bool = False,
+                  catalog: PlateCatalog = None,
+                  readers: int = 4,
+                  pyramid: bool = False,
+                  fmt: str = DEFAULT_FORMAT,
+                  preset: str = DEFAULT_PRESET):
+    """
+    Makes an overview image of the whole plate (<plate>_montage.png by default), which places the site grid of every well at the
+    position of the well on the plate (see plan_montage() and ImageGrouper.montage()).
+
+    :param path: input path
+    :param outpath: output path
+    :param background: colour (BGR) of the gutters and padding of the montage, white by default
+    :param gutter: width of the gap between the wells in the montage, in pixels
+    :param scale: factor (1, 2, 4 or 8) to reduce the resolution of the files by while reading them
+    :param native: if True, keeps the native channels and bit depth of the files instead of converting to 8-bit BGR
+    :param incremental: if True, skips the montage if it was made from the same files and parameters before
+    :param catalog: catalog of the input path, if it was scanned already
+    :param readers: number of threads reading the files
+    :param pyramid: if True, exports the montage as a DeepZoom tile pyramid (<plate>_montage.dzi) instead of a PNG
+    :param fmt: format of the montage: png, jpeg (jpg) or webp, unless exporting a pyramid
+    :param preset: preset of the encoder of the montage: fast, balanced or small (see encoder.PRESETS)
+    :return: yields 1 whenever a file is read
+    """
+    catalog = catalog or PlateCatalog(path)
+    plan = plan_montage(catalog)
+
+    if not plan:
+        return
 
-    temp = []
-    lab: str = ''
-    provisional_filename: str = ''
     dir_ref = f"{path.split('/')[-1]}_out"
     os.makedirs(os.path.join(outpath, dir_ref), exist_ok=True)
 
-    for file in files:
-        yield 1
+    name = f"{FILENAME.match(os.path.basename(plan[0][0]))['prefix']}_montage"
+    paths, positions = zip(*plan)
 
-        try:
-            if file[:-4][-1] == '1' and len(temp) != 0:
-                process(temp, filename=os.path.join(outpath, dir_ref, provisional_filename), dim_x=dim_x, dim_y=dim_y)
-                temp.clear()
+    encoder = Encoder(fmt, preset)
+    extension = 'dzi' if pyramid else encoder.extension
+    manifest = Manifest(os.path.join(outpath, dir_ref)) if incremental else None
 
-            if len(temp) == 0 and file[:-4][-1] == '1':
-                lab = file[-10]  # A, B, C in the name
+    if manifest is not None:
+        params = {'background': background, 'gutter': gutter, 'scale': scale, 'native': native}
+        signature = Manifest.signature(paths, params if pyramid else dict(params, **encoder.signature))
 
-            if file[-10] != lab:
-                continue
+        if manifest.is_current(f"{name}.{extension}", signature):
+            yield len(paths)
+            return
 
-            provisional_filename = f"{file[:-4][:-3]}_grid"
-            temp.append(cv2.imread(os.path.join(path, file)))
+    read = partial(read_image, scale=scale, native=native)
+    temp = []
 
-        except IndexError:
-            continue
+    with ThreadPoolExecutor(max_workers=readers) as pool:
+        for img in read_ahead(pool, paths, read):
+            yield 1
+            temp.append(img)
 
-    if len(temp) > 1:
-        process(temp, os.path.join(outpath, dir_ref, provisional_filename), dim_x, dim_y)
+    ig = model.ImageGrouper(temp)
+
+    with profiling.for_output(name):
+        if ig.montage(positions, background=background, gutter=gutter):
+            if pyramid:
+                ig.export_pyramid(filename=os.path.join(outpath, dir_ref, name))
+
+            else:
+                ig.export_image(filename=os.path.join(outpath, dir_ref, name), encoder=encoder)
+
+    if manifest is not None:
+        manifest.record(f"{name}.{extension}", signature)
+        manifest.save()
+
+
+def stack_worker(frames: list,
+                 filename: str,
+                 framerate: int,
+                 gif: bool,
+                 stream: bool = False,
+                 read=cv2.imread,
+                 projection: tuple = (),
+                 encoder: Encoder = None):
+    """
+    Reads the frames of a single file and writes its animation, and its projections if any. Runs inside a worker
+    process of the stack pool.
+
+    :param frames: paths to the frames of the animation, in order
+    :param filename: output filename
+    :param framerate: framerate of the animation
+    :param gif: if True, animation returned is in GIF format, MP4 otherwise
+    :param stream: if True, frames are decoded in the background and written one by one instead of all at once
+    :param read: function that reads a single frame (see frames.read_image())
+    :param projection: kinds of temporal projections to make from the frames as well, exported as <filename>_<kind>
+    (see image_grouper.ProjectionWriter)
+    :param encoder: format and preset of the projections (see encoder.Encoder), the default PNG if None
+    :return: number of frames written
+    """
+    with profiling.for_output(os.path.basename(filename)):
+        if stream:
+            with model.AnimationWriter(filename, framerate=framerate, gif=gif) as writer, \
+                    model.ProjectionWriter(filename, kinds=projection, encoder=encoder) as projector:
+                for frame in prefetch(frames, read=read):
+                    writer.write(frame)
+                    projector.write(frame)
+
+            return len(frames)
+
+        temp = [read(frame) for frame in frames]
+
+        ig = model.ImageGrouper(temp)
+        ig.animation(framerate=framerate, gif=gif, filename=filename)
+
+        if projection:
+            ig.projection(projection, filename=filename, encoder=encoder)
+
+        return len(temp)
 
 
 def fetch_dirs(path: str,
                outpath: str,
                gif: bool = False,
-               framerate: int = 1):
+               framerate: int = 1,
+               jobs: int = 1,
+               stream: bool = False,
+               scale: int = 1,
+               native: bool = False,
+               incremental: bool = False,
+               catalog: PlateCatalog = None,
+               pool: ProcessPoolExecutor = None,
+               projection: tuple = (),
+               fmt: str = DEFAULT_FORMAT,
+               preset: str = DEFAULT_PRESET):
     """
     Initialises creation of the animations through fetching the frames one by one for all files in
-    the input path/frame1 folders (e.g., Samples/Timepoint_1).
+    the input path/frame1 folders (e.g., Samples/Timepoint_1). Frame folders are listed once into the catalog of the
+    input path, which index of the frames drives the gathering of the frames of every file.
+
+    With more than one job, every file is sent to a pool of worker processes, each of which gathers its frames
+    across the frame folders and writes the animation on its own.
+
+    Temporal projections of the frames (<file>_stack_<kind>, e.g. the maximum intensity) are made in the same pass as
+    the animations, from the same frames; streamed, they are accumulated frame by frame as well.
 
     :param path: input path
     :param outpath: output path
     :param gif: if True, animation returned is in GIF format, MP4 otherwise
     :param framerate: sets up framerate, 1 by default
-
-    :return yields 1 whenever a new file is being processed
+    :param jobs: number of worker processes, 1 processes the files in the current process
+    :param stream: if True, frames are decoded in a background thread and passed straight into the encoder, so only
+    a few frames of an animation are held in memory at once
+    :param scale: factor (1, 2, 4 or 8) to reduce the resolution of the frames by while reading them
+    :param native: if True, keeps the native channels and bit depth of the frames until they are encoded
+    :param incremental: if True, skips the files which animations were made from the same frames and parameters
+    before, according to the manifest in the output directory (see manifest.Manifest)
+    :param catalog: catalog of the input path, if it was scanned already
+    :param pool: pool of worker processes to send the files to, which is kept running afterwards (e.g., by a daemon);
+    a new pool of the given number of jobs is started if None
+    :param projection: kinds of temporal projections to make as well: max, mean and/or std
+    :param fmt: format of the projections: png, jpeg (jpg) or webp
+    :param preset: preset of the encoder of the projections: fast, balanced or small (see encoder.PRESETS)
+
+    :return yields the number of frames processed whenever a new frame (or a whole file in parallel mode) is processed
     """
 
-    dirs = [os.path.join(path, x) for x in os.listdir(path) if os.path.isdir(os.path.join(path, x))]
-    dirs = sorted(dirs)
+    catalog = catalog or PlateCatalog(path)
 
     # fetch names of files to act as first frames
-    filenames = [x for x in os.listdir(dirs[0]) if 'thumb' not in x.lower() and 'htd' not in x.lower()]
+    filenames = catalog.filenames
     dir_ref = f"{path.split('/')[-1]}_out"
     os.makedirs(os.path.join(outpath, dir_ref), exist_ok=True)
 
-    temp = []
+    read = partial(read_image, scale=scale, native=native)
+    extension = 'gif' if gif else 'mp4'
+    encoder = Encoder(fmt, preset)
+
+    def outputs(f: str):
+        stem = f"{f[:-4]}_stack"
+        return [f"{stem}.{extension}"] + [f"{stem}_{kind}.{encoder.extension}" for kind in projection]
+
+    manifest = Manifest(os.path.join(outpath, dir_ref)) if incremental else None
+    signatures = {}
+
+    if manifest is not None:  # skip the files, which animations were made from the same frames and parameters before
+        params = {'framerate': framerate, 'gif': gif, 'scale': scale, 'native': native}
+
+        if projection:
+            params.update(encoder.signature)
+
+        signatures = {f: Manifest.signature(catalog.frames(f), params) for f in filenames}
+
+        current = {f for f in filenames if all(manifest.is_current(output, signatures[f]) for output in outputs(f))}
+        filenames = [f for f in filenames if f not in current]
+
+        if current:
+            yield sum(len(catalog.index[f]) for f in current)
+
+    def done(f: str):
+        if manifest is not None:
+            for output in outputs(f):
+                manifest.record(output, signatures[f])
+
+    try:
+        if (jobs > 1 or pool is not None) and len(filenames) > 1:
+            executor = pool or ProcessPoolExecutor(max_workers=min(jobs, len(filenames)))
+            futures = {}
+
+            try:
+                futures = {executor.submit(profiling.remote,
+                                           profiling.enabled(),
+                                           stack_worker,
+                                           catalog.frames(f),
+                                           os.path.join(outpath, dir_ref, f"{f[:-4]}_stack"),
+                                           framerate,
+                                           gif,
+                                           stream,
+                                           read,
+                                           projection,
+                                           encoder): f for f in filenames}
+
+                for future in as_completed(futures):
+                    frames, records = future.result()
+                    profiling.extend(records)
+                    done(futures[future])
+                    yield frames
+
+            finally:
+                release(executor, futures, pool is None)
+
+        elif stream:
+            for f in filenames:
+                with profiling.for_output(f"{f[:-4]}_stack"), \
+                        model.AnimationWriter(os.path.join(outpath, dir_ref, f"{f[:-4]}_stack"),
+                                              framerate=framerate,
+                                              gif=gif) as writer, \
+                        model.ProjectionWriter(os.path.join(outpath, dir_ref, f"{f[:-4]}_stack"),
+                                               kinds=projection,
+                                               encoder=encoder) as projector:
+                    for frame in prefetch(catalog.frames(f), read=read):
+                        yield 1
+                        writer.write(frame)
+                        projector.write(frame)
+
+                done(f)
 
-    for f in filenames:
-        for d in dirs:
-            yield 1
+        else:
+            temp = []
 
-            if f in os.listdir(d):
-                temp.append(cv2.imread(os.path.join(d, f)))  # numpy array of frames
+            for f in filenames:
+                with profiling.for_output(f"{f[:-4]}_stack"):
+                    for frame in catalog.frames(f):
+                        yield 1
+                        temp.append(read(frame))  # numpy array of frames
 
-        ig = model.ImageGrouper(temp)
-        ig.animation(framerate=framerate, gif=gif, filename=os.path.join(outpath, dir_ref, f"{f[:-4]}_stack"))
-        temp.clear()
+                    ig = model.ImageGrouper(temp)
+                    ig.animation(framerate=framerate,
+                                 gif=gif,
+                                 filename=os.path.join(outpath, dir_ref, f"{f[:-4]}_stack"))
+
+                    if projection:
+                        ig.projection(projection,
+                                      filename=os.path.join(outpath, dir_ref, f"{f[:-4]}_stack"),
+                                      encoder=encoder)
+
+                temp.clear()
+                done(f)
+
+    finally:
+        if manifest is not None:
+            manifest.save()
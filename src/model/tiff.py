@@ -0,0 +1,215 @@
+"""
+    This is the TIFF module of the IBERS Image Merger program.
+    It contains a writer of strip TIFF files, which takes the image in bands of rows, so that images far larger than
+    the memory can be written. The file is switched to the BigTIFF format on its own, once it grows over 4 GiB.
+    """
+
+import struct
+import zlib
+
+import numpy as np
+
+# TIFF tags written by the writer
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+COMPRESSION = 259
+PHOTOMETRIC = 262
+STRIP_OFFSETS = 273
+SAMPLES_PER_PIXEL = 277
+ROWS_PER_STRIP = 278
+STRIP_BYTE_COUNTS = 279
+PLANAR_CONFIGURATION = 284
+EXTRA_SAMPLES = 338
+SAMPLE_FORMAT = 339
+
+# TIFF field types: code, struct format
+SHORT = 3, 'H'
+LONG = 4, 'I'
+LONG8 = 16, 'Q'
+
+SAMPLE_FORMATS = {'u': 1, 'i': 2, 'f': 3}  # unsigned integer, signed integer, floating point
+
+HEADER_SIZE = 16  # space reserved for the header, which is 8 bytes in TIFF and 16 bytes in BigTIFF
+
+
+class TiffWriter:
+    """
+    Writes a single image into a strip TIFF file, band by band, from the top of the image.
+
+    The width, channels and data type of the image are fixed when the writer is created, while the height is simply
+    the number of rows written. Every band of rows is split into strips of about strip_size bytes, each compressed with
+    Deflate (unless disabled) and written straight away, so only the current strip is held in memory. The directory of
+    the image is written when the writer is closed: as a classic TIFF if the file fits 4 GiB, as BigTIFF otherwise.
+
+    Images in BGR(A) order, as loaded in by OpenCV, are stored in RGB(A) order.
+    """
+
+    def __init__(self,
+                 filename: str,
+                 width: int,
+                 channels: int = 1,
+                 dtype=np.uint8,
+                 compress: bool = True,
+                 strip_size: int = 2 ** 20,
+                 bigtiff: bool = None):
+        """
+        Function that initialises the TiffWriter and opens the file.
+
+        :param filename: path to the file
+        :param width: width of the image, in pixels
+        :param channels: number of channels of the image (1, 3 or 4)
+        :param dtype: data type of the image
+        :param compress: if True, compresses the strips with Deflate
+        :param strip_size: approximate size of a strip, in bytes before compression
+        :param bigtiff: if True, always writes BigTIFF, if False, never does; chosen by the size of the file if None
+        """
+        self.width = width
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.compress = compress
+        self.bigtiff = bigtiff
+
+        row_size = width * channels * self.dtype.itemsize
+        self.rows_per_strip = max(1, strip_size // row_size)
+
+        self.height = 0
+        self.offsets = []
+        self.byte_counts = []
+        self.pending = []  # rows waiting for their strip to be completed
+
+        self.file = open(filename, 'wb')
+        self.file.write(b'\0' * HEADER_SIZE)  # written on close, once the format is known
+
+    def write(self,
+              rows: np.ndarray):
+        """
+        Writes a band of rows at the bottom of the image.
+
+        :param rows: (rows, width) or (rows, width, channels) array, in BGR(A) order
+        """
+        if rows.ndim == 2:
+            rows = rows[:, :, None]
+
+        if rows.shape[1:] != (self.width, self.channels):
+            raise ValueError(f"Rows of shape {rows.shape[1:]} do not fit an image of width {self.width} "
+                             f"and {self.channels} channel(s).")
+
+        if self.channels >= 3:  # BGR(A) to RGB(A)
+            rows = rows[:, :, [2, 1, 0] + list(range(3, self.channels))]
+
+        self.pending.append(rows.astype(self.dtype, copy=False))
+        self.height += rows.shape[0]
+
+        while sum(r.shape[0] for r in self.pending) >= self.rows_per_strip:
+            self._flush(self.rows_per_strip)
+
+    def _flush(self,
+               count: int):
+        """
+        Writes the given number of pending rows as a single strip.
+
+        :param count: number of rows of the strip
+        """
+        strip = np.concatenate(self.pending) if len(self.pending) > 1 else self.pending[0]
+        self.pending = [strip[count:]] if strip.shape[0] > count else []
+
+        data = np.ascontiguousarray(strip[:count]).tobytes()
+
+        if self.compress:
+            data = zlib.compress(data, 6)
+
+        self.offsets.append(self.file.tell())
+        self.byte_counts.append(len(data))
+        self.file.write(data)
+
+    def close(self):
+        """
+        Writes the remaining rows and the directory of the image, and closes the file.
+        """
+        if self.file.closed:
+            return
+
+        try:
+            if self.pending:
+                self._flush(sum(r.shape[0] for r in self.pending))
+
+            if self.file.tell() % 2:  # the directory starts on a word boundary
+                self.file.write(b'\0')
+
+            self._write_directory()
+
+        finally:
+            self.file.close()
+
+    def _write_directory(self):
+        """
+        Writes the directory of the image at the end of the file and the header pointing to it.
+        """
+        ifd_offset = self.file.tell()
+        bigtiff = self.bigtiff
+
+        if bigtiff is None:  # offsets of classic TIFF are 32-bit, the directory has to fit in as well
+            bigtiff = ifd_offset + 4096 + 16 * len(self.offsets) >= 2 ** 32
+        offset_type = LONG8 if bigtiff else LONG
+
+        photometric = 2 if self.channels >= 3 else 1  # RGB or black is zero
+
+        entries = [(IMAGE_WIDTH, LONG, [self.width]),
+                   (IMAGE_LENGTH, LONG, [self.height]),
+                   (BITS_PER_SAMPLE, SHORT, [self.dtype.itemsize * 8] * self.channels),
+                   (COMPRESSION, SHORT, [8 if self.compress else 1]),  # Adobe Deflate or none
+                   (PHOTOMETRIC, SHORT, [photometric]),
+                   (STRIP_OFFSETS, offset_type, self.offsets),
+                   (SAMPLES_PER_PIXEL, SHORT, [self.channels]),
+                   (ROWS_PER_STRIP, LONG, [self.rows_per_strip]),
+                   (STRIP_BYTE_COUNTS, offset_type, self.byte_counts),
+                   (PLANAR_CONFIGURATION, SHORT, [1])]  # channels interleaved
+
+        if self.channels == 4:
+            entries.append((EXTRA_SAMPLES, SHORT, [2]))  # unassociated alpha
+
+        entries.append((SAMPLE_FORMAT, SHORT, [SAMPLE_FORMATS[self.dtype.kind]] * self.channels))
+
+        # classic TIFF: 2 bytes count of entries, 12 bytes entries (4 bytes count of values), 4 bytes offsets;
+        # BigTIFF: 8, 20 (8), 8
+        count_format, value_count_format, entry_size, offset_format = ('Q', 'Q', 20, 'Q') if bigtiff else \
+            ('H', 'I', 12, 'I')
+        inline = 8 if bigtiff else 4  # values that fit the entry itself
+
+        ifd = bytearray(struct.pack(f'<{count_format}', len(entries)))
+        extra = bytearray()
+        extra_offset = ifd_offset + len(ifd) + entry_size * len(entries) + struct.calcsize(offset_format)
+
+        for tag, (code, fmt), values in entries:
+            data = struct.pack(f'<{len(values)}{fmt}', *values)
+
+            if len(data) <= inline:
+                value = data.ljust(inline, b'\0')
+
+            else:
+                value = struct.pack(f'<{offset_format}', extra_offset + len(extra))
+                extra += data
+
+                if len(extra) % 2:
+                    extra += b'\0'
+
+            ifd += struct.pack(f'<HH{value_count_format}', tag, code, len(values)) + value
+
+        ifd += struct.pack(f'<{offset_format}', 0)  # no further images
+
+        self.file.write(ifd + extra)
+
+        self.file.seek(0)
+
+        if bigtiff:
+            self.file.write(b'II' + struct.pack('<HHHQ', 43, 8, 0, ifd_offset))
+
+        else:
+            self.file.write(b'II' + struct.pack('<HI', 42, ifd_offset))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,339 @@
+"""
+    This is the watch module of the IBERS Image Merger program.
+    It follows an acquisition folder while the instrument is still writing into it, and makes the outputs as soon as
+    their inputs are there: the grid of a well once all of its sites are written, and the next frames of the
+    animations once a new timepoint folder is written. Animations are appended to rather than rebuilt, so the time from
+    acquisition to a viewable output stays about the polling interval, whatever the length of the time course.
+    """
+
+import os
+import time
+from functools import partial
+
+import src.model.image_grouper as model
+from src.model.catalog import PlateCatalog
+from src.model.encoder import DEFAULT_FORMAT, DEFAULT_PRESET, Encoder
+from src.model.frames import read_image
+from src.model.manifest import Manifest
+from src.model.setup import plan_groups, process_grid
+
+
+class Watcher:
+    """
+    State of a watched acquisition folder between two polls: the grids made so far, and the animations being written,
+    which are kept open to append the frames of the coming timepoints to.
+
+    Files are only read once they were not modified for settle seconds, so that files still being written by the
+    instrument are left for a later poll. GIFs are complete animations after every poll (see GifWriter.checkpoint()),
+    while MP4s only once the watch ends, as their index is written when the writer is closed.
+
+    The mode of the folder (grid or stack) is found on the first poll it has valid contents in, so the watch can start
+    before the acquisition does.
+    """
+
+    def __init__(self,
+                 path: str,
+                 outpath: str,
+                 dim_x: int = 2,
+                 dim_y: int = 2,
+                 framerate: int = 7,
+                 gif: bool = True,
+                 background: tuple = (255, 255, 255),
+                 gutter: int = 0,
+                 scale: int = 1,
+                 native: bool = False,
+                 incremental: bool = False,
+                 pyramid: bool = False,
+                 settle: float = 2.0,
+                 fmt: str = DEFAULT_FORMAT,
+                 preset: str = DEFAULT_PRESET,
+                 projection: tuple = ()):
+        """
+        Function that initialises the Watcher.
+
+        :param path: input path, i.e. the acquisition folder
+        :param outpath: output path
+        :param dim_x: columns of the grids
+        :param dim_y: rows of the grids
+        :param framerate: framerate of the animations
+        :param gif: if True, animations are in GIF format, MP4 otherwise
+        :param background: colour (BGR) of the gutters and padding of the grids
+        :param gutter: width of the gap between the files in the grids, in pixels
+        :param scale: factor (1, 2, 4 or 8) to reduce the resolution of the files by while reading them
+        :param native: if True, keeps the native channels and bit depth of the files
+        :param incremental: if True, skips the grids made from the same files and parameters before, and records the
+        outputs into the manifest of the output directory (see manifest.Manifest)
+        :param pyramid: if True, exports the grids as DeepZoom tile pyramids instead of PNGs
+        :param settle: number of seconds a file has to be left unmodified for to be read
+        :param fmt: format of the grids and the projections: png, jpeg (jpg) or webp, unless exporting pyramids
+        :param preset: preset of the encoder of the grids and the projections: fast, balanced or small (see
+        encoder.PRESETS)
+        :param projection: kinds of temporal projections to make of the stacks as well: max, mean and/or std, which
+        are updated with the frames of every new timepoint (see image_grouper.ProjectionWriter)
+        """
+        self.path = path
+        self.outdir = os.path.join(outpath, f"{path.split('/')[-1]}_out")
+        self.dim_x = dim_x
+        self.dim_y = dim_y
+        self.framerate = framerate
+        self.gif = gif
+        self.background = background
+        self.gutter = gutter
+        self.scale = scale
+        self.native = native
+        self.pyramid = pyramid
+        self.settle = settle
+        self.encoder = Encoder(fmt, preset)
+        self.projection = projection
+
+        self.read = partial(read_image, scale=scale, native=native)
+        self.manifest = Manifest(self.outdir) if incremental else None
+
+        self.catalog: PlateCatalog = None
+        self.emitted = set()  # names of the grids made
+        self.writers = {}  # file name -> AnimationWriter of its animation
+        self.projectors = {}  # file name -> ProjectionWriter of its projections
+        self.frames = {}  # file name -> paths to the frames written into its animation
+        self.consumed = {}  # file name -> frame folders appended to its animation, or skipped as missing from
+
+    @property
+    def mode(self) -> bool:
+        """
+        Mode of the acquisition folder, as in PlateCatalog, None until it has valid contents.
+        """
+        return self.catalog.mode if self.catalog is not None else None
+
+    def settled(self,
+                paths: list) -> bool:
+        """
+        Checks whether the instrument is done writing the given files.
+
+        :param paths: paths to the files
+        """
+        limit = time.time() - self.settle
+
+        try:
+            return all(os.stat(p).st_mtime <= limit for p in paths)
+
+        except OSError:  # renamed or removed in the meantime
+            return False
+
+    def poll(self):
+        """
+        Scans the acquisition folder and makes the outputs, which inputs became ready since the previous poll.
+
+        :return: yields the filenames of the outputs made or updated, relative to the output directory
+        """
+        self.catalog = PlateCatalog(self.path)
+
+        if self.mode is None:
+            return
+
+        os.makedirs(self.outdir, exist_ok=True)
+
+        if self.mode:
+            yield from self.poll_grids()
+
+        else:
+            yield from self.poll_stacks()
+
+        if self.manifest is not None:
+            self.manifest.save()
+
+    def poll_grids(self,
+                   final: bool = False):
+        """
+        Makes the grids of the wells, which all sites were written. Without the layout of the plate, a group is
+        complete once it fills the grid.
+
+        :param final: if True, makes the grids of the incomplete groups as well, as the acquisition is over
+        :return: yields the filenames of the grids made
+        """
+        layout = self.catalog.layout
+        extension = 'dzi' if self.pyramid else self.encoder.extension
+
+        for name, group in plan_groups(self.catalog):
+            if name in self.emitted:
+                continue
+
+            paths = [os.path.join(self.path, file) for file in group]
+            complete = len(group) >= (len(layout.sites) if layout is not None else self.dim_x * self.dim_y)
+
+            if not (complete or final) or not self.settled(paths):
+                continue
+
+            self.emitted.add(name)
+
+            if self.manifest is not None:  # same signature as in setup.fetch_files(), so batch runs skip it as well
+                params = {'dims': [self.dim_x, self.dim_y], 'background': self.background, 'gutter': self.gutter,
+                          'scale': self.scale, 'native': self.native}
+
+                if not self.pyramid:
+                    params.update(self.encoder.signature)
+
+                signature = Manifest.signature(paths, params)
+
+                if self.manifest.is_current(f"{name}.{extension}", signature):
+                    continue
+
+            exported = process_grid([self.read(p) for p in paths],
+                                    filename=os.path.join(self.outdir, name),
+                                    dim_x=self.dim_x,
+                                    dim_y=self.dim_y,
+                                    background=self.background,
+                                    gutter=self.gutter,
+                                    pyramid=self.pyramid,
+                                    encoder=self.encoder)
+
+            if self.manifest is not None:
+                self.manifest.record(f"{name}.{extension}", signature, exported)
+
+            if exported:
+                yield f"{name}.{extension}"
+
+    def poll_stacks(self):
+        """
+        Appends the frames of the timepoints written since the previous poll to the animations (and the projections),
+        in the order of the timepoints. A file missing from a timepoint, which the next timepoint has already, is
+        skipped in it. A timepoint folder showing up after a later one was appended is appended once it does, as the
+        frames written cannot be moved anymore (an incremental batch run remakes such an animation in order).
+
+        :return: yields the filenames of the animations and projections updated
+        """
+        dirs = self.catalog.dirs  # in the order of the timepoints, as in a batch run
+        extension = 'gif' if self.gif else 'mp4'
+
+        for f, found in sorted(self.catalog.index.items()):
+            frames = self.frames.setdefault(f, [])
+            consumed = self.consumed.setdefault(f, set())
+            pending = [d for d in dirs if d not in consumed]
+            added = 0
+
+            for i, d in enumerate(pending):
+                if d not in found and any(later in found for later in pending[i + 1:]):
+                    consumed.add(d)  # missing from this timepoint
+                    continue
+
+                if d not in found or not self.settled([found[d]]):
+                    break
+
+                if f not in self.writers:
+                    self.writers[f] = model.AnimationWriter(os.path.join(self.outdir, f"{f[:-4]}_stack"),
+                                                            framerate=self.framerate,
+                                                            gif=self.gif)
+                    self.projectors[f] = model.ProjectionWriter(os.path.join(self.outdir, f"{f[:-4]}_stack"),
+                                                                kinds=self.projection,
+                                                                encoder=self.encoder)
+
+                frame = self.read(found[d])
+                self.writers[f].write(frame)
+                self.projectors[f].write(frame)
+                frames.append(found[d])
+                consumed.add(d)
+                added += 1
+
+            if added:
+                self.writers[f].checkpoint()
+                yield f"{f[:-4]}_stack.{extension}"
+
+                for filename in self.projectors[f].export():
+                    yield os.path.basename(filename)
+
+    @property
+    def seen(self) -> int:
+        """
+        Number of files found in the acquisition folder by the last poll.
+        """
+        if self.catalog is None:
+            return 0
+
+        return len(self.catalog.files) + sum(len(found) for found in self.catalog.index.values())
+
+    @property
+    def complete(self) -> bool:
+        """
+        True once the acquisition described by the layout of the plate was processed in full: every well made into a
+        grid, or every timepoint appended to the animations. Never True for plates without a layout.
+        """
+        layout = self.catalog.layout if self.catalog is not None else None
+
+        if layout is None or self.mode is None:
+            return False
+
+        if self.mode:
+            return len(self.emitted) >= len(layout.wells)
+
+        return len(self.catalog.dirs) >= layout.timepoints and \
+            all(self.consumed.get(f, set()).issuperset(self.catalog.dirs) for f in self.catalog.index)
+
+    def close(self):
+        """
+        Ends the watch: makes the grids of the groups left incomplete, and finalises the animations.
+
+        :return: yields the filenames of the outputs made or finalised
+        """
+        if self.mode:
+            yield from self.poll_grids(final=True)
+
+        params = {'framerate': self.framerate, 'gif': self.gif, 'scale': self.scale, 'native': self.native}
+        extension = 'gif' if self.gif else 'mp4'
+
+        if self.projection:
+            params.update(self.encoder.signature)
+
+        for f, writer in sorted(self.writers.items()):
+            writer.close()
+
+            if self.manifest is not None:  # same signature and outputs as in setup.fetch_dirs()
+                signature = Manifest.signature(self.frames[f], params)
+
+                for output in [f"{f[:-4]}_stack.{extension}"] + [os.path.basename(filename)
+                                                                 for filename in self.projectors[f].filenames]:
+                    self.manifest.record(output, signature)
+
+            yield f"{f[:-4]}_stack.{extension}"
+
+        self.writers = {}
+        self.projectors = {}
+
+        if self.manifest is not None:
+            self.manifest.save()
+
+
+def watch(path: str,
+          outpath: str,
+          interval: float = 5.0,
+          idle: float = 600.0,
+          **kwargs):
+    """
+    Watches an acquisition folder until the acquisition is processed in full (see Watcher.complete), no new file was
+    written for idle seconds, or the watch is interrupted (e.g., with Ctrl+C), and then finalises the outputs.
+
+    :param path: input path, i.e. the acquisition folder
+    :param outpath: output path
+    :param interval: number of seconds between two polls of the folder
+    :param idle: number of seconds without new files to end the watch after, never ends on its own if 0
+    :param kwargs: parameters of the outputs, see Watcher
+    :return: yields the filenames of the outputs made or updated, relative to the output directory
+    """
+    watcher = Watcher(path, outpath, **kwargs)
+    seen = -1
+    last = time.monotonic()
+
+    try:
+        while True:
+            yield from watcher.poll()
+
+            if watcher.seen != seen:  # new files were written
+                seen = watcher.seen
+                last = time.monotonic()
+
+            if watcher.complete or (idle and time.monotonic() - last >= idle):
+                break
+
+            time.sleep(interval)
+
+    except KeyboardInterrupt:  # ends the watch, the outputs made so far are still finalised
+        pass
+
+    yield from watcher.close()
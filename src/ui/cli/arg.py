@@ -2,9 +2,19 @@
 Configuration of Argument Parser object to use as a CLI interface of the application.
 """
 import argparse
+import cProfile
 import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
+import src.model.profiling as profiling
 import src.model.setup as setup
+import src.model.watch as watch
+from src.model.catalog import PlateCatalog
+from src.model.encoder import DEFAULT_FORMAT, DEFAULT_PRESET, FORMATS, PRESETS
+from src.model.frames import SCALES
+from src.model.image_grouper import PROJECTIONS
 
 
 def arg_init():
@@ -12,14 +22,26 @@ def arg_init():
     Instantiates an arguments parser, which operates with a positional directory argument (directory should contain
     files to be processed for grid or stack) and optional arguments for dimensions of the grid or framerate of the
     animation.
+
+    The serve and submit subcommands run the daemon and submit a job to it instead (see serve_init() and
+    submit_init()).
     """
 
+    argv = sys.argv[1:]
+
+    if argv[:1] == ['serve']:
+        return serve_init(argv[1:])
+
+    if argv[:1] == ['submit']:
+        return submit_init(argv[1:])
+
     desc = "\n".join([f"---",
                       f"Welcome to Roboworm Image Processing Application - CLI Interface!",
                       f"To run the merging, please provide input and output paths.",
                       f"Additionally, depending on what type of output you require (stack or grid) provide optional",
                       f"arguments to specify dimensions or framerate with format (GIF or not).",
                       f"If arguments will not be provided, default options will be used.",
+                      f"To keep a warm pool of workers for many runs, start `serve` and pass jobs to it with `submit`.",
                       f"---"])
 
     p = argparse.ArgumentParser(
@@ -28,6 +50,73 @@ def arg_init():
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
 
+    add_job_arguments(p)
+
+    p.add_argument('--watch', action='store_true',
+                   help='Follow the input path while it is being acquired: make the grid of every well as soon as its '
+                        'sites are written and append every new timepoint to the animations, until the plate is done '
+                        'or no file was written for the --idle time.')
+
+    p.add_argument('--poll', type=float, metavar="SECONDS", default=5.0,
+                   help='With --watch, number of seconds between two scans of the input path. Defaults to 5.')
+
+    p.add_argument('--idle', type=float, metavar="SECONDS", default=600.0,
+                   help='With --watch, end the watch once no file was written for this long, 0 to only end it with '
+                        'Ctrl+C or once the plate described by the .HTD file is done. Defaults to 600.')
+
+    p.add_argument('--profile', metavar="FILE",
+                   help='Record the time and bytes of every stage (scan, read, compose, encode) and output, and the peak '
+                        'memory, into a JSON Lines file, and print a summary at the end of the run.')
+
+    p.add_argument('--cprofile', metavar="FILE",
+                   help='Run under cProfile and save the statistics into a file (e.g., for snakeviz or pstats).')
+
+    add_jobs_argument(p, 'Number of worker processes to merge well groups or animate files with. '
+                         'Defaults to the number of CPU cores, or 1 with --pipeline.')
+
+    args = p.parse_args(argv)
+
+    if args.pipeline and args.jobs is not None and args.jobs > 1:
+        p.error("--pipeline runs the grids on the threads of a single process, it cannot be combined with -j above 1.")
+
+    if args.jobs is None:
+        args.jobs = 1 if args.pipeline else os.cpu_count() or 1
+
+    if args.profile:
+        profiling.enable(trace_memory=True)
+
+    profiler = cProfile.Profile() if args.cprofile else None
+    start = time.perf_counter()
+
+    if profiler is not None:
+        profiler.enable()
+
+    try:
+        run(p, args)
+
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+
+        if args.profile:
+            seconds = time.perf_counter() - start
+            records = profiling.drain()
+            profiling.write(args.profile, records, seconds)
+
+            print()
+            print(profiling.summary(records, seconds))
+
+
+def add_job_arguments(p: argparse.ArgumentParser):
+    """
+    Adds the arguments describing a single run (the input and output paths and the options of the outputs) to a
+    parser. Shared by the command line and the submit subcommand, so that jobs sent to the daemon take the same
+    parameters as a run.
+
+    :param p: the arguments parser
+    """
+
     def validate(value):
         if not os.path.isdir(value):
             raise argparse.ArgumentTypeError("Provided directory is not valid. Try again.")
@@ -48,40 +137,302 @@ def arg_init():
     p.add_argument('-g', '-gif', type=bool, help="True, if you want the stack to be made as a GIF. Defaults to True.",
                    default=True)
 
-    args = p.parse_args()
+    p.add_argument('--background', type=int, choices=range(0, 256), metavar="[0-255]", nargs=3,
+                   help='Colour (R G B) of the gutters and padding of the grid. Defaults to white.',
+                   default=(255, 255, 255))
 
-    inpath = args.inpath
-    outpath = args.outpath
-    grid_mode = setup.inpath_type(inpath)  # returns True if mode is grid
+    p.add_argument('--gutter', type=int, choices=range(0, 1000), metavar="[0-999]",
+                   help='Width of the gap between the images of the grid, in pixels. Defaults to 0.',
+                   default=0)
+
+    p.add_argument('--pipeline', action='store_true',
+                   help='Overlap reading, merging and writing of the grids on separate threads of a single process. '
+                        'Runs a single job, so it cannot be combined with -j above 1.')
+
+    p.add_argument('--stream', action='store_true',
+                   help='Decode the frames of the stack in the background and write them one by one, '
+                        'keeping only a few frames in memory.')
+
+    p.add_argument('--scale', choices=SCALES, default='1',
+                   help='Fraction of the resolution to read the images at and make the outputs in. Defaults to 1.')
+
+    p.add_argument('--native', action='store_true',
+                   help='Keep the native channels and bit depth of the images (e.g., 16-bit grayscale), '
+                        'only converting to 8 bits for MP4 and GIF.')
+
+    p.add_argument('--incremental', action='store_true',
+                   help='Skip the outputs made from the same inputs and parameters by a previous run, '
+                        'according to the manifest in the output directory.')
+
+    p.add_argument('--tiff', action='store_true',
+                   help='Write the grids as TIFFs (BigTIFF over 4 GiB), merged and written one row of images at a time, '
+                        'so that very large grids fit in memory.')
+
+    p.add_argument('--pyramid', action='store_true',
+                   help='Write the grids and the montage as DeepZoom tile pyramids (.dzi and a folder of tiles), '
+                        'which viewers can zoom into without loading the whole image. Not used with --tiff.')
+
+    p.add_argument('--format', choices=sorted(FORMATS), default=DEFAULT_FORMAT,
+                   help='Format of the grids, the montage and the projections. Defaults to png. '
+                        'Not used with --tiff or --pyramid.')
+
+    p.add_argument('--preset', choices=list(PRESETS[DEFAULT_FORMAT]), default=DEFAULT_PRESET,
+                   help='Trade-off between the time spent encoding the grids, the montage and the projections and the '
+                        'size of the files: fast, balanced or small. Defaults to fast.')
+
+    p.add_argument('--projection', choices=PROJECTIONS, nargs='+', default=[],
+                   help='Also make summary images of every stack across the timepoints: the maximum intensity (max), '
+                        'the mean and/or the standard deviation (std), which shows movement. '
+                        'Computed while the frames are read, from a few frames in memory.')
+
+    p.add_argument('--montage', action='store_true',
+                   help='Also make an overview image of the whole plate, which places the images of every well at its '
+                        'position on the plate (read from the .HTD file). Stacks use their first timepoint.')
+
+
+def add_jobs_argument(p: argparse.ArgumentParser,
+                      description: str):
+    """
+    Adds the number of worker processes to a parser. The number is None if not given, so that the caller can tell it
+    from a number given explicitly and set the default it describes.
+
+    :param p: the arguments parser
+    :param description: help of the argument
+    """
+
+    def positive(value):
+        if not value.isdigit() or int(value) < 1:
+            raise argparse.ArgumentTypeError("Number of jobs should be a positive integer.")
+
+        return int(value)
+
+    p.add_argument('-j', '--jobs', type=positive, metavar="N", help=description)  # default set by the caller
+
+
+def serve_init(argv: list):
+    """
+    Parses the arguments of the serve subcommand and runs the daemon until it is interrupted (see daemon.serve()).
+
+    :param argv: arguments following the subcommand
+    """
+    import src.ui.cli.daemon as daemon  # imported here, as the daemon builds on this module
+
+    p = argparse.ArgumentParser(prog='Roboworm Image Grouper serve',
+                                description='Keep a warm pool of worker processes and run the jobs submitted to it '
+                                            'over a Unix domain socket.')
+
+    p.add_argument('--socket', metavar="PATH", default=daemon.DEFAULT_SOCKET,
+                   help=f'Path of the socket to listen on. Defaults to {daemon.DEFAULT_SOCKET}.')
 
-    if grid_mode is None:
+    add_jobs_argument(p, 'Number of worker processes of the pool. Defaults to the number of CPU cores.')
+
+    args = p.parse_args(argv)
+
+    try:
+        daemon.serve(args.socket, args.jobs)
+
+    except OSError as e:
+        print(f"Daemon could not be started: {e}")
+        p.exit(1)
+
+
+def submit_init(argv: list):
+    """
+    Parses the arguments of the submit subcommand, which takes the same arguments as a run, submits the job to the
+    daemon and shows its progress until it is done (see daemon.submit()).
+
+    :param argv: arguments following the subcommand
+    """
+    import src.ui.cli.daemon as daemon  # imported here, as the daemon builds on this module
+
+    p = argparse.ArgumentParser(prog='Roboworm Image Grouper submit',
+                                description='Submit a job to the daemon started with serve and wait for it to finish.')
+
+    add_job_arguments(p)
+
+    p.add_argument('--socket', metavar="PATH", default=daemon.DEFAULT_SOCKET,
+                   help=f'Path of the socket of the daemon. Defaults to {daemon.DEFAULT_SOCKET}.')
+
+    args = vars(p.parse_args(argv))
+    path = args.pop('socket')
+
+    # the daemon runs in a directory of its own
+    args['inpath'], args['outpath'] = os.path.abspath(args['inpath']), os.path.abspath(args['outpath'])
+
+    try:
+        for event in daemon.submit(args, path):
+            if event['event'] == 'accepted':
+                print_progress_bar(0, event['total'] or 1, prefix='Progress:', suffix='Complete', length=50)
+
+            elif event['event'] == 'warning':
+                print(f"Warning: {event['message']}")
+
+            elif event['event'] in ('progress', 'done'):
+                print_progress_bar(event['done'], event['total'] or 1, prefix='Progress:', suffix='Complete', length=50)
+
+            elif event['event'] == 'error':
+                print(event['message'])
+                p.exit(1)
+
+    except OSError as e:
+        print(f"Could not reach the daemon at {path} ({e}). Start it with the serve subcommand.")
+        p.exit(1)
+
+
+def plan(args: argparse.Namespace):
+    """
+    Scans the input path and plans the optional outputs of a run.
+
+    :param args: the parsed arguments
+    :return: (catalog of the input path, plan of the montage, list of warnings to report before the run)
+    """
+    catalog = PlateCatalog(args.inpath)  # the input path is scanned once, for validation, counting and processing
+    warnings = []
+
+    if catalog.mode is False:  # report short animations before any encoding starts
+        missing = catalog.missing()
+
+        if missing:
+            warnings.append("\n".join([f"{len(missing)} file(s) are missing from some timepoints, "
+                                       f"their animations will be shorter:"] +
+                                      [f"    {f}: {', '.join(dirs)}" for f, dirs in missing.items()]))
+
+    montage = setup.plan_montage(catalog) if args.montage and catalog.mode is not None else []
+
+    if args.montage and catalog.mode is not None and not montage:
+        warnings.append("the plate layout could not be read from the .HTD file, the montage will not be made.")
+
+    return catalog, montage, warnings
+
+
+def run(p: argparse.ArgumentParser,
+        args: argparse.Namespace):
+    """
+    Runs the merging with the parsed arguments.
+
+    :param p: the arguments parser, used to exit on an invalid input path
+    :param args: the parsed arguments
+    """
+    if args.watch:
+        return run_watch(args)
+
+    catalog, montage, warnings = plan(args)
+
+    if catalog.mode is None:
         print("Input path invalid. Make sure your path contains files or directories of correct type and try again.")
         p.exit(1)
 
+    for warning in warnings:
+        print(f"Warning: {warning}")
+
     files_processed = 0
-    total_files = setup.get_total_files(inpath, files=grid_mode, dirs=not grid_mode)
+    total_files = catalog.total_files + len(montage)
     print_progress_bar(0, total_files, prefix='Progress:', suffix='Complete', length=50)
 
+    for n in merge(args, catalog, montage):
+        files_processed += n
+        print_progress_bar(files_processed, total_files, prefix='Progress:', suffix='Complete', length=50)
+
+
+def run_watch(args: argparse.Namespace):
+    """
+    Runs the merging in watch mode, reporting every output as it is made or updated (see watch.watch()).
+
+    :param args: the parsed arguments
+    """
+    x, y = args.dim
+
+    print(f"Watching {args.inpath}, press Ctrl+C to stop.")
+
+    for output in watch.watch(args.inpath,
+                              args.outpath,
+                              interval=args.poll,
+                              idle=args.idle,
+                              dim_x=x,
+                              dim_y=y,
+                              framerate=args.fr,
+                              gif=args.g,
+                              background=tuple(reversed(args.background)),  # OpenCV works in BGR
+                              gutter=args.gutter,
+                              scale=SCALES[args.scale],
+                              native=args.native,
+                              incremental=args.incremental,
+                              pyramid=args.pyramid,
+                              fmt=args.format,
+                              preset=args.preset,
+                              projection=tuple(args.projection)):
+        print(f"{time.strftime('%H:%M:%S')} {output}")
+
+
+def merge(args: argparse.Namespace,
+          catalog: PlateCatalog,
+          montage: list,
+          pool: ProcessPoolExecutor = None):
+    """
+    Makes the outputs of a run: the grids or the animations, and the montage if planned.
+
+    :param args: the parsed arguments
+    :param catalog: catalog of the input path
+    :param montage: plan of the montage, empty if it is not made
+    :param pool: pool of worker processes to use instead of starting one (e.g., the warm pool of the daemon)
+    :return: yields the number of files processed, see setup.fetch_files() and setup.fetch_dirs()
+    """
+    inpath = args.inpath
+    outpath = args.outpath
+    grid_mode = catalog.mode  # True if mode is grid
+
     if grid_mode:
         x, y = args.dim
 
-        for n in setup.fetch_files(path=inpath,
-                                   outpath=outpath,
-                                   dim_x=x,
-                                   dim_y=y):
-            files_processed += n
-            print_progress_bar(files_processed, total_files, prefix='Progress:', suffix='Complete', length=50)
+        yield from setup.fetch_files(path=inpath,
+                                     outpath=outpath,
+                                     dim_x=x,
+                                     dim_y=y,
+                                     jobs=args.jobs,
+                                     background=tuple(reversed(args.background)),  # OpenCV works in BGR
+                                     gutter=args.gutter,
+                                     pipeline=args.pipeline,
+                                     scale=SCALES[args.scale],
+                                     native=args.native,
+                                     incremental=args.incremental,
+                                     catalog=catalog,
+                                     tiff=args.tiff,
+                                     pyramid=args.pyramid,
+                                     pool=pool,
+                                     fmt=args.format,
+                                     preset=args.preset)
 
     if not grid_mode:
         framerate = args.fr
         is_gif = args.g
 
-        for n in setup.fetch_dirs(path=inpath,
-                                  outpath=outpath,
-                                  framerate=framerate,
-                                  gif=is_gif):
-            files_processed += n
-            print_progress_bar(files_processed, total_files, prefix='Progress:', suffix='Complete', length=50)
+        yield from setup.fetch_dirs(path=inpath,
+                                    outpath=outpath,
+                                    framerate=framerate,
+                                    gif=is_gif,
+                                    jobs=args.jobs,
+                                    stream=args.stream,
+                                    scale=SCALES[args.scale],
+                                    native=args.native,
+                                    incremental=args.incremental,
+                                    catalog=catalog,
+                                    pool=pool,
+                                    projection=tuple(args.projection),
+                                    fmt=args.format,
+                                    preset=args.preset)
+
+    if montage:
+        yield from setup.fetch_montage(path=inpath,
+                                       outpath=outpath,
+                                       background=tuple(reversed(args.background)),
+                                       gutter=args.gutter,
+                                       scale=SCALES[args.scale],
+                                       native=args.native,
+                                       incremental=args.incremental,
+                                       catalog=catalog,
+                                       pyramid=args.pyramid,
+                                       fmt=args.format,
+                                       preset=args.preset)
 
 
 def print_progress_bar(iteration, total, prefix='', suffix='', decimals=1, length=100, fill='█', printEnd="\r"):
@@ -0,0 +1,311 @@
+"""
+Daemon mode of the CLI: a long-running server, which keeps a warm pool of worker processes and runs the jobs submitted
+to it over a Unix domain socket, so that a run does not pay for starting the interpreter, importing OpenCV and NumPy
+and starting a pool. Also contains the client, which submits a job and follows its progress.
+
+Jobs and events are sent as JSON, one object per line. A job holds the same parameters as a run from the command line
+(see arg.add_job_arguments()), by the names of the arguments, e.g.:
+
+    {"inpath": "/data/plate_1", "outpath": "/data/out", "dim": [3, 3], "montage": true}
+
+Parameters left out take their defaults, and the job is checked by the same parser as a run, so invalid parameters are
+reported with the message of the command line. The daemon answers every job with a stream of events:
+
+    {"event": "accepted", "job": 1, "mode": "grid", "total": 96}
+    {"event": "warning", "job": 1, "message": "..."}
+    {"event": "progress", "job": 1, "done": 48, "total": 96}
+    {"event": "done", "job": 1, "done": 96, "total": 96, "seconds": 1.52}
+
+or {"event": "error", "job": 1, "message": "..."}, which ends the job as well. Several jobs can be sent over a single
+connection, one after the other, and several connections are served at once, sharing the pool.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import signal
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import src.ui.cli.arg as arg
+
+DEFAULT_SOCKET = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+                              f"roboworm-{os.getuid()}.sock" if hasattr(os, 'getuid') else "roboworm.sock")
+
+PROGRESS_INTERVAL = 0.1  # seconds between the progress events of a job
+
+
+class JobParser(argparse.ArgumentParser):
+    """
+    Parser of the parameters of a job, which raises the errors of the parameters instead of exiting the daemon.
+    """
+
+    def error(self, message):
+        raise ValueError(message)
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Server, which runs every connection in a thread of its own, while the merging of all the jobs is done by a single,
+    shared pool of worker processes.
+    """
+    daemon_threads = True
+
+    def __init__(self,
+                 path: str,
+                 jobs: int):
+        """
+        Function that initialises the Daemon, binds it to the socket and starts the pool of worker processes.
+
+        :param path: path of the socket to listen on
+        :param jobs: number of worker processes of the pool
+        """
+        self.jobs = jobs
+        self.pool = self.start_pool()
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+
+        # parameters of a job, parsed as the arguments of the command line
+        self.parser = JobParser(prog='job', add_help=False)
+        arg.add_job_arguments(self.parser)
+        self.actions = {action.dest: action for action in self.parser._actions}
+
+        # the socket is created accessible to the user running the daemon only, so that no one else can submit jobs
+        umask = os.umask(0o177)
+
+        try:
+            super().__init__(path, Handler)
+
+        finally:
+            os.umask(umask)
+
+    def start_pool(self) -> ProcessPoolExecutor:
+        """
+        Starts a pool of worker processes, which leave Ctrl+C to the daemon, so that it can stop them cleanly.
+        """
+        return ProcessPoolExecutor(max_workers=self.jobs, initializer=signal.signal, initargs=(signal.SIGINT,
+                                                                                               signal.SIG_IGN))
+
+    def warm_up(self):
+        """
+        Starts the worker processes ahead of the first job.
+        """
+        for future in [self.pool.submit(os.getpid) for _ in range(self.jobs)]:
+            future.result()
+
+    def restart(self):
+        """
+        Replaces a broken pool of worker processes with a new one.
+        """
+        with self.lock:
+            broken, self.pool = self.pool, self.start_pool()
+
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def parse(self,
+              job: dict) -> argparse.Namespace:
+        """
+        Turns a job into the parameters of a run. The job is turned into the arguments of the command line it stands
+        for, which are checked by the parser of a run (see arg.add_job_arguments()), types and choices included.
+
+        :param job: parameters of the job, by the names of the arguments of the command line
+        :return: the parameters, as parsed from the command line
+        """
+        if not isinstance(job, dict):
+            raise ValueError("Job should be a JSON object.")
+
+        unknown = set(job) - set(self.actions)
+
+        if unknown:
+            raise ValueError(f"Unknown parameter(s) of the job: {', '.join(sorted(unknown))}.")
+
+        argv = []
+
+        for name, value in job.items():
+            action = self.actions[name]
+
+            if not action.option_strings:  # the input and output paths, passed last
+                continue
+
+            option = action.option_strings[-1]
+
+            if value is None or value == []:  # the default
+                continue
+
+            if action.nargs == 0 or action.type is bool:  # flags, and -g, which is true for any non-empty value
+                if not isinstance(value, bool):
+                    raise ValueError(f"argument {option}: expected true or false, got {json.dumps(value)}")
+
+                if action.nargs == 0 and value:
+                    argv.append(option)
+
+                elif action.nargs != 0:
+                    argv.append(f"{option}={'True' if value else ''}")
+
+            elif action.nargs is not None:  # lists of values, which should not pass further options
+                values = value if isinstance(value, list) else [value]
+
+                if any(isinstance(v, str) and v.startswith('-') for v in values):
+                    raise ValueError(f"argument {option}: invalid value {json.dumps(value)}")
+
+                argv += [option] + [str(v) for v in values]
+
+            else:
+                argv.append(f"{option}={value}")
+
+        paths = [str(job[name]) for name, action in self.actions.items() if not action.option_strings and name in job]
+        args = self.parser.parse_args(argv + ['--'] + paths)
+
+        # --pipeline runs the grids on threads of the daemon itself, as a single job
+        args.jobs = 1 if args.pipeline else self.jobs
+
+        return args
+
+    def run(self,
+            line: bytes):
+        """
+        Runs a single job.
+
+        :param line: the job, a line of JSON
+        :return: yields the events of the job
+        """
+        with self.lock:
+            job = next(self.counter)
+
+        start = time.perf_counter()
+
+        try:
+            args = self.parse(json.loads(line))
+
+        except ValueError as e:  # including invalid JSON
+            yield {'event': 'error', 'job': job, 'message': str(e)}
+            return
+
+        try:
+            catalog, montage, warnings = arg.plan(args)
+
+        except OSError as e:  # e.g., the input path is not readable
+            yield {'event': 'error', 'job': job, 'message': str(e)}
+            return
+
+        if catalog.mode is None:
+            yield {'event': 'error', 'job': job, 'message': "Input path invalid. Make sure your path contains files "
+                                                            "or directories of correct type and try again."}
+            return
+
+        done = 0
+        total = catalog.total_files + len(montage)
+
+        yield {'event': 'accepted', 'job': job, 'mode': 'grid' if catalog.mode else 'stack', 'total': total}
+
+        for warning in warnings:
+            yield {'event': 'warning', 'job': job, 'message': warning}
+
+        last = time.monotonic()
+
+        try:
+            for n in arg.merge(args, catalog, montage, pool=None if args.pipeline else self.pool):
+                done += n
+
+                if time.monotonic() - last >= PROGRESS_INTERVAL:
+                    last = time.monotonic()
+                    yield {'event': 'progress', 'job': job, 'done': done, 'total': total}
+
+        except Exception as e:  # the daemon outlives the failed job
+            if isinstance(e, BrokenProcessPool):  # a worker process died, e.g. killed for using too much memory
+                self.restart()
+
+            yield {'event': 'error', 'job': job, 'message': f"{type(e).__name__}: {e}"}
+            return
+
+        yield {'event': 'done', 'job': job, 'done': done, 'total': total,
+               'seconds': round(time.perf_counter() - start, 3)}
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """
+    Handles a single connection: runs the jobs sent over it one after the other and sends their events back.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            events = self.server.run(line)
+
+            try:
+                for event in events:
+                    self.wfile.write((json.dumps(event) + '\n').encode())
+
+            except OSError:  # the client went away, the outstanding work of its job is cancelled
+                events.close()
+                return
+
+
+def serve(path: str = DEFAULT_SOCKET,
+          jobs: int = None):
+    """
+    Runs the daemon until it is interrupted (e.g., with Ctrl+C) or terminated.
+
+    :param path: path of the socket to listen on
+    :param jobs: number of worker processes of the pool, the number of CPU cores if None
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        raise OSError("Unix domain sockets are not supported on this system.")
+
+    if os.path.exists(path):  # left behind by a daemon, which was killed, unless it still runs
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            if s.connect_ex(path) == 0:
+                raise OSError(f"Another daemon is listening on {path}.")
+
+        os.unlink(path)
+
+    jobs = jobs or os.cpu_count() or 1
+
+    if hasattr(signal, 'SIGTERM'):  # stopped by a service manager the same way as with Ctrl+C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    with Daemon(path, jobs) as server:
+        try:
+            server.warm_up()
+            print(f"Listening on {path} with {jobs} worker process(es). Press Ctrl+C to stop.")
+            server.serve_forever()
+
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            server.pool.shutdown(wait=True, cancel_futures=True)
+            os.unlink(path)
+
+
+def submit(job: dict,
+           path: str = DEFAULT_SOCKET):
+    """
+    Submits a job to the daemon and follows it to its end.
+
+    :param job: parameters of the job, see the description of the module
+    :param path: path of the socket of the daemon
+    :return: yields the events of the job, up to the done or error event
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path)
+        s.sendall((json.dumps(job) + '\n').encode())
+        s.shutdown(socket.SHUT_WR)  # a single job
+
+        with s.makefile('rb') as f:
+            for line in f:
+                event = json.loads(line)
+                yield event
+
+                if event['event'] in ('done', 'error'):
+                    return
+
+    raise ConnectionError("Daemon closed the connection before the job was done.")
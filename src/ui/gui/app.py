@@ -2,14 +2,11 @@
 This module contains all the main Kivy widgets defined for the purpose of the GUI Functionality.
 """
 
-import copy
 import os.path
-import threading
+import time
 import tkinter as tk
-from queue import Queue
 from tkinter import filedialog
 
-import psutil
 from kivy.app import App
 from kivy.clock import Clock
 from kivy.core.window import Window
@@ -19,7 +16,10 @@ from kivy.uix.button import Button
 from kivy.uix.screenmanager import Screen, ScreenManager
 from kivy.uix.widget import Widget
 
-from src.model.setup import fetch_files, fetch_dirs, get_total_files, inpath_type
+from src.model.catalog import PlateCatalog
+from src.model.engine import Engine
+from src.model.frames import SCALES
+from src.model.progress import Progress
 
 # configuring the minimum window size allowed
 Window.minimum_height = 500
@@ -48,180 +48,172 @@ class LoadingScreen(Screen):
 
     Data is passed through a Widget object initialised in the Main Screen.
 
+    The directories are merged by an Engine, i.e. a pool of worker processes, a group of files (or an animation) at a
+    time. The screen collects what the Engine reports into a Progress object at a fixed rate and redraws from it, so
+    the main loop is neither flooded with updates nor slowed down by the merging.
+
     :param msc: the Widget through which the data (e.g., input paths) is accessed
-    :param progress_label: reference to the Label object that updates whenever a file is processed
+    :param progress_label: reference to the Label object that shows the progress of the directories
     :param progress_back_button: a Button object, which becomes visible once all the files were processed
-    :param progress_bar: the actual progress bar, which is updated every time a file is processed
+    :param progress_cancel_button: a Button object, which cancels the outstanding work while the files are processed
+    :param progress_bar: the actual progress bar, which shows the progress of all the directories
     """
     msc = ObjectProperty(None)  # this is a reference to widget in the Main Screen
     progress_label = ObjectProperty(None)
     progress_back_button = ObjectProperty(None)
+    progress_cancel_button = ObjectProperty(None)
     progress_bar = ObjectProperty(None)
 
+    refresh_rate = 10  # redraws of the progress per second
+
     def __init__(self, **kw):
         """
         Initialises the Screen as well as it's parameters used throughout the program workflow.
 
         :param kw: a parameter inherited from the Screen Widget
 
-        :param files_processed: how many files from a directory were processed so far
-        :param total_files: total number of files in a directory
+        :param engine: the pool of worker processes merging the directories
+        :param progress: files processed in every directory, as reported by the engine
+        :param refresh: the Clock event, which redraws the progress while the directories are processed
+        :param errors: number of groups of files (or animations), which failed to be processed
 
         :param dirs: dictionary, which contains the configurations to process every directory needed
         :param total_dirs: total number of directories to process
         :param current_dir: number of the directory being processed
 
-        :param inp: input path
-        :param out: output path
-        :param grid_mode: whether directory is to be processed in grid mode. True - yes.
-        :param stack_mode: whether directory is to be processed in stack mode. True - yes.
-        :param x_dim: if grid mode is True, number of columns
-        :param y_dim: if grid mode is True, number of rows
-        :param framerate: if stack mode is True, framerate of animations to produce
-        :param is_gif: if True, animations produced will be in GIF format. MP4 otherwise.
-        :param parallelism: if True, multi-threads the application
+        :param parallelism: if True, processes the directories with a worker process per CPU, with a single one
+        otherwise
         """
         super().__init__(**kw)
 
-        self.files_processed = 0
-        self.total_files = 0
+        self.engine = None
+        self.progress = Progress()
+        self.refresh = None
+        self.errors = 0
 
         self.dirs = {}  # data on all directories to be processed from Main Screen widget
         self.total_dirs = 1
         self.current_dir = 1
 
-        self.inp: str = ''
-        self.out: str = ''
-        self.grid_mode: bool = True
-        self.stack_mode: bool = False
-        self.x_dim: int = 2
-        self.y_dim: int = 2
-        self.framerate: int = 7
-        self.is_gif: bool = False
-
         self.parallelism = False
 
     def thread_it(self):
         """
         Called upon entering the Loading Screen.
 
-        Fetches data from the Main Screen, configures Multithreading and starts worker to process the
-        data in the given folder.
+        Fetches data from the Main Screen and submits every directory to a new Engine, a task per group of files
+        (or per animation), so that even a single directory is spread across all the worker processes.
         """
 
-        self.parallelism = self.msc.ids.parallelism.active  # if true, run in multithreaded mode
-
-        self.files_processed = 0
-        self.total_files = 0
+        self.parallelism = self.msc.ids.parallelism.active  # if true, use all the CPUs
 
         self.progress_back_button.bind(on_press=self.reset_current_dir_index)
 
         self.dirs = self.msc.get_dirs()  # this is fetching the info about dirs from the widget in the main screen
         self.total_dirs = len(self.dirs)
 
-        if self.parallelism:  # get total number of files in all provided directories
-            for d in self.dirs:
-                self.total_files += get_total_files(self.dirs[d]['inp'],
-                                                    files=self.dirs[d]['grid_mode'],
-                                                    dirs=self.dirs[d]['stack_mode'])
-
-        def worker():
-            while True:
-                item = q.get()  # directory data -> {'inp': input_path, 'out': output_path ... 'is_gif': False}
-                self.submit(item)
-                q.task_done()
-
-                if not self.parallelism:
-                    self.files_processed = 0
-
-        q = Queue()
+        self.engine = Engine(jobs=None if self.parallelism else 1)
+        self.progress = Progress()
+        self.errors = 0
 
-        for item in self.dirs:
-            q.put(self.dirs[item])
+        self.progress_cancel_button.opacity = 1
+        self.progress_cancel_button.disabled = False
 
-        thread_max = 1 if not self.parallelism else psutil.cpu_count(logical=True) // 2
-        thread_max = len(self.dirs) if len(self.dirs) < thread_max else thread_max
+        for key, d in self.dirs.items():  # total number of files in the directory, scanned when it was validated
+            self.progress.add_dir(key, d['catalog'].total_files)
+            self.submit(d, key)
 
-        for i in range(thread_max):  # 1 if parallelism ain't selected
-            t = threading.Thread(target=worker)
-            t.daemon = True
-            t.start()
+        self.refresh = Clock.schedule_interval(self.update_bar, 1 / self.refresh_rate)
 
     def update_bar(self, dt):
         """
-        Updates the progress bar and it's associated parameters such (i.e., label and button) according to the
-        progress of the image merge. Triggered by a Clock event.
+        Collects the progress reported by the engine, and updates the progress bar and it's associated parameters
+        such (i.e., label and buttons) accordingly. Triggered by a Clock event at a fixed rate.
 
         :param dt: delta time, when the even is triggered by the Kivy internal Clock object
         """
-        self.progress_label.text = "\n".join([f'Directory {self.current_dir} out of {self.total_dirs}',
-                                              f"{self.files_processed} files out of {self.total_files}",
-                                              f"{int(self.normalize() * 100)}% out of 100%"])
+        for key, files, error in self.engine.poll():
+            if files is None and not self.engine.cancelled:  # the bar completes even if some files were not counted
+                self.progress.finish(key)
 
-        self.progress_bar.value = self.normalize()
+            elif files is not None:
+                self.progress.advance(key, files)
+                self.errors += error is not None
 
-        def bar_complete():
-            self.progress_label.text += f"\nDONE!"
-            self.progress_back_button.opacity = 1
-            self.progress_back_button.disabled = False
+        s = self.progress.snapshot()
+        fraction = s['done'] / s['total'] if s['total'] else 1
+
+        self.current_dir = min(s['dirs_done'] + 1, self.total_dirs)
+
+        eta = time.strftime('%H:%M:%S', time.gmtime(s['eta'])) if s['eta'] is not None else '--:--:--'
+        lines = [f'Directory {self.current_dir} out of {self.total_dirs}',
+                 f"{s['done']} files out of {s['total']}",
+                 f"{int(fraction * 100)}% out of 100%",
+                 f"{s['rate']:.1f} files/s, {eta} left"]
+
+        for key, (done, total) in s['dirs'].items():  # directories in progress
+            if 0 < done < total:
+                lines.append(f"{os.path.basename(self.dirs[key]['inp'])}: {done} out of {total}")
+
+        if self.errors:
+            lines.append(f"{self.errors} output(s) failed")
 
-        if not self.parallelism:  # progress bar behaviour if parallelism is NOT enabled
-            if self.progress_bar.value == 1 and self.current_dir >= self.total_dirs:
-                bar_complete()
+        if self.engine.cancelled:
+            lines.append("Cancelling...")
 
-            elif self.progress_bar.value == 1 and self.current_dir < self.total_dirs:
-                self.progress_bar.value = 0
+        self.progress_label.text = "\n".join(lines)
+        self.progress_bar.value = fraction
 
-        if self.parallelism and self.progress_bar.value == 1:
-            bar_complete()
+        if self.engine.finished:
+            self.refresh.cancel()
+            self.engine.shutdown()
 
-    def normalize(self):
+            self.progress_label.text = "\n".join(lines[:-1] + ["CANCELLED"]) if self.engine.cancelled else \
+                self.progress_label.text + f"\nDONE!"
+
+            self.progress_cancel_button.opacity = 0
+            self.progress_cancel_button.disabled = True
+            self.progress_back_button.opacity = 1
+            self.progress_back_button.disabled = False
+
+    def cancel(self):
         """
-        Normalises the value of processed images to total images on the scale of 0 - 1 for easier display in the
-        progress bar.
+        Cancel button functionality. Cancels the groups of files (or animations) not started yet, while the ones
+        being processed are left to finish, so that no output is left half-written.
         """
-        return (self.files_processed - 0) / (self.total_files - 0)
+        if self.engine is not None:
+            self.engine.cancel()
 
-    def submit(self, d):
+        self.progress_cancel_button.disabled = True
+
+    def submit(self, d, key):
         """
         Function to setup the image processing in the provided folder and mode.
 
-        Takes in input from the GUI to establish the directories and other settings.
-
-        Clock object triggers the update of the GUI in the main thread.
+        Takes in input from the GUI to establish the directories and other settings, and submits the directory to the
+        engine.
 
         :param d: a dictionary containing information about the entry
-        """
-
-        self.inp = d['inp']
-        self.out = d['out']
-        self.grid_mode = d['grid_mode']
-        self.stack_mode = d['stack_mode']
-        self.x_dim = d['x_dim']
-        self.y_dim = d['y_dim']
-        self.framerate = d['framerate']
-        self.is_gif = d['is_gif']
-
-        if not self.parallelism:
-            self.total_files = get_total_files(d['inp'], files=d['grid_mode'], dirs=d['stack_mode'])
-
-        if self.grid_mode:
-            for n in fetch_files(path=self.inp,
-                                 outpath=self.out,
-                                 dim_x=int(self.x_dim),
-                                 dim_y=int(self.y_dim)):
-                self.files_processed += n
-                Clock.schedule_once(self.update_bar)  # updates the progress bar through the Main thread
-
-        elif self.stack_mode:
-            for n in fetch_dirs(path=self.inp,
-                                outpath=self.out,
-                                gif=bool(self.is_gif),
-                                framerate=int(self.framerate)):
-                self.files_processed += n
-                Clock.schedule_once(self.update_bar)
-
-        self.current_dir += 1
+        :param key: key of the directory in the progress
+        """
+
+        if d['grid_mode']:
+            self.engine.submit_grids(key,
+                                     path=d['inp'],
+                                     outpath=d['out'],
+                                     dim_x=int(d['x_dim']),
+                                     dim_y=int(d['y_dim']),
+                                     scale=SCALES[d['scale']],
+                                     catalog=d['catalog'])
+
+        elif d['stack_mode']:
+            self.engine.submit_stacks(key,
+                                      path=d['inp'],
+                                      outpath=d['out'],
+                                      gif=bool(d['is_gif']),
+                                      framerate=int(d['framerate']),
+                                      scale=SCALES[d['scale']],
+                                      catalog=d['catalog'])
 
     def reset_current_dir_index(self, instance):
         """
@@ -272,6 +264,7 @@ class WindowsFileChooser(Widget):
     :param y_dim: if grid mode is True, number of rows
     :param framerate: if stack mode is True, framerate of animations to produce
     :param is_gif: if True, animations produced will be in GIF format. MP4 otherwise.
+    :param scale: fraction of the resolution to read the images at and make the outputs in
     :param parallelism: if True, multi-threads the application when running the merging.
     """
     inp = ObjectProperty(None)
@@ -282,6 +275,7 @@ class WindowsFileChooser(Widget):
     y_dim = ObjectProperty(defaultvalue=2)
     framerate = ObjectProperty(defaultvalue=7)
     is_gif = ObjectProperty(defaultvalue=False)
+    scale = ObjectProperty(None)
     parallelism = ObjectProperty(None)
 
     def __init__(self, **kwargs):
@@ -292,10 +286,12 @@ class WindowsFileChooser(Widget):
 
            :param dirs: stores information on all the directories that need to be analysed
            :param total_dirs: keeps track of total number of directories added, so that specified limit is not exceeded
+           :param catalogs: catalogs of the input paths validated so far, so that every path is only scanned once
         """
         super().__init__(**kwargs)
 
         self.dirs = {}
+        self.catalogs = {}
         self.dirs_limit = 10  # max number of dirs allowed
         self.current_dir = 1
 
@@ -337,8 +333,9 @@ class WindowsFileChooser(Widget):
 
         :return: a directory, which contains information about the directories to be processed and their settings.
         """
-        dirs_copy = copy.deepcopy(self.dirs)
+        dirs_copy = {k: dict(v) for k, v in self.dirs.items()}  # catalogs are shared, not copied
         self.dirs.clear()
+        self.catalogs.clear()
         self.parallelism.active = False
 
         return dirs_copy
@@ -362,6 +359,7 @@ class WindowsFileChooser(Widget):
             self.y_dim.text = self.dirs[self.current_dir]['y_dim']
             self.framerate.text = self.dirs[self.current_dir]['framerate']
             self.is_gif.active = self.dirs[self.current_dir]['is_gif']
+            self.scale.text = self.dirs[self.current_dir]['scale']
 
     def clear_fields(self):
         """
@@ -374,6 +372,7 @@ class WindowsFileChooser(Widget):
         self.y_dim.text = ""
         self.framerate.text = ""
         self.is_gif.active = False
+        self.scale.text = "1"
 
     def collect_data(self):
         """
@@ -389,10 +388,12 @@ class WindowsFileChooser(Widget):
             'x_dim': self.x_dim.text,
             'y_dim': self.y_dim.text,
             'framerate': self.framerate.text,
-            'is_gif': self.is_gif.active
+            'is_gif': self.is_gif.active,
+            'scale': self.scale.text,
         }
 
         if not self.check_values() and self.path_validation():
+            current['catalog'] = self.catalogs[self.inp.text]
             self.dirs[self.current_dir] = current
 
     def path_validation(self):
@@ -403,8 +404,15 @@ class WindowsFileChooser(Widget):
         :return True, if directories are valid. A popup will not be displayed. False otherwise.
         """
 
-        return os.path.isdir(self.inp.text) and os.path.isdir(self.out.text) and inpath_type(
-            self.inp.text) == self.grid_mode.active
+        if not (os.path.isdir(self.inp.text) and os.path.isdir(self.out.text)):
+            return False
+
+        catalog = self.catalogs.get(self.inp.text) or PlateCatalog(self.inp.text)
+
+        if catalog.mode is not None:  # invalid paths are scanned again, their contents may be fixed in the meantime
+            self.catalogs[self.inp.text] = catalog
+
+        return catalog.mode == self.grid_mode.active
 
     def back(self):
         """
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+import src.ui.cli.arg as arg
+
+
+@pytest.fixture
+def parse(tmp_path, monkeypatch):
+    """
+    Parses the given arguments of a run from the command line, returning the arguments the run was started with.
+    """
+    def parse(*argv):
+        runs = []
+        monkeypatch.setattr(sys, 'argv', ['roboworm', str(tmp_path), str(tmp_path)] + list(argv))
+        monkeypatch.setattr(arg, 'run', lambda p, args: runs.append(args))
+        arg.arg_init()
+
+        return runs[0]
+
+    return parse
+
+
+def test_jobs_default_to_the_cpu_cores(parse):
+    assert parse().jobs == (os.cpu_count() or 1)
+    assert parse('-j', '3').jobs == 3
+
+
+def test_pipeline_runs_a_single_job(parse):
+    args = parse('--pipeline')
+
+    assert args.pipeline and args.jobs == 1
+    assert parse('--pipeline', '-j', '1').jobs == 1
+
+
+def test_pipeline_cannot_run_several_jobs(parse, capsys):
+    with pytest.raises(SystemExit) as e:
+        parse('--pipeline', '-j', '2')
+
+    assert e.value.code == 2
+    assert '--pipeline' in capsys.readouterr().err
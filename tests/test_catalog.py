@@ -0,0 +1,85 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from src.model.catalog import PlateCatalog, timepoint
+from src.model.setup import fetch_dirs
+from src.model.watch import Watcher
+
+
+@pytest.fixture
+def stack(tmp_path) -> str:
+    plate = tmp_path / 'plate'
+    plate.mkdir()
+    (plate / 'plate.HTD').write_text('"HTSInfoFile", Version 1.0\n"TimePoints", 11\n')
+
+    for t in range(1, 12):
+        os.mkdir(plate / f"TimePoint_{t}")
+
+        for well in ('A01', 'A02'):
+            cv2.imwrite(str(plate / f"TimePoint_{t}" / f"plate_{well}.tif"), np.full((8, 8), t * 20, dtype=np.uint8))
+
+    return str(plate)
+
+
+def test_timepoint():
+    assert timepoint('/data/plate/TimePoint_10') == 10
+
+
+def test_frame_folders_in_the_order_of_the_timepoints(stack):
+    catalog = PlateCatalog(stack)
+
+    assert catalog.mode is False
+    assert [timepoint(d) for d in catalog.dirs] == list(range(1, 12))
+    assert catalog.filenames == ['plate_A01.tif', 'plate_A02.tif']
+    assert [timepoint(os.path.dirname(p)) for p in catalog.frames('plate_A01.tif')] == list(range(1, 12))
+    assert catalog.total_files == 22
+
+
+def test_watch_and_batch_runs_agree(stack, tmp_path):
+    watcher = Watcher(stack, str(tmp_path), gif=True, incremental=True, settle=0)
+    list(watcher.poll())
+    list(watcher.close())
+
+    assert watcher.frames['plate_A01.tif'] == PlateCatalog(stack).frames('plate_A01.tif')
+
+    # the animations made while watching are current for an incremental batch run, which only reports them as skipped
+    assert list(fetch_dirs(stack, str(tmp_path), gif=True, framerate=7, incremental=True)) == [22]
+
+
+def test_grid(tmp_path):
+    for name in ('plate_A02_s1.tif', 'plate_A01_s1.tif', 'plate_A01_s1_Thumb.tif', 'plate.HTD'):
+        (tmp_path / name).write_bytes(b'')
+
+    catalog = PlateCatalog(str(tmp_path))
+
+    assert catalog.mode is True
+    assert catalog.files == ['plate_A01_s1.tif', 'plate_A02_s1.tif']  # sorted, without thumbnails and descriptors
+    assert catalog.htd == str(tmp_path / 'plate.HTD')
+    assert catalog.total_files == 2
+
+
+@pytest.mark.parametrize('names', [['notes.txt'], ['TimePoint_1/', 'TimePoint_2/'], ['Samples/', 'plate.HTD']])
+def test_invalid_paths(tmp_path, names):
+    for name in names:
+        if name.endswith('/'):
+            (tmp_path / name).mkdir()
+
+        else:
+            (tmp_path / name).write_bytes(b'')
+
+    catalog = PlateCatalog(str(tmp_path))
+
+    assert catalog.mode is None
+    assert catalog.total_files == 0
+
+
+def test_missing_frames(stack):
+    os.remove(os.path.join(stack, 'TimePoint_3', 'plate_A02.tif'))
+    catalog = PlateCatalog(stack)
+
+    assert catalog.missing() == {'plate_A02.tif': ['TimePoint_3']}
+    assert len(catalog.frames('plate_A02.tif')) == 10
+    assert catalog.total_files == 21
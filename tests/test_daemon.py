@@ -0,0 +1,109 @@
+import os
+import stat
+import threading
+
+import pytest
+
+import src.ui.cli.daemon as daemon
+from benchmarks.synthetic import make_plate
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    """
+    Daemon, which is not serving, to parse jobs with.
+    """
+    jobs = daemon.Daemon(str(tmp_path / 'daemon.sock'), 1)
+
+    yield jobs
+
+    jobs.server_close()
+    jobs.pool.shutdown(wait=True)
+
+
+@pytest.fixture
+def server(jobs):
+    thread = threading.Thread(target=jobs.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+
+    yield jobs
+
+    jobs.shutdown()
+
+
+def test_socket_is_private(tmp_path):
+    umask = os.umask(0o022)
+
+    try:
+        server = daemon.Daemon(str(tmp_path / 'daemon.sock'), 1)
+
+    finally:
+        restored = os.umask(umask)
+
+    server.server_close()
+
+    assert stat.S_IMODE(os.stat(server.server_address).st_mode) == 0o600  # created so, rather than changed later
+    assert restored == 0o022  # the umask of the process is left as it was
+
+
+def test_jobs_are_parsed_as_the_command_line(jobs, tmp_path):
+    args = jobs.parse({'inpath': str(tmp_path), 'outpath': str(tmp_path), 'dim': [3, 4], 'g': False,
+                         'native': True, 'scale': '1/2', 'projection': ['max', 'std'], 'background': [0, 0, 0]})
+
+    assert (args.dim, args.g, args.native, args.scale) == ([3, 4], False, True, '1/2')
+    assert (args.projection, args.background, args.gutter, args.fr) == (['max', 'std'], [0, 0, 0], 0, 7)
+    assert args.jobs == 1 and not args.pipeline
+
+
+@pytest.mark.parametrize('job, message', [({'scale': '3'}, "argument --scale: invalid choice: '3'"),
+                                          ({'dim': 'x'}, 'argument -dim: expected 2 arguments'),
+                                          ({'dim': [3, 'x']}, "argument -dim: invalid int value: 'x'"),
+                                          ({'gutter': -1}, 'argument --gutter: invalid choice: -1'),
+                                          ({'format': 'bmp'}, "argument --format: invalid choice: 'bmp'"),
+                                          ({'preset': 'tiny'}, "argument --preset: invalid choice: 'tiny'"),
+                                          ({'fr': '7'}, None),
+                                          ({'fr': 'fast'}, "invalid int value: 'fast'"),
+                                          ({'native': 'yes'}, 'argument --native: expected true or false'),
+                                          ({'projection': ['max', '--native']}, 'argument --projection: invalid'),
+                                          ({'inpath': 'missing'}, 'argument inpath: Provided directory is not valid'),
+                                          ({'jobs': 4}, 'Unknown parameter(s) of the job: jobs.')])
+def test_invalid_jobs(jobs, tmp_path, job, message):
+    job = dict({'inpath': str(tmp_path), 'outpath': str(tmp_path)}, **job)
+
+    if message is None:
+        assert jobs.parse(job).fr == 7
+        return
+
+    with pytest.raises(ValueError) as e:
+        jobs.parse(job)
+
+    assert message in str(e.value)
+
+
+def test_submit(server, tmp_path):
+    plate = make_plate(str(tmp_path), wells=2, sites=4, size=(8, 8), bit_depth=8)
+    out = tmp_path / 'out'
+    out.mkdir()
+
+    events = list(daemon.submit({'inpath': plate, 'outpath': str(out), 'gutter': 2}, server.server_address))
+
+    assert events[0]['event'] == 'accepted' and events[0]['total'] == 8
+    assert events[-1]['event'] == 'done' and events[-1]['done'] == 8
+    assert len(os.listdir(out / f"{os.path.basename(plate)}_out")) == 2
+
+    events = list(daemon.submit({'inpath': plate, 'outpath': str(out), 'scale': '3'}, server.server_address))
+
+    assert [event['event'] for event in events] == ['error']
+    assert events[0]['message'].startswith("argument --scale: invalid choice: '3'")
+
+
+def test_pipeline_jobs_run_in_the_daemon(server, tmp_path):
+    plate = make_plate(str(tmp_path), wells=2, sites=4, size=(8, 8), bit_depth=8)
+    out = tmp_path / 'out'
+    out.mkdir()
+
+    args = server.parse({'inpath': plate, 'outpath': str(out), 'pipeline': True})
+    events = list(daemon.submit({'inpath': plate, 'outpath': str(out), 'pipeline': True}, server.server_address))
+
+    assert args.jobs == 1
+    assert events[-1]['event'] == 'done' and events[-1]['done'] == 8
@@ -0,0 +1,57 @@
+import io
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.model.encode import encode_animation, encode_grid, encode_image
+from src.model.encoder import Encoder
+
+
+def tile(value: int) -> np.ndarray:
+    return np.full((10, 12, 3), value, dtype=np.uint8)
+
+
+def test_encode_image_round_trip():
+    img = np.arange(10 * 12 * 3, dtype=np.uint8).reshape(10, 12, 3)
+
+    assert np.array_equal(cv2.imdecode(np.frombuffer(encode_image(img), np.uint8), cv2.IMREAD_UNCHANGED), img)
+
+
+def test_encode_image_into_file_object():
+    out = io.BytesIO()
+
+    assert encode_image(tile(0), fmt='webp', preset='small', out=out) == len(out.getvalue()) > 0
+    assert out.getvalue()[8:12] == b'WEBP'
+
+
+def test_encode_grid():
+    data = encode_grid([tile(0), tile(50), tile(100), tile(150)], 2, 2, gutter=2)
+    grid = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+
+    assert grid.shape == (22, 26, 3)
+    assert grid[0, 0, 0] == 0 and grid[-1, -1, 0] == 150 and grid[10, 12, 0] == 255
+
+
+def test_encode_animation():
+    gif = Image.open(io.BytesIO(encode_animation([tile(0), tile(100), tile(200)], framerate=10)))
+
+    assert gif.n_frames == 3
+
+
+@pytest.mark.parametrize('call', [lambda: encode_image(tile(0), fmt='bmp'),
+                                  lambda: encode_grid([tile(0)], 2, 2),
+                                  lambda: encode_animation([tile(0)], fmt='avi'),
+                                  lambda: encode_animation([])])
+def test_invalid_input(call):
+    with pytest.raises(ValueError):
+        call()
+
+
+@pytest.mark.parametrize('fmt', ['png', 'jpeg', 'webp'])
+def test_encode_image_defaults_to_the_preset_of_the_command_line(fmt):
+    img = np.arange(10 * 12 * 3, dtype=np.uint8).reshape(10, 12, 3)
+
+    assert encode_image(img, fmt=fmt) == Encoder(fmt).encode(img)
+    assert encode_grid([img] * 4, 2, 2, fmt=fmt) == encode_grid([img] * 4, 2, 2, fmt=fmt, preset='fast')
@@ -0,0 +1,50 @@
+import cv2
+import numpy as np
+import pytest
+
+from src.model.encoder import Encoder
+
+
+@pytest.fixture
+def image() -> np.ndarray:
+    y, x = np.mgrid[0:192, 0:256]
+    rng = np.random.default_rng(0)
+    img = (np.sin(x / 9.0) * np.cos(y / 13.0) * 100 + 128 + rng.normal(0, 3, x.shape)).clip(0, 255)
+
+    return cv2.cvtColor(img.astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+
+@pytest.mark.parametrize('fmt', ['png', 'jpeg', 'webp'])
+def test_presets_get_smaller(fmt, image):
+    sizes = [len(Encoder(fmt, preset).encode(image)) for preset in ('fast', 'balanced', 'small')]
+
+    assert sizes[0] > sizes[1] > sizes[2]
+
+
+def test_fast_png_is_the_default_of_opencv(image):
+    assert Encoder().encode(image) == cv2.imencode('.png', image)[1].tobytes()
+
+
+def test_png_is_lossless_at_any_depth(tmp_path):
+    img = np.arange(64 * 48, dtype=np.uint16).reshape(48, 64) * 16
+
+    Encoder('png', 'small').write(img, str(tmp_path / 'grid'))
+
+    assert np.array_equal(cv2.imread(str(tmp_path / 'grid.png'), cv2.IMREAD_UNCHANGED), img)
+
+
+def test_lossy_formats_are_8_bit():
+    img = np.full((16, 16), 4095, dtype=np.uint16)
+    decoded = cv2.imdecode(np.frombuffer(Encoder('jpg').encode(img), np.uint8), cv2.IMREAD_UNCHANGED)
+
+    assert decoded.dtype == np.uint8
+
+
+def test_quality_overrides_the_preset():
+    assert Encoder('webp', 'small', quality=95).params == [cv2.IMWRITE_WEBP_QUALITY, 95]
+
+
+@pytest.mark.parametrize('fmt, preset', [('bmp', 'fast'), ('png', 'tiny')])
+def test_invalid_encoder(fmt, preset):
+    with pytest.raises(ValueError):
+        Encoder(fmt, preset)
@@ -0,0 +1,170 @@
+import os
+import time
+
+import pytest
+
+import src.model.progress as progress
+from benchmarks.synthetic import make_plate
+from src.model.engine import Engine
+from src.model.progress import Progress
+from src.model.setup import fetch_files
+
+
+def run(engine: Engine,
+        timeout: float = 60) -> list:
+    """
+    Events of an engine until all its tasks are finished.
+    """
+    events = []
+    deadline = time.monotonic() + timeout
+
+    while not engine.finished or not engine.events.empty():
+        assert time.monotonic() < deadline
+        events += engine.poll()
+        time.sleep(0.01)
+
+    return events
+
+
+def outputs(path: str) -> dict:
+    found = {}
+
+    for file in sorted(os.listdir(path)):
+        with open(os.path.join(path, file), 'rb') as f:
+            found[file] = f.read()
+
+    return found
+
+
+@pytest.fixture
+def engine():
+    engine = Engine(jobs=2)
+
+    yield engine
+
+    engine.shutdown(wait=True)
+
+
+def test_grids_match_the_command_line(tmp_path, engine):
+    plate = make_plate(str(tmp_path), wells=3, sites=4, size=(24, 16), bit_depth=16)
+    out = tmp_path / 'engine'
+    out.mkdir()
+
+    engine.submit_grids('plate', plate, str(out), 2, 2, background=(0, 128, 255), gutter=3, native=True)
+    events = run(engine)
+
+    assert sum(files for _, files, _ in events if files) == 12
+    assert all(error is None for _, _, error in events)
+    assert events[-1] == ('plate', None, None)
+
+    list(fetch_files(plate, str(tmp_path / 'cli'), 2, 2, jobs=1, background=(0, 128, 255), gutter=3, native=True))
+
+    name = os.path.basename(plate) + '_out'
+    assert outputs(out / name) == outputs(tmp_path / 'cli' / name)
+
+
+def test_events_of_several_directories(tmp_path, engine):
+    grid = make_plate(str(tmp_path), wells=2, sites=4, size=(8, 8), bit_depth=8)
+    stack = make_plate(str(tmp_path), mode='stack', wells=2, sites=1, timepoints=3, size=(8, 8), bit_depth=8)
+
+    with open(os.path.join(grid, 'Phenotype-0000_B01_s1.TIF'), 'wb') as f:
+        f.write(b'not an image')  # a file of no well of the plate, counted as soon as the directory is submitted
+
+    out = str(tmp_path / 'out')
+    engine.submit_grids('grid', grid, out, 2, 2)
+    engine.submit_stacks('stack', stack, out, gif=True)
+    events = run(engine)
+
+    for key, total, tasks in (('grid', 9, 2), ('stack', 6, 2)):
+        found = [(files, error) for k, files, error in events if k == key]
+
+        assert sum(files for files, _ in found if files) == total
+        assert len([files for files, _ in found if files]) == tasks + (key == 'grid')
+        assert found[-1] == (None, None)  # the end of the directory is reported last
+
+
+def test_errors_are_reported(tmp_path, engine):
+    plate = make_plate(str(tmp_path), wells=2, sites=4, size=(8, 8), bit_depth=8)
+
+    with open(os.path.join(plate, 'Phenotype-0000_A02_s3.TIF'), 'wb') as f:
+        f.write(b'not an image')
+
+    engine.submit_grids('plate', plate, str(tmp_path / 'out'), 2, 2)
+    errors = [error for _, files, error in run(engine) if files]
+
+    assert errors.count(None) == 1
+    assert isinstance([error for error in errors if error is not None][0], AttributeError)
+
+
+def test_cancel_stops_the_pending_tasks(tmp_path):
+    plate = make_plate(str(tmp_path), wells=24, sites=4, size=(8, 8), bit_depth=8)
+    engine = Engine(jobs=1)
+
+    try:
+        engine.submit_grids('plate', plate, str(tmp_path / 'out'), 2, 2)
+        engine.cancel()
+        events = run(engine)
+
+        cancelled = [future for future in engine.futures if future.cancelled()]
+
+        assert len(cancelled) >= 20  # only the tasks already handed over to the worker process are run
+        assert sum(files for _, files, _ in events if files) == 4 * (24 - len(cancelled))
+        assert events[-1] == ('plate', None, None)
+
+        engine.submit_grids('later', plate, str(tmp_path / 'out'), 2, 2)  # nothing is run after a cancel
+
+        assert engine.poll() == [('later', None, None)]
+
+    finally:
+        engine.shutdown(wait=True)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(progress.time, 'monotonic', lambda: now[0])
+
+    return now
+
+
+def test_progress_aggregates_the_directories(clock):
+    p = Progress()
+    p.add_dir('a', 10)
+    p.add_dir('b', 30)
+
+    p.advance('a', 4)
+    p.advance('b')
+    p.finish('a')
+
+    snapshot = p.snapshot()
+
+    assert snapshot['dirs'] == {'a': (10, 10), 'b': (1, 30)}
+    assert (snapshot['done'], snapshot['total'], snapshot['dirs_done']) == (11, 40, 1)
+    assert not p.finished
+
+    p.finish('b')
+
+    assert p.finished
+
+
+def test_progress_rate_and_eta(clock):
+    p = Progress(window=5.0)
+    p.add_dir('a', 100)
+
+    assert p.snapshot()['eta'] is None  # no rate yet
+
+    for _ in range(4):
+        clock[0] += 1
+        p.advance('a', 10)
+        snapshot = p.snapshot()
+
+    assert snapshot['rate'] == pytest.approx(10)
+    assert snapshot['eta'] == pytest.approx(6)
+    assert snapshot['elapsed'] == pytest.approx(4)
+
+    for _ in range(6):  # stalled, the rate only covers the last 5 seconds
+        clock[0] += 1
+        snapshot = p.snapshot()
+
+    assert snapshot['rate'] == 0
+    assert snapshot['eta'] is None
@@ -0,0 +1,155 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+
+from src.model.gif_encoder import GifWriter, Palette
+
+
+def gray(value: int,
+         box: tuple = None) -> np.ndarray:
+    """
+    Grayscale frame filled with 10, with the given box (top, bottom, left, right) filled with value.
+    """
+    frame = np.full((30, 40), 10, dtype=np.uint8)
+    top, bottom, left, right = box or (0, 30, 0, 40)
+    frame[top:bottom, left:right] = value
+
+    return frame
+
+
+def encode(frames: list,
+           framerate: int = 7,
+           checkpoints: tuple = ()) -> bytes:
+    buffer = io.BytesIO()
+    palette = Palette.from_frames(frames)
+
+    with GifWriter(buffer, (frames[0].shape[1], frames[0].shape[0]), palette, framerate=framerate) as writer:
+        for i, frame in enumerate(frames):
+            writer.write(frame)
+
+            if i in checkpoints:
+                writer.checkpoint()
+
+    return buffer.getvalue()
+
+
+def decode(data: bytes) -> tuple:
+    """
+    Frames (as grayscale arrays) and durations (in ms) of a GIF.
+    """
+    gif = Image.open(io.BytesIO(data))
+    frames, durations = [], []
+
+    for frame in ImageSequence.Iterator(gif):
+        frames.append(np.asarray(frame.convert('L')))
+        durations.append(frame.info['duration'])
+
+    return frames, durations
+
+
+def descriptors(data: bytes) -> list:
+    """
+    (left, top, width, height) of the image descriptors of a GIF, which has a global colour table of 256 colours.
+    """
+    boxes = []
+    i = 13 + 256 * 3
+
+    def skip_sub_blocks(i):
+        while data[i]:
+            i += data[i] + 1
+
+        return i + 1
+
+    while data[i] != 0x3B:
+        if data[i] == 0x21:  # extension
+            i = skip_sub_blocks(i + 2)
+
+        else:  # image descriptor, followed by the minimum code size and the LZW data
+            boxes.append(struct.unpack('<HHHH', data[i + 1:i + 9]))
+            i = skip_sub_blocks(i + 11)
+
+    return boxes
+
+
+def test_frames_and_delays():
+    frames = [gray(v) for v in (0, 50, 100, 150, 200, 250, 30)]
+    decoded, durations = decode(encode(frames, framerate=7))
+
+    assert len(decoded) == 7
+    assert all(np.array_equal(a, b) for a, b in zip(decoded, frames))
+    assert durations == [140, 150, 140, 140, 140, 150, 140]  # 100 / 7 hundredths, without adding up rounding errors
+    assert sum(durations) == 1000
+
+
+def test_delays_have_a_lower_limit():
+    _, durations = decode(encode([gray(0), gray(100)], framerate=100))
+
+    assert durations == [20, 20]
+
+
+def test_identical_frames_extend_the_previous_one():
+    frames = [gray(0), gray(0), gray(0), gray(200)]
+    decoded, durations = decode(encode(frames, framerate=10))
+
+    assert len(decoded) == 2
+    assert durations == [300, 100]
+
+
+def test_only_changed_pixels_are_stored_and_drawn_over_the_previous_frame():
+    frames = [gray(10), gray(255, (5, 8, 10, 12)), gray(255, (5, 8, 10, 12))]
+    data = encode(frames)
+    decoded, _ = decode(data)
+
+    assert len(decoded) == 2
+    assert np.array_equal(decoded[1], frames[1])
+    assert descriptors(data) == [(0, 0, 40, 30), (10, 5, 2, 3)]  # only the bounding box of the changed pixels
+
+    gif = Image.open(io.BytesIO(data))
+    gif.seek(1)
+
+    assert gif.disposal_method == 1  # left in place
+
+
+@pytest.mark.parametrize('checkpoints', [(0,), (1, 2), (0, 1, 2, 3)])
+def test_checkpoints_leave_the_animation_unchanged(checkpoints):
+    frames = [gray(0), gray(0), gray(80), gray(160)]
+
+    assert encode(frames, checkpoints=checkpoints) == encode(frames)
+
+
+def test_checkpoint_makes_a_complete_animation():
+    buffer = io.BytesIO()
+    frames = [gray(0), gray(80), gray(80)]
+
+    with GifWriter(buffer, (40, 30), Palette.from_frames(frames), framerate=10) as writer:
+        for frame in frames:
+            writer.write(frame)
+
+        writer.checkpoint()
+        snapshot = buffer.getvalue()
+
+        writer.write(gray(80))  # identical frame after a checkpoint, which patches the delay of the frame written
+        writer.checkpoint()
+        patched = buffer.getvalue()
+
+        writer.write(gray(160))
+
+    assert snapshot.endswith(b';')
+    assert decode(snapshot)[1] == [100, 200]
+    assert decode(patched)[1] == [100, 300]
+    assert decode(buffer.getvalue())[1] == [100, 300, 100]
+
+
+def test_colour_palette():
+    rng = np.random.default_rng(0)
+    colours = rng.integers(0, 256, (8, 3), dtype=np.uint8)
+    frame = colours[rng.integers(0, 8, (30, 40))]
+
+    palette = Palette.from_frames([frame])
+    decoded = np.asarray(Image.open(io.BytesIO(encode([frame]))).convert('RGB'))
+
+    assert palette.lut is not None
+    assert np.abs(decoded.astype(int) - frame[..., ::-1]).max() <= 4  # 15-bit bins, averaged within each bin
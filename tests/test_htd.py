@@ -0,0 +1,94 @@
+import pytest
+
+from benchmarks.synthetic import htd
+from src.model.htd import FILENAME, PlateLayout, read_htd, well_name
+
+
+@pytest.fixture
+def descriptor(tmp_path):
+    path = tmp_path / 'plate.HTD'
+    path.write_text('"HTSInfoFile", Version 1.0\n'
+                    '"Description", "Phenotype, day 2"\n'
+                    '"TimePoints", 3\n'
+                    '"XWells", 3\n'
+                    '"YWells", 2\n'
+                    '"WellsSelection1", TRUE, FALSE, TRUE\n'
+                    '"WellsSelection2", FALSE, TRUE, FALSE\n'
+                    '"Sites", TRUE\n'
+                    '"XSites", 2\n'
+                    '"YSites", 2\n'
+                    '"SiteSelection1", TRUE, TRUE\n'
+                    '"SiteSelection2", FALSE, TRUE\n'
+                    '"EndFile"\n')
+
+    return str(path)
+
+
+def test_read_htd(descriptor):
+    entries = read_htd(descriptor)
+
+    assert entries['TimePoints'] == [3]
+    assert entries['WellsSelection1'] == [True, False, True]
+    assert entries['Sites'] == [True]
+    assert entries['HTSInfoFile'] == ['Version 1.0']
+    assert entries['EndFile'] == []
+
+
+def test_layout(descriptor):
+    layout = PlateLayout.from_file(descriptor)
+
+    assert (layout.rows, layout.columns, layout.timepoints) == (2, 3, 3)
+    assert layout.wells == ['A01', 'A03', 'B02']
+    assert (layout.x_sites, layout.y_sites, layout.sites) == (2, 2, [1, 2, 4])
+
+
+@pytest.mark.parametrize('sites, expected', [(1, (1, 1, [1])), (6, (3, 2, [1, 2, 3, 4, 5, 6]))])
+def test_layout_sites(tmp_path, sites, expected):
+    path = tmp_path / 'plate.HTD'
+    path.write_text(htd(2, sites, 1))
+    layout = PlateLayout.from_file(str(path))
+
+    assert layout.wells == ['A01', 'A02']
+    assert (layout.x_sites, layout.y_sites, layout.sites) == expected
+
+
+def test_layout_without_wells(tmp_path):
+    path = tmp_path / 'plate.HTD'
+    path.write_text('"HTSInfoFile", Version 1.0\n"TimePoints", 1\n')
+
+    assert PlateLayout.from_file(str(path)) is None
+
+
+@pytest.mark.parametrize('well, position', [('A01', (0, 0)), ('B03', (1, 2)), ('P24', (15, 23)),
+                                            ('Z48', (25, 47)), ('AA01', (26, 0)), ('AF48', (31, 47))])
+def test_position(well, position):
+    layout = PlateLayout(rows=32, columns=48, wells=[])
+
+    assert layout.position(well) == position
+    assert well_name(*position) == well
+
+
+def test_site_position():
+    layout = PlateLayout(rows=1, columns=1, wells=['A01'], x_sites=3, y_sites=2)
+
+    assert [layout.site_position(s) for s in layout.sites] == [(0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (1, 2)]
+
+
+def test_filename():
+    assert FILENAME.match('Phenotype-0000_B03_s2_w1.TIF').group('prefix', 'well', 'site') == \
+        ('Phenotype-0000', 'B03', '2')
+    assert FILENAME.match('plate_AA01.tif')['site'] is None
+    assert FILENAME.match('plate_A01.HTD') is None
+
+
+def test_plan_and_group(descriptor):
+    layout = PlateLayout.from_file(descriptor)
+    files = ['plate_B02_s2.tif', 'plate_A01_s4.tif', 'plate_A01_s1.tif',
+             'plate_A02_s1.tif',  # well not selected
+             'plate_A03_s3.tif',  # site not selected
+             'notes.txt']
+
+    assert layout.plan(files) == {'A01': [(1, 'plate_A01_s1.tif'), (4, 'plate_A01_s4.tif')],
+                                  'B02': [(2, 'plate_B02_s2.tif')]}
+    assert layout.group(files) == [('plate_A01_grid', ['plate_A01_s1.tif', 'plate_A01_s4.tif']),
+                                   ('plate_B02_grid', ['plate_B02_s2.tif'])]
@@ -0,0 +1,81 @@
+import io
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.model.image_grouper import AnimationWriter, ProjectionWriter
+
+
+def frames(channels: int,
+           count: int = 3) -> list:
+    rng = np.random.default_rng(0)
+    shape = (40, 50) if channels == 1 else (40, 50, channels)
+
+    return [rng.integers(0, 256, shape, dtype=np.uint8) for _ in range(count)]
+
+
+@pytest.mark.parametrize('channels', [1, 3, 4])
+def test_gif_accepts_any_channels(channels):
+    buffer = io.BytesIO()
+
+    with AnimationWriter(buffer, framerate=5, gif=True) as writer:
+        for frame in frames(channels):
+            writer.write(frame)
+
+    gif = Image.open(io.BytesIO(buffer.getvalue()))
+
+    assert gif.size == (50, 40)
+    assert gif.n_frames == 3
+
+
+def test_gif_ignores_alpha():
+    bgr = frames(3, count=2)
+    bgra = [np.dstack([f, np.full(f.shape[:2], 7, dtype=np.uint8)]) for f in bgr]
+    outputs = []
+
+    for animation in (bgr, bgra):
+        buffer = io.BytesIO()
+
+        with AnimationWriter(buffer, gif=True) as writer:
+            for frame in animation:
+                writer.write(frame)
+
+        outputs.append(buffer.getvalue())
+
+    assert outputs[0] == outputs[1]
+
+
+def test_mp4_accepts_bgra(tmp_path):
+    with AnimationWriter(str(tmp_path / 'stack'), framerate=5) as writer:
+        for frame in frames(4):
+            writer.write(frame)
+
+    assert (tmp_path / 'stack.mp4').stat().st_size > 0
+
+
+@pytest.mark.parametrize('count', [1, 2, 7])
+def test_projections_match_numpy(tmp_path, count):
+    rng = np.random.default_rng(count)
+    stack = rng.integers(0, 65536, (count, 6, 5), dtype=np.uint16)
+
+    with ProjectionWriter(str(tmp_path / 'stack')) as writer:
+        for frame in stack:
+            writer.write(frame)
+
+    projections = writer.projections
+
+    assert all(img.dtype == np.uint16 for img in projections.values())
+    np.testing.assert_array_equal(projections['max'], np.max(stack, axis=0))
+    # the mean and the standard deviation are rounded to the 16-bit frames
+    np.testing.assert_allclose(projections['mean'], np.mean(stack, axis=0), rtol=0, atol=0.51)
+
+    if count > 1:
+        np.testing.assert_allclose(projections['std'], np.std(stack, axis=0, ddof=1), rtol=0, atol=0.51)
+
+    else:  # undefined over n - 1, a single frame does not vary
+        np.testing.assert_array_equal(projections['std'], np.zeros((6, 5), dtype=np.uint16))
+
+    for kind, img in projections.items():
+        np.testing.assert_array_equal(cv2.imread(str(tmp_path / f"stack_{kind}.png"), cv2.IMREAD_UNCHANGED), img)
@@ -0,0 +1,115 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from src.model.manifest import MANIFEST_NAME, Manifest
+from src.model.setup import fetch_files
+
+
+@pytest.fixture
+def inputs(tmp_path) -> list:
+    paths = []
+
+    for name in ('a.tif', 'b.tif'):
+        path = tmp_path / name
+        path.write_bytes(b'image')
+        paths.append(str(path))
+
+    return paths
+
+
+@pytest.fixture
+def outdir(tmp_path) -> str:
+    path = tmp_path / 'out'
+    path.mkdir()
+    (path / 'grid.png').write_bytes(b'output')
+
+    return str(path)
+
+
+def test_recorded_outputs_are_current_across_runs(inputs, outdir):
+    manifest = Manifest(outdir)
+    signature = Manifest.signature(inputs, {'dims': (2, 2)})
+
+    assert not manifest.is_current('grid.png', signature)
+
+    manifest.record('grid.png', signature)
+    manifest.save()
+
+    # parameters compare as they are loaded back from the file, e.g. tuples as lists
+    assert Manifest(outdir).is_current('grid.png', Manifest.signature(inputs, {'dims': [2, 2]}))
+
+
+@pytest.mark.parametrize('change', ['size', 'mtime', 'params', 'inputs', 'output'])
+def test_changes_make_outputs_stale(inputs, outdir, change):
+    manifest = Manifest(outdir)
+    manifest.record('grid.png', Manifest.signature(inputs, {'dims': [2, 2]}))
+    params = {'dims': [2, 2]}
+
+    if change == 'size':
+        with open(inputs[0], 'ab') as f:
+            f.write(b'!')
+
+    elif change == 'mtime':
+        st = os.stat(inputs[0])
+        os.utime(inputs[0], ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+
+    elif change == 'params':
+        params = {'dims': [3, 3]}
+
+    elif change == 'inputs':
+        inputs = inputs[:1]
+
+    else:
+        os.remove(os.path.join(outdir, 'grid.png'))
+
+    assert not manifest.is_current('grid.png', Manifest.signature(inputs, params))
+
+
+def test_groups_without_output_stay_current(inputs, outdir):
+    manifest = Manifest(outdir)
+    signature = Manifest.signature(inputs, {})
+    manifest.record('missing.png', signature, exported=False)
+
+    assert manifest.is_current('missing.png', signature)
+
+
+def test_unreadable_manifest_rebuilds_everything(outdir):
+    with open(os.path.join(outdir, MANIFEST_NAME), 'w') as f:
+        f.write('{not json')
+
+    assert Manifest(outdir).entries == {}
+
+
+@pytest.fixture
+def plate(tmp_path) -> str:
+    path = tmp_path / 'Phenotype-0000_grid'
+    path.mkdir()
+    (path / 'Phenotype-0000.HTD').write_text('"HTSInfoFile", Version 1.0\n')
+    rng = np.random.default_rng(0)
+
+    for well in ('A01', 'A02', 'A03'):
+        for site in range(1, 5):
+            cv2.imwrite(str(path / f"Phenotype-0000_{well}_s{site}.TIF"), rng.integers(0, 256, (12, 16), dtype=np.uint8))
+
+    return str(path)
+
+
+def test_incremental_runs_skip_current_grids(tmp_path, plate):
+    outpath = str(tmp_path / 'out')
+    os.mkdir(outpath)
+
+    def run(**kwargs):
+        return list(fetch_files(plate, outpath, 2, 2, incremental=True, **kwargs))
+
+    assert run() == [1] * 12  # every file read
+    assert run() == [12]  # every file skipped
+
+    touched = os.path.join(plate, 'Phenotype-0000_A02_s3.TIF')
+    st = os.stat(touched)
+    os.utime(touched, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+
+    assert run() == [1] * 4 + [8]  # A02 read again, the other two wells skipped
+    assert run(scale=2) == [1] * 12  # another scale, every grid made again
@@ -0,0 +1,162 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.model.pipeline import Stage, WriterPool, read_ahead
+
+
+def fail_on(value: int):
+    def func(item):
+        if item == value:
+            raise ValueError(f"item {item}")
+
+        return item * 10
+
+    return func
+
+
+def test_stage_passes_results_downstream_in_order():
+    results = []
+    sink = Stage(results.append)
+    stage = Stage(lambda item: item * 10, downstream=sink)
+
+    for item in range(20):
+        stage.put(item)
+
+    stage.close()
+    sink.close()
+
+    assert results == [item * 10 for item in range(20)]
+    assert not stage.thread.is_alive() and not sink.thread.is_alive()
+
+
+def test_stage_raises_the_error_on_close_and_stops():
+    processed = []
+    stage = Stage(lambda item: processed.append(fail_on(2)(item)))
+
+    for item in range(5):
+        stage.put(item)
+
+    with pytest.raises(ValueError, match='item 2'):
+        stage.close()
+
+    assert processed == [0, 10]  # the items queued behind the failed one are discarded
+    assert not stage.thread.is_alive()
+
+
+def test_stage_raises_the_error_on_put():
+    stage = Stage(fail_on(0), depth=1)
+    stage.put(0)
+
+    while stage.error is None:
+        time.sleep(0.001)
+
+    with pytest.raises(ValueError, match='item 0'):
+        stage.put(1)
+
+    with pytest.raises(ValueError):
+        stage.close()
+
+    assert not stage.thread.is_alive()
+
+
+def test_stage_does_not_block_producers_after_an_error():
+    stage = Stage(fail_on(0), depth=1)
+    stage.q.put(0)
+
+    for item in range(1, 50):  # drained by the thread, so the bounded queue never stays full
+        stage.q.put(item)
+
+    with pytest.raises(ValueError):
+        stage.close()
+
+
+def test_errors_of_a_downstream_stage_surface_when_the_pipeline_is_closed():
+    sink = Stage(fail_on(30))
+    stage = Stage(lambda item: item * 10, downstream=sink)
+
+    for item in range(5):
+        stage.put(item)
+
+    with pytest.raises(ValueError, match='item 30'):  # closed as in setup.pipeline_groups()
+        try:
+            stage.close()
+
+        finally:
+            sink.close()
+
+    assert not stage.thread.is_alive() and not sink.thread.is_alive()
+
+
+def test_writer_pool_processes_every_item():
+    results = []
+    lock = threading.Lock()
+
+    def write(item):
+        time.sleep(0.001)
+
+        with lock:
+            results.append(item)
+
+    pool = WriterPool(write, workers=3)
+
+    for item in range(30):
+        pool.put(item)
+
+    pool.close()
+
+    assert sorted(results) == list(range(30))
+
+
+def test_writer_pool_raises_the_error_on_close():
+    written = []
+    pool = WriterPool(lambda item: written.append(fail_on(3)(item)), workers=1)
+
+    for item in range(6):
+        pool.put(item)
+
+    with pytest.raises(ValueError, match='item 3'):
+        pool.close()
+
+    assert written == [0, 10, 20]  # the items queued behind the failed one are discarded
+
+
+def test_writer_pool_raises_the_error_on_put():
+    pool = WriterPool(fail_on(0), workers=1)
+    pool.put(0)
+
+    while pool.error is None:
+        time.sleep(0.001)
+
+    with pytest.raises(ValueError, match='item 0'):
+        pool.put(1)
+
+    with pytest.raises(ValueError):
+        pool.close()
+
+
+def test_read_ahead_keeps_the_order_and_a_bounded_window():
+    in_flight, peak = [0], [0]
+    lock = threading.Lock()
+
+    def read(path):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+
+        time.sleep(0.002)
+        return path.upper()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = []
+
+        for result in read_ahead(pool, [f"file_{i}" for i in range(20)], read, depth=3):
+            with lock:
+                in_flight[0] -= 1
+
+            results.append(result)
+
+    assert results == [f"FILE_{i}" for i in range(20)]
+    assert peak[0] <= 4
@@ -0,0 +1,72 @@
+import os
+import xml.etree.ElementTree as ET
+
+import cv2
+import numpy as np
+import pytest
+
+from src.model.pyramid import halve, write_pyramid
+
+
+@pytest.fixture
+def img() -> np.ndarray:
+    return np.random.default_rng(0).integers(0, 256, (300, 520, 3), dtype=np.uint8)
+
+
+def tiles(filename: str) -> dict:
+    folder = f"{filename}_files"
+
+    return {int(level): sorted(os.listdir(os.path.join(folder, level))) for level in os.listdir(folder)}
+
+
+def test_halve():
+    img = np.array([[0, 1, 10], [1, 2, 20], [100, 101, 200]], dtype=np.uint8)
+
+    assert np.array_equal(halve(img), [[1, 15], [101, 200]])  # rounded, odd edges repeated
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16, np.float32])
+def test_halve_types(img, dtype):
+    img = img.astype(dtype) * (257 if dtype == np.uint16 else 1)
+    half = halve(img)
+
+    assert half.shape == (150, 260, 3)
+    assert half.dtype == dtype
+    assert np.allclose(half, img.reshape(150, 2, 260, 2, 3).mean(axis=(1, 3)), atol=0.5)
+
+
+def test_pyramid(tmp_path, img):
+    filename = str(tmp_path / 'grid')
+    nbytes = write_pyramid(img, filename, tile_size=256)
+
+    found = tiles(filename)
+    assert sorted(found) == list(range(11))  # 520 -> 260 -> ... -> 1
+    assert found[10] == ['0_0.png', '0_1.png', '1_0.png', '1_1.png', '2_0.png', '2_1.png']
+    assert found[9] == ['0_0.png', '1_0.png']  # 260 x 150
+    assert all(found[level] == ['0_0.png'] for level in range(9))
+    assert nbytes == sum(os.path.getsize(os.path.join(f"{filename}_files", str(level), tile))
+                         for level, names in found.items() for tile in names)
+
+    assert np.array_equal(cv2.imread(os.path.join(f"{filename}_files", '10', '1_1.png')), img[256:, 256:512])
+    assert cv2.imread(os.path.join(f"{filename}_files", '0', '0_0.png')).shape == (1, 1, 3)
+
+
+def test_dzi(tmp_path, img):
+    filename = str(tmp_path / 'grid')
+    write_pyramid(img, filename, tile_size=128, extension='jpg')
+
+    root = ET.parse(f"{filename}.dzi").getroot()
+    ns = '{http://schemas.microsoft.com/deepzoom/2008}'
+
+    assert root.tag == f"{ns}Image"
+    assert (root.get('Format'), root.get('TileSize'), root.get('Overlap')) == ('jpg', '128', '0')
+    assert root.find(f"{ns}Size").attrib == {'Width': '520', 'Height': '300'}
+    assert tiles(filename)[10][-1] == '4_2.jpg'
+
+
+def test_stale_tiles(tmp_path, img):
+    filename = str(tmp_path / 'grid')
+    write_pyramid(img, filename, tile_size=256)
+    write_pyramid(img[:100, :100], filename, tile_size=256)
+
+    assert tiles(filename) == {level: ['0_0.png'] for level in range(8)}
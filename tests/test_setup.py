@@ -0,0 +1,114 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+import src.model.image_grouper as model
+from benchmarks.synthetic import make_plate
+from src.model.setup import exhaust, fetch_dirs, fetch_files, stream_grid
+
+
+def outputs(outpath: str) -> dict:
+    """
+    Contents of the files written into an output path, by their path relative to it.
+    """
+    found = {}
+
+    for root, _, files in os.walk(outpath):
+        for file in files:
+            with open(os.path.join(root, file), 'rb') as f:
+                found[os.path.relpath(os.path.join(root, file), outpath)] = f.read()
+
+    return found
+
+
+@pytest.fixture
+def grid(tmp_path) -> str:
+    return make_plate(str(tmp_path), wells=4, sites=4, size=(24, 16), bit_depth=8)
+
+
+@pytest.fixture
+def stack(tmp_path) -> str:
+    return make_plate(str(tmp_path), mode='stack', wells=3, sites=1, timepoints=4, size=(24, 16), bit_depth=8)
+
+
+def test_grid_jobs_write_the_same_outputs(tmp_path, grid):
+    serial, parallel = str(tmp_path / 'serial'), str(tmp_path / 'parallel')
+
+    assert sum(fetch_files(grid, serial, 2, 2, jobs=1, gutter=2)) == 16
+    assert sum(fetch_files(grid, parallel, 2, 2, jobs=2, gutter=2)) == 16
+
+    assert len(outputs(serial)) == 4
+    assert outputs(parallel) == outputs(serial)
+
+
+def test_stack_jobs_write_the_same_outputs(tmp_path, stack):
+    serial, parallel = str(tmp_path / 'serial'), str(tmp_path / 'parallel')
+
+    assert sum(fetch_dirs(stack, serial, gif=True, jobs=1, projection=('max', 'mean'))) == 12
+    assert sum(fetch_dirs(stack, parallel, gif=True, jobs=2, projection=('max', 'mean'))) == 12
+
+    assert len(outputs(serial)) == 9  # an animation and two projections per well
+    assert outputs(parallel) == outputs(serial)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_grid_worker_errors_surface(tmp_path, grid, jobs):
+    with open(os.path.join(grid, 'Phenotype-0000_A02_s3.TIF'), 'wb') as f:
+        f.write(b'not an image')  # read as None, which the grid cannot be merged with
+
+    with pytest.raises(AttributeError):
+        list(fetch_files(grid, str(tmp_path / 'out'), 2, 2, jobs=jobs))
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_stack_worker_errors_surface(tmp_path, stack, jobs):
+    frame = os.path.join(stack, 'Timepoint_2', sorted(os.listdir(os.path.join(stack, 'Timepoint_2')))[0])
+
+    with open(frame, 'wb') as f:
+        f.write(b'not an image')
+
+    with pytest.raises(AttributeError):
+        list(fetch_dirs(stack, str(tmp_path / 'out'), gif=True, jobs=jobs))
+
+
+def test_pipeline_writes_the_same_outputs(tmp_path, grid):
+    serial, pipelined = str(tmp_path / 'serial'), str(tmp_path / 'pipelined')
+
+    assert sum(fetch_files(grid, serial, 2, 2, jobs=1, gutter=2)) == 16
+    assert sum(fetch_files(grid, pipelined, 2, 2, jobs=1, gutter=2, pipeline=True)) == 16
+
+    assert outputs(pipelined) == outputs(serial)
+
+
+def test_streamed_tiff_keeps_wider_files_of_later_rows(tmp_path):
+    rng = np.random.default_rng(0)
+    shapes = [(10, 12), (8, 20), (14, 30), (6, 9), (5, 7), (12, 25)]  # the widest files are in the later rows
+    paths = []
+
+    for i, shape in enumerate(shapes):
+        paths.append(str(tmp_path / f"{i}.png"))
+        cv2.imwrite(paths[-1], rng.integers(0, 256, shape + (3,), dtype=np.uint8))
+
+    assert exhaust(stream_grid(paths, str(tmp_path / 'grid'), dim_x=2, dim_y=3, gutter=3))
+
+    ig = model.ImageGrouper([cv2.imread(path) for path in paths])
+    ig.grid(size_x=2, size_y=3, gutter=3)
+
+    with Image.open(tmp_path / 'grid.tif') as im:
+        assert np.array_equal(np.asarray(im), ig.merged_image[:, :, ::-1])  # the same layout as a grid in memory
+
+
+def test_streamed_tiff_does_not_crop_files(tmp_path):
+    paths = []
+
+    for i in range(4):
+        paths.append(str(tmp_path / f"{i}.png"))
+        cv2.imwrite(paths[-1], np.zeros((6, 8, 3), dtype=np.uint8))
+
+    wider = lambda path: np.zeros((6, 10, 3), dtype=np.uint8) if path == paths[3] else cv2.imread(path)
+
+    with pytest.raises(ValueError, match='10 pixels wide'):
+        exhaust(stream_grid(paths, str(tmp_path / 'grid'), read=wider))
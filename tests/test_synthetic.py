@@ -0,0 +1,20 @@
+import pytest
+
+from benchmarks.synthetic import htd
+from src.model.htd import PlateLayout, read_htd
+
+
+@pytest.mark.parametrize('sites, selection, expected', [(1, [[True]], [1]),
+                                                         (3, [[True, True], [True, False]], [1, 2, 3])])
+def test_synthetic_htd_is_read_as_written_by_the_instrument(tmp_path, sites, selection, expected):
+    path = tmp_path / 'plate.HTD'
+    path.write_text(htd(wells=5, sites=sites, timepoints=2))
+
+    entries = read_htd(str(path))
+    layout = PlateLayout.from_file(str(path))
+
+    assert entries['Sites'][0] is (sites > 1)  # FALSE for single-site plates, as written by the instrument
+    assert [entries[f"SiteSelection{r + 1}"] for r in range(len(selection))] == selection
+    assert layout.wells == ['A01', 'A02', 'A03', 'A04', 'A05']
+    assert layout.sites == expected
+    assert layout.timepoints == 2
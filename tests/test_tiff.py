@@ -0,0 +1,89 @@
+import struct
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.model.tiff import TiffWriter
+
+
+def write(path,
+          img: np.ndarray,
+          band: int = 7,
+          **kwargs) -> str:
+    channels = img.shape[2] if img.ndim == 3 else 1
+
+    with TiffWriter(str(path), img.shape[1], channels, img.dtype, **kwargs) as writer:
+        for y in range(0, img.shape[0], band):
+            writer.write(img[y:y + band])
+
+    return str(path)
+
+
+def read(path: str) -> np.ndarray:
+    with Image.open(path) as im:
+        return np.array(im)
+
+
+@pytest.fixture
+def img() -> np.ndarray:
+    return np.random.default_rng(0).integers(0, 256, (45, 31, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize('compress', [True, False])
+@pytest.mark.parametrize('strip_size', [2 ** 20, 100])  # a single strip, strips of about a row
+def test_gray(tmp_path, img, compress, strip_size):
+    gray = img[:, :, 0]
+
+    assert np.array_equal(read(write(tmp_path / 'a.tif', gray, compress=compress, strip_size=strip_size)), gray)
+
+
+def test_16_bit(tmp_path, img):
+    gray = img[:, :, 0].astype(np.uint16) * 257
+
+    assert np.array_equal(read(write(tmp_path / 'a.tif', gray)), gray)
+
+
+def test_bgr(tmp_path, img):
+    assert np.array_equal(read(write(tmp_path / 'a.tif', img, strip_size=500)), img[:, :, ::-1])
+
+
+def test_bgra(tmp_path, img):
+    bgra = np.dstack([img, img[:, :, 0]])
+
+    with Image.open(write(tmp_path / 'a.tif', bgra)) as im:
+        assert im.mode == 'RGBA'
+        assert np.array_equal(np.array(im), bgra[:, :, [2, 1, 0, 3]])
+
+
+@pytest.mark.parametrize('bigtiff, version', [(None, 42), (False, 42), (True, 43)])
+def test_bigtiff(tmp_path, img, bigtiff, version):
+    path = write(tmp_path / 'a.tif', img, bigtiff=bigtiff, strip_size=500)
+
+    with open(path, 'rb') as f:
+        assert struct.unpack('<2sH', f.read(4)) == (b'II', version)
+
+    assert np.array_equal(read(path), img[:, :, ::-1])
+
+
+def test_bigtiff_switch(tmp_path, img):
+    # the file is made sparse rather than written out: its directory starts past 4 GiB, after a hole
+    path = str(tmp_path / 'a.tif')
+
+    with TiffWriter(path, img.shape[1], 3, strip_size=img.shape[1] * 3) as writer:
+        writer.write(img)
+        writer.file.seek(2 ** 32)
+
+    with open(path, 'rb') as f:
+        assert struct.unpack('<2sH', f.read(4)) == (b'II', 43)
+
+    assert np.array_equal(read(path), img[:, :, ::-1])
+
+
+def test_invalid_rows(tmp_path, img):
+    with TiffWriter(str(tmp_path / 'a.tif'), img.shape[1], 3) as writer:
+        with pytest.raises(ValueError):
+            writer.write(img[:, :-1])
+
+        with pytest.raises(ValueError):
+            writer.write(img[:, :, 0])
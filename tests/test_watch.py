@@ -0,0 +1,111 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from benchmarks.synthetic import htd
+from src.model.catalog import timepoint
+from src.model.setup import fetch_dirs
+from src.model.watch import Watcher
+
+
+def write_timepoint(plate: str,
+                    t: int,
+                    wells: tuple = ('A01', 'A02')):
+    os.makedirs(os.path.join(plate, f"TimePoint_{t}"), exist_ok=True)
+
+    for well in wells:
+        cv2.imwrite(os.path.join(plate, f"TimePoint_{t}", f"plate_{well}.tif"),
+                    np.full((8, 8), t * 20, dtype=np.uint8))
+
+
+@pytest.fixture
+def plate(tmp_path) -> str:
+    path = str(tmp_path / 'plate')
+    os.mkdir(path)
+
+    with open(os.path.join(path, 'plate.HTD'), 'w') as f:
+        f.write(htd(wells=2, sites=1, timepoints=10))  # A01 and A02
+
+    return path
+
+
+def timepoints(watcher: Watcher,
+               f: str) -> list:
+    return [timepoint(os.path.dirname(p)) for p in watcher.frames[f]]
+
+
+def gif_frames(watcher: Watcher,
+               f: str) -> int:
+    with Image.open(os.path.join(watcher.outdir, f"{f[:-4]}_stack.gif")) as img:
+        return img.n_frames
+
+
+def test_timepoints_in_order(plate, tmp_path):
+    watcher = Watcher(plate, str(tmp_path), gif=True, settle=0)
+
+    assert list(watcher.poll()) == []  # the acquisition did not start yet
+
+    for t in range(1, 4):
+        write_timepoint(plate, t)
+
+    assert list(watcher.poll()) == ['plate_A01_stack.gif', 'plate_A02_stack.gif']
+    assert timepoints(watcher, 'plate_A01.tif') == [1, 2, 3]
+    assert gif_frames(watcher, 'plate_A01.tif') == 3
+    assert list(watcher.poll()) == []  # nothing new
+    assert not watcher.complete
+
+    for t in range(4, 11):
+        write_timepoint(plate, t)
+
+    assert list(watcher.poll()) == ['plate_A01_stack.gif', 'plate_A02_stack.gif']
+    assert timepoints(watcher, 'plate_A02.tif') == list(range(1, 11))
+    assert gif_frames(watcher, 'plate_A02.tif') == 10
+    assert watcher.complete
+
+    assert list(watcher.close()) == ['plate_A01_stack.gif', 'plate_A02_stack.gif']
+
+
+def test_timepoint_folder_written_late(plate, tmp_path):
+    watcher = Watcher(plate, str(tmp_path), gif=True, incremental=True, settle=0)
+
+    for t in list(range(1, 9)) + [10]:
+        write_timepoint(plate, t)
+
+    list(watcher.poll())
+
+    assert timepoints(watcher, 'plate_A01.tif') == [1, 2, 3, 4, 5, 6, 7, 8, 10]
+    assert not watcher.complete
+
+    write_timepoint(plate, 9)
+
+    assert list(watcher.poll()) == ['plate_A01_stack.gif', 'plate_A02_stack.gif']
+    assert timepoints(watcher, 'plate_A01.tif') == [1, 2, 3, 4, 5, 6, 7, 8, 10, 9]  # neither lost nor doubled
+    assert gif_frames(watcher, 'plate_A01.tif') == 10
+    assert watcher.complete
+    assert list(watcher.poll()) == []
+
+    list(watcher.close())
+
+    # the frames are not in the order of the timepoints, so an incremental batch run remakes the animations
+    assert list(fetch_dirs(plate, str(tmp_path), gif=True, framerate=7, incremental=True)) == [1] * 20
+
+
+def test_missing_file(plate, tmp_path):
+    watcher = Watcher(plate, str(tmp_path), gif=True, settle=0)
+    write_timepoint(plate, 1)
+    write_timepoint(plate, 2, wells=('A01',))  # A02 is still being written
+    list(watcher.poll())
+
+    assert timepoints(watcher, 'plate_A02.tif') == [1]
+
+    write_timepoint(plate, 3)  # the next timepoint has it, so it is skipped in TimePoint_2
+    list(watcher.poll())
+
+    assert timepoints(watcher, 'plate_A01.tif') == [1, 2, 3]
+    assert timepoints(watcher, 'plate_A02.tif') == [1, 3]
+
+    write_timepoint(plate, 2)  # written in the end, but already skipped
+    assert list(watcher.poll()) == []